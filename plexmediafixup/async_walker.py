@@ -0,0 +1,397 @@
+"""
+Asyncio based execution engine for the library walk.
+
+The AsyncLibraryWalker class walks the library sections like the
+LibraryWalker class, but drives all requests to the PMS from a single event
+loop: The pages of a section listing are read ahead concurrently, the
+episodes of shows are listed concurrently, and the items are processed
+concurrently, with the number of concurrently outstanding requests being
+limited by a semaphore.
+
+The fixups and the plexapi package are synchronous, so they are adapted to
+the event loop by running each blocking call in a worker thread of an
+executor. This way, the existing fixup plugins work unchanged with this
+engine.
+"""
+
+from __future__ import print_function, absolute_import
+import sys
+import asyncio
+import itertools
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import plexapi
+import plexapi.exceptions
+import requests.exceptions
+from .fixup import LibraryWalker, ITEM_TYPES
+from .utils.library import fetch_section_page, DEFAULT_PAGE_SIZE
+from .utils.thread_output import ThreadOutput
+from .utils.watcher import Watcher
+
+# Number of pages of a section listing that are requested ahead of the page
+# whose items are being processed
+PAGES_AHEAD = 2
+
+# Result of a unit of work that was skipped because the walk was aborted
+_SKIPPED = (0, '', None)
+
+
+class AsyncLibraryWalker(LibraryWalker):
+    """
+    Traversal engine that walks the library sections of a PMS once, using an
+    asyncio event loop to overlap the requests to the PMS.
+
+    The number of jobs specified for the walker is the limit for concurrently
+    outstanding blocking calls. The output printed while processing an item
+    is printed in the order of the items, and no further items are started
+    once an item has failed.
+    """
+
+    def __init__(self, plex, verbose, page_size=DEFAULT_PAGE_SIZE, jobs=1,
+                 **kwargs):
+        """
+        Parameters:
+
+          plex (plexapi.PlexServer): PMS to work against.
+
+          verbose (bool): Verbose flag from command line.
+
+          page_size (int): Number of items that are requested from the PMS
+            per page when listing the items of a library section.
+
+          jobs (int): Maximum number of concurrently outstanding blocking
+            calls (i.e. requests to the PMS).
+
+          **kwargs: Further keyword arguments for LibraryWalker.
+        """
+        super(AsyncLibraryWalker, self).__init__(
+            plex, verbose, page_size=page_size, jobs=jobs, **kwargs)
+        self._loop = None
+        self._executor = None
+        self._semaphore = None
+        self._output = None
+        self._aborted = False
+
+    def walk_section(self, section, fixup_runs, params=None):
+        """
+        Walk one library section and process its items with the specified
+        fixups, using an event loop. See LibraryWalker.walk_section() for
+        the parameters.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+
+        print("Processing {s.type} section {s.title!r} for fixups: {names}".
+              format(s=section,
+                     names=', '.join([fr.name for fr in fixup_runs])))
+        sys.stdout.flush()
+
+        return self._run(self._walk_section, section, fixup_runs, params)
+
+    def process_units(self, units):
+        """
+        Process a list of units of work concurrently, using an event loop.
+        See LibraryWalker.process_units() for the parameters.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        return self._run(self._process_units, units)
+
+    def _run(self, coro_func, *args):
+        """
+        Run a coroutine function on a new event loop and executor, with the
+        output of the worker threads being captured, and return its result.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self._output = ThreadOutput(sys.stdout)
+        self._aborted = False
+        sys.stdout = self._output
+        try:
+            return self._loop.run_until_complete(coro_func(*args))
+        finally:
+            sys.stdout = self._output.stream
+            self._executor.shutdown(wait=True)
+            self._loop.close()
+            self._loop = None
+
+    async def _call(self, func, *args):
+        """
+        Adapter that runs a blocking call in a worker thread, limited by the
+        semaphore.
+        """
+        await self._semaphore.acquire()
+        try:
+            return await self._loop.run_in_executor(self._executor, func,
+                                                    *args)
+        finally:
+            self._semaphore.release()
+
+    async def _walk_section(self, section, fixup_runs, params):
+        """
+        Coroutine that walks the listings of one library section one after
+        the other, see LibraryWalker.section_listings().
+        """
+
+        self._semaphore = asyncio.Semaphore(self.jobs)
+
+        for list_params, list_fixup_runs, ep_fixup_runs in \
+                self.section_listings(section, fixup_runs, params):
+            rc = await self._walk_listing(section, list_fixup_runs,
+                                          ep_fixup_runs, list_params)
+            if rc:
+                return rc
+        return 0
+
+    async def _process_units(self, units):
+        """
+        Coroutine that processes a list of units of work concurrently, with
+        the output in the order of the units.
+        """
+
+        self._semaphore = asyncio.Semaphore(self.jobs)
+
+        unit_futures = collections.deque(
+            [asyncio.ensure_future(self._process_unit(item, fixup_runs))
+             for item, fixup_runs in units])
+        rc = 0
+        try:
+            while unit_futures and not rc:
+                rc = await self._complete(unit_futures.popleft())
+        except BaseException:
+            self._aborted = True
+            await self._discard(unit_futures)
+            raise
+        finally:
+            while unit_futures:
+                _rc = await self._complete(unit_futures.popleft())
+                rc = rc or _rc
+        return rc
+
+    async def _walk_listing(self, section, fixup_runs, ep_fixup_runs,
+                            params):
+        # pylint: disable=too-many-branches
+        """
+        Coroutine that lists the items of one listing of a library section
+        and processes them, including the episodes of show items if fixups
+        for them are specified. The pages of the listing are requested ahead
+        while the items of earlier pages are processed.
+        """
+
+        page_futures = collections.deque()
+        unit_futures = collections.deque()
+        rc = 0
+        try:
+
+            units, total_size = await self._fetch_page(section, 0,
+                                                       fixup_runs, params)
+            if units is None:
+                return 1
+            if total_size is not None:
+                starts = iter(range(self.page_size, total_size,
+                                    self.page_size))
+            elif len(units) == self.page_size:
+                # The PMS did not report the total size, so the pages are
+                # requested until a short page is returned.
+                starts = itertools.count(self.page_size, self.page_size)
+            else:
+                starts = iter(())
+
+            while units:
+
+                while len(page_futures) < PAGES_AHEAD:
+                    start = next(starts, None)
+                    if start is None:
+                        break
+                    page_futures.append(asyncio.ensure_future(
+                        self._fetch_page(section, start, fixup_runs,
+                                         params)))
+
+                for item, item_fixup_runs in units:
+
+                    if item.type not in ITEM_TYPES:
+                        print("Error: Invalid item type {type!r} "
+                              "encountered in section {s.title!r}".
+                              format(type=item.type, s=section))
+                        rc = 1
+                        break
+
+                    if item.type == 'show' and ep_fixup_runs:
+                        unit = self._process_show(item, item_fixup_runs,
+                                                  ep_fixup_runs)
+                    elif item_fixup_runs:
+                        unit = self._process_unit(item, item_fixup_runs)
+                    else:
+                        continue
+                    unit_futures.append(asyncio.ensure_future(unit))
+
+                    if len(unit_futures) >= 2 * self.jobs:
+                        rc = await self._complete(unit_futures.popleft())
+                        if rc:
+                            break
+                if rc:
+                    break
+
+                if not page_futures:
+                    break
+                units, _ = await page_futures.popleft()
+                if units is None:
+                    rc = 1
+                    break
+                if len(units) < self.page_size:
+                    starts = iter(())
+
+        except BaseException:
+            self._aborted = True
+            await self._discard(page_futures)
+            await self._discard(unit_futures)
+            raise
+
+        finally:
+            if rc:
+                self._aborted = True
+            await self._discard(page_futures)
+            while unit_futures:
+                _rc = await self._complete(unit_futures.popleft())
+                rc = rc or _rc
+
+        return rc
+
+    async def _fetch_page(self, section, start, fixup_runs, params):
+        """
+        Coroutine that fetches one page of a section listing, determines the
+        fixups for each of its items, and prefetches the full metadata of its
+        items if any of the fixups needs it.
+
+        Returns:
+
+          tuple(units, total_size): The items of the page with their fixups
+            as a list of tuple(item, fixup_runs), and the total size (see
+            fetch_section_page()). The units are None after an error message
+            has been printed.
+        """
+        try:
+            with Watcher() as w:
+                page, total_size = await self._call(
+                    self.call_rate_limited, fixup_runs, fetch_section_page,
+                    section, start, self.page_size, params)
+        except (plexapi.exceptions.PlexApiException,
+                requests.exceptions.RequestException) as exc:
+            print("Error: Cannot list items in {s.type} section "
+                  "{s.title!r}: {msg} ({w.debug_str})".
+                  format(s=section, msg=exc, w=w))
+            return None, None
+        units = [(item, self.item_fixup_runs(item, fixup_runs))
+                 for item in page]
+        rc = await self._call(
+            self.prefetch_items,
+            [item for item, item_fixup_runs in units if item_fixup_runs],
+            fixup_runs, "{s.type} section {s.title!r}".format(s=section))
+        if rc:
+            return None, None
+        self.look_ahead(units, fixup_runs)
+        return units, total_size
+
+    async def _process_unit(self, item, fixup_runs):
+        """
+        Coroutine that processes one item in a worker thread.
+
+        Returns:
+
+          tuple(rc, text, exc_info): See LibraryWalker._process_captured().
+        """
+        if self._aborted:
+            return _SKIPPED
+        await self._semaphore.acquire()
+        try:
+            if self._aborted:
+                return _SKIPPED
+            return await self._loop.run_in_executor(
+                self._executor, self._process_captured, self._output, item,
+                fixup_runs)
+        finally:
+            self._semaphore.release()
+
+    async def _process_show(self, item, fixup_runs, ep_fixup_runs):
+        """
+        Coroutine that processes one show item (if there are fixups for it),
+        lists its episodes and processes them concurrently.
+
+        Returns:
+
+          tuple(rc, text, exc_info): Combined result of the show item and its
+            episodes, with the output in the order of the items.
+        """
+
+        results = [_SKIPPED]
+        if fixup_runs:
+            results[0] = await self._process_unit(item, fixup_runs)
+        if results[0][0] or results[0][2] or self._aborted:
+            return results[0]
+
+        try:
+            with Watcher() as w:
+                ep_items = await self._call(
+                    self.call_rate_limited, ep_fixup_runs, item.episodes)
+        except (plexapi.exceptions.PlexApiException,
+                requests.exceptions.RequestException) as exc:
+            text = "Error: Cannot list episodes of show {show!r}: " \
+                "{msg} ({w.debug_str})\n". \
+                format(show=item.title, msg=exc, w=w)
+            return 1, results[0][1] + text, None
+
+        ep_units = [(ep_item, self.item_fixup_runs(ep_item, ep_fixup_runs))
+                    for ep_item in ep_items]
+        ep_units = [(ep_item, runs) for ep_item, runs in ep_units if runs]
+        rc = await self._call(
+            self.prefetch_items, [ep_item for ep_item, _ in ep_units],
+            ep_fixup_runs, "show {show!r}".format(show=item.title))
+        if rc:
+            return 1, results[0][1], None
+        self.look_ahead(ep_units, ep_fixup_runs)
+
+        results.extend(await asyncio.gather(
+            *[self._process_unit(ep_item, runs)
+              for ep_item, runs in ep_units]) if ep_units else [])
+
+        rc = 0
+        text = ''
+        for _rc, _text, _exc_info in results:
+            text += _text
+            if _exc_info:
+                return None, text, _exc_info
+            rc = rc or _rc
+        return rc, text, None
+
+    @staticmethod
+    async def _discard(futures):
+        """
+        Coroutine that cancels the futures in a deque and waits for them,
+        ignoring their results and exceptions, and empties the deque.
+
+        The futures are gathered with return_exceptions=True, because a future
+        is not yet cancelled right after cancel() was called, and awaiting it
+        would raise CancelledError and hide an exception that is being raised.
+        """
+        for future in futures:
+            future.cancel()
+        if futures:
+            await asyncio.gather(*futures, return_exceptions=True)
+        futures.clear()
+
+    async def _complete(self, unit):
+        """
+        Coroutine that waits for a unit of work, prints its output and
+        returns its return code. Exceptions raised while processing the unit
+        are re-raised.
+        """
+        rc = self._print_result(self._output, await unit)
+        if rc:
+            self._aborted = True
+        return rc
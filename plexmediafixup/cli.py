@@ -7,14 +7,31 @@ from __future__ import print_function, absolute_import
 
 import sys
 import argparse
+import functools
 import plexapi
 import plexapi.myplex
 import plexapi.exceptions
 import requests.exceptions
 from .utils.smart_formatter import SmartFormatter
 from .utils.config_file import ConfigFile, ConfigFileError
+from .utils.state_file import StateFile, StateFileError
+from .utils.probe_cache import ProbeCache, ProbeCacheError, DEFAULT_MAX_AGE
+from .utils.connection_cache import ConnectionCache, ConnectionCacheError, \
+    DEFAULT_TTL
 from .utils.watcher import Watcher
-from .fixup import FixupManager
+from .utils.cassette import CassetteRecorder, CassettePlayer, CassetteError
+from .utils.http_session import create_session, session_timeout, \
+    retries_disabled, POOL_SIZE_EXTRA, DEFAULT_RETRIES, DEFAULT_BACKOFF_FACTOR
+from .utils.library import DEFAULT_PAGE_SIZE, DEFAULT_PREFETCH_BATCH_SIZE
+from .utils.edit_verifier import VERIFY_MODES, DEFAULT_SAMPLE_PERCENT
+from .fixup import FixupManager, LibraryWalker
+from .async_walker import AsyncLibraryWalker
+from .daemon import FixupDaemon, DEFAULT_DEBOUNCE, DEFAULT_MAX_QUEUE
+from .scheduler import Scheduler, Schedule, DEFAULT_INTERVAL, \
+    TIME_WINDOW_PATTERN
+from .webhook import WebhookListener, DEFAULT_HOST as DEFAULT_WEBHOOK_HOST, \
+    DEFAULT_PORT as DEFAULT_WEBHOOK_PORT, \
+    DEFAULT_EVENTS as DEFAULT_WEBHOOK_EVENTS
 from .version import __version__
 
 
@@ -111,6 +128,402 @@ CONFIG_FILE_SCHEMA = {
                 }
             }
         },
+        "page_size": {
+            "$id": "#/properties/page_size",
+            "type": "integer",
+            "minimum": 1,
+            "default": DEFAULT_PAGE_SIZE,
+            "title": "Number of items that are requested from the Plex Media "
+                     "Server per page when listing the items of a library "
+                     "section. The items of a page are processed as soon as "
+                     "the page has arrived.",
+            "examples": [
+                "200"
+            ],
+        },
+        "prefetch_batch_size": {
+            "$id": "#/properties/prefetch_batch_size",
+            "type": "integer",
+            "minimum": 1,
+            "default": DEFAULT_PREFETCH_BATCH_SIZE,
+            "title": "Number of items whose full metadata is fetched from "
+                     "the Plex Media Server per request, for fixups that "
+                     "need the full metadata of the items.",
+            "examples": [
+                "50"
+            ],
+        },
+        "jobs": {
+            "$id": "#/properties/jobs",
+            "type": "integer",
+            "minimum": 1,
+            "default": 1,
+            "title": "Number of items that are processed concurrently on a "
+                     "pool of worker threads. Can be overridden with the "
+                     "--jobs command line option.",
+            "examples": [
+                "4"
+            ],
+        },
+        "engine": {
+            "$id": "#/properties/engine",
+            "type": "string",
+            "enum": ["threads", "asyncio"],
+            "default": "threads",
+            "title": "Execution engine for the walk through the library "
+                     "sections: 'threads' processes the items on a pool of "
+                     "worker threads; 'asyncio' drives the requests from an "
+                     "asyncio event loop, also overlapping the listing "
+                     "requests. The number of jobs is the concurrency limit "
+                     "for both engines. Can be overridden with the --engine "
+                     "command line option.",
+            "examples": [
+                "threads", "asyncio"
+            ],
+        },
+        "edit_batching": {
+            "$id": "#/properties/edit_batching",
+            "type": "object",
+            "title": "Batching of edits by fixups that support it: Pending "
+                     "edits with identical parameters are sent as a single "
+                     "multi-item edit request to the Plex Media Server.",
+            "default": {},
+            "additionalProperties": False,
+            "properties": {
+                "flush_size": {
+                    "$id": "#/properties/edit_batching/properties/"
+                           "flush_size",
+                    "type": "integer",
+                    "minimum": 1,
+                    "default": 50,
+                    "title": "Maximum number of items per multi-item edit "
+                             "request. 1 means that each edit is sent "
+                             "immediately.",
+                    "examples": [
+                        "50"
+                    ],
+                },
+                "flush_interval": {
+                    "$id": "#/properties/edit_batching/properties/"
+                           "flush_interval",
+                    "type": "number",
+                    "minimum": 0,
+                    "default": 10,
+                    "title": "Maximum time in seconds a pending edit is held "
+                             "back. Pending edits are sent at the latest at "
+                             "the end of each library section.",
+                    "examples": [
+                        "10"
+                    ],
+                },
+            }
+        },
+        "verification": {
+            "$id": "#/properties/verification",
+            "type": "object",
+            "title": "Verification of the edits done by the fixups. The "
+                     "edits are verified in bulk at the end of each library "
+                     "section.",
+            "default": {},
+            "additionalProperties": False,
+            "properties": {
+                "mode": {
+                    "$id": "#/properties/verification/properties/mode",
+                    "type": "string",
+                    "enum": VERIFY_MODES,
+                    "default": "full",
+                    "title": "Verification mode: 'full' verifies all edits, "
+                             "'sampled' verifies a percentage of the edits, "
+                             "'off' does not verify edits.",
+                    "examples": [
+                        "full", "sampled", "off"
+                    ],
+                },
+                "sample_percent": {
+                    "$id": "#/properties/verification/properties/"
+                           "sample_percent",
+                    "type": "number",
+                    "minimum": 0,
+                    "maximum": 100,
+                    "default": DEFAULT_SAMPLE_PERCENT,
+                    "title": "Percentage of edits that are verified in "
+                             "sampled mode.",
+                    "examples": [
+                        "10"
+                    ],
+                },
+            }
+        },
+        "state_file": {
+            "$id": "#/properties/state_file",
+            "type": "string",
+            "default": "plexmediafixup_state.yml",
+            "title": "Path name of the state file that stores the watermark "
+                     "(time of the last change of the processed items) per "
+                     "server, library section and fixup. A relative path "
+                     "name is relative to the directory of this config file.",
+            "examples": [
+                "plexmediafixup_state.yml"
+            ],
+        },
+        "incremental": {
+            "$id": "#/properties/incremental",
+            "type": "boolean",
+            "default": False,
+            "title": "Flag controlling whether only the items that have "
+                     "changed since the last successful run are processed "
+                     "(true) or all items (false). Can be overridden with "
+                     "the --incremental and --full command line options.",
+            "examples": [
+                "true", "false"
+            ],
+        },
+        "http_session": {
+            "$id": "#/properties/http_session",
+            "type": "object",
+            "title": "Settings of the HTTP session used for the connections "
+                     "to the Plex Media Server (and to the Plex account site "
+                     "for indirect connection). The connections are kept "
+                     "alive across requests.",
+            "default": {},
+            "additionalProperties": False,
+            "properties": {
+                "pool_size": {
+                    "$id": "#/properties/http_session/properties/pool_size",
+                    "type": ["null", "integer"],
+                    "minimum": 1,
+                    "default": None,
+                    "title": "Maximum number of connections that are kept "
+                             "alive per host. Specifying null uses the "
+                             "number of jobs plus {n}.".
+                             format(n=POOL_SIZE_EXTRA),
+                    "examples": [
+                        "null", "8"
+                    ],
+                },
+                "compression": {
+                    "$id": "#/properties/http_session/properties/"
+                           "compression",
+                    "type": "boolean",
+                    "default": True,
+                    "title": "Flag controlling whether compressed (gzip) "
+                             "responses are requested.",
+                    "examples": [
+                        "true", "false"
+                    ],
+                },
+                "connect_timeout": {
+                    "$id": "#/properties/http_session/properties/"
+                           "connect_timeout",
+                    "type": ["null", "number"],
+                    "exclusiveMinimum": 0,
+                    "default": None,
+                    "title": "Timeout in seconds for establishing a "
+                             "connection. Specifying null uses the "
+                             "plexapi.timeout parameter of the PlexAPI "
+                             "config file.",
+                    "examples": [
+                        "null", "5"
+                    ],
+                },
+                "read_timeout": {
+                    "$id": "#/properties/http_session/properties/"
+                           "read_timeout",
+                    "type": ["null", "number"],
+                    "exclusiveMinimum": 0,
+                    "default": None,
+                    "title": "Timeout in seconds for waiting for data of a "
+                             "response. Specifying null uses the "
+                             "plexapi.timeout parameter of the PlexAPI "
+                             "config file.",
+                    "examples": [
+                        "null", "60"
+                    ],
+                },
+                "retries": {
+                    "$id": "#/properties/http_session/properties/retries",
+                    "type": "integer",
+                    "minimum": 0,
+                    "default": DEFAULT_RETRIES,
+                    "title": "Maximum number of times an idempotent request "
+                             "that failed with a transient error (connection "
+                             "error, timeout, HTTP status 429 or 5xx) is "
+                             "retried. 0 disables retries.",
+                    "examples": [
+                        "3", "0"
+                    ],
+                },
+                "backoff_factor": {
+                    "$id": "#/properties/http_session/properties/"
+                           "backoff_factor",
+                    "type": "number",
+                    "minimum": 0,
+                    "default": DEFAULT_BACKOFF_FACTOR,
+                    "title": "Backoff factor for the retries: The n-th "
+                             "retry waits for backoff_factor * 2 ** (n - 1) "
+                             "seconds, unless the server specified a "
+                             "Retry-After time.",
+                    "examples": [
+                        "0.5"
+                    ],
+                },
+            }
+        },
+        "connection_cache": {
+            "$id": "#/properties/connection_cache",
+            "type": "object",
+            "title": "Cache of the resolution of the indirect connection to "
+                     "the Plex Media Server: The authentication token of the "
+                     "Plex account and the last working connection URI of "
+                     "the server are cached, and later runs try that URI "
+                     "first. Ignored for direct connection.",
+            "default": {},
+            "additionalProperties": False,
+            "properties": {
+                "file": {
+                    "$id": "#/properties/connection_cache/properties/file",
+                    "type": ["null", "string"],
+                    "default": "plexmediafixup_connection_cache.yml",
+                    "title": "Path name of the cache file. A relative path "
+                             "name is relative to the directory of this "
+                             "config file. Specifying null disables the "
+                             "cache.",
+                    "examples": [
+                        "plexmediafixup_connection_cache.yml", "null"
+                    ],
+                },
+                "ttl": {
+                    "$id": "#/properties/connection_cache/properties/ttl",
+                    "type": "number",
+                    "minimum": 0,
+                    "default": DEFAULT_TTL,
+                    "title": "Number of hours after which the connection is "
+                             "resolved again through the Plex account.",
+                    "examples": [
+                        "24"
+                    ],
+                },
+            }
+        },
+        "daemon": {
+            "$id": "#/properties/daemon",
+            "type": "object",
+            "title": "Settings of the daemon mode (--daemon and --webhook "
+                     "command line options), in which the items that are "
+                     "added or changed on the Plex Media Server are "
+                     "processed as the server notifies about them.",
+            "default": {},
+            "additionalProperties": False,
+            "properties": {
+                "debounce": {
+                    "$id": "#/properties/daemon/properties/debounce",
+                    "type": "number",
+                    "minimum": 0,
+                    "default": DEFAULT_DEBOUNCE,
+                    "title": "Number of seconds an item is held back after "
+                             "the last notification about it, so that a "
+                             "burst of notifications results in processing "
+                             "the item once.",
+                    "examples": [
+                        "10"
+                    ],
+                },
+                "max_queue": {
+                    "$id": "#/properties/daemon/properties/max_queue",
+                    "type": "integer",
+                    "minimum": 1,
+                    "default": DEFAULT_MAX_QUEUE,
+                    "title": "Maximum number of items waiting to be "
+                             "processed. If more items are changed, the "
+                             "library sections are walked in incremental "
+                             "mode instead.",
+                    "examples": [
+                        "10000"
+                    ],
+                },
+            }
+        },
+        "webhook": {
+            "$id": "#/properties/webhook",
+            "type": "object",
+            "title": "Settings of the webhook receiver of the daemon mode "
+                     "with the --webhook command line option. The webhook "
+                     "URL to be configured in the Plex Media Server is "
+                     "http://HOST:PORT/.",
+            "default": {},
+            "additionalProperties": False,
+            "properties": {
+                "host": {
+                    "$id": "#/properties/webhook/properties/host",
+                    "type": "string",
+                    "default": DEFAULT_WEBHOOK_HOST,
+                    "title": "Host name or IP address the webhook receiver "
+                             "listens on. Specifying 0.0.0.0 listens on all "
+                             "network interfaces.",
+                    "examples": [
+                        "127.0.0.1", "0.0.0.0"
+                    ],
+                },
+                "port": {
+                    "$id": "#/properties/webhook/properties/port",
+                    "type": "integer",
+                    "minimum": 1,
+                    "maximum": 65535,
+                    "default": DEFAULT_WEBHOOK_PORT,
+                    "title": "Port the webhook receiver listens on.",
+                    "examples": [
+                        str(DEFAULT_WEBHOOK_PORT)
+                    ],
+                },
+                "events": {
+                    "$id": "#/properties/webhook/properties/events",
+                    "type": "array",
+                    "items": {
+                        "type": "string",
+                    },
+                    "default": DEFAULT_WEBHOOK_EVENTS,
+                    "title": "Webhook events whose items are processed.",
+                    "examples": [
+                        DEFAULT_WEBHOOK_EVENTS
+                    ],
+                },
+            }
+        },
+        "probe_cache": {
+            "$id": "#/properties/probe_cache",
+            "type": "object",
+            "title": "Persistent cache of the title tags of media files, for "
+                     "fixups that probe media files (sync_title). A media "
+                     "file is not probed again as long as its size and "
+                     "modification time are unchanged.",
+            "default": {},
+            "additionalProperties": False,
+            "properties": {
+                "file": {
+                    "$id": "#/properties/probe_cache/properties/file",
+                    "type": ["null", "string"],
+                    "default": "plexmediafixup_probe_cache.sqlite",
+                    "title": "Path name of the SQLite cache file. A relative "
+                             "path name is relative to the directory of this "
+                             "config file. Specifying null disables the "
+                             "cache.",
+                    "examples": [
+                        "plexmediafixup_probe_cache.sqlite", "null"
+                    ],
+                },
+                "max_age": {
+                    "$id": "#/properties/probe_cache/properties/max_age",
+                    "type": "integer",
+                    "minimum": 1,
+                    "default": DEFAULT_MAX_AGE,
+                    "title": "Number of days after which a cache entry that "
+                             "has not been used is evicted.",
+                    "examples": [
+                        "30"
+                    ],
+                },
+            }
+        },
         "video_genre_cleanup": {
             "$id": "#/properties/video_genre_cleanup",
             "type": "array",
@@ -201,6 +614,50 @@ CONFIG_FILE_SCHEMA = {
                         "title": "Keyword arguments for passing on to the "
                                  "fixup",
                     },
+                    "requests_per_second": {
+                        "$id": "#/properties/fixups/items/"
+                               "properties/requests_per_second",
+                        "type": ["null", "number"],
+                        "exclusiveMinimum": 0,
+                        "default": None,
+                        "title": "Maximum rate of the requests to the Plex "
+                                 "Media Server while items are processed "
+                                 "by the fixup, across all jobs. The "
+                                 "requests for listing and fetching the "
+                                 "items are limited by the lowest rate of "
+                                 "the fixups that are run together. "
+                                 "Specifying null means no limit.",
+                        "examples": [
+                            "null", "10"
+                        ],
+                    },
+                    "interval": {
+                        "$id": "#/properties/fixups/items/"
+                               "properties/interval",
+                        "type": "number",
+                        "exclusiveMinimum": 0,
+                        "default": DEFAULT_INTERVAL,
+                        "title": "Interval in hours between the runs of the "
+                                 "fixup in scheduler mode (--schedule "
+                                 "command line option).",
+                        "examples": [
+                            "1", "168"
+                        ],
+                    },
+                    "time_window": {
+                        "$id": "#/properties/fixups/items/"
+                               "properties/time_window",
+                        "type": ["null", "string"],
+                        "pattern": TIME_WINDOW_PATTERN,
+                        "default": None,
+                        "title": "Time window in local time in which the "
+                                 "fixup is run in scheduler mode, in the "
+                                 "format 'HH:MM-HH:MM'. The window may span "
+                                 "midnight. Specifying null means any time.",
+                        "examples": [
+                            "null", "01:00-05:00"
+                        ],
+                    },
                 }
             }
         }
@@ -208,6 +665,52 @@ CONFIG_FILE_SCHEMA = {
 }
 
 
+def connect_cached(cached, server_name, session, timeout):
+    """
+    Connect to the PMS using a cached connection URI and access token.
+
+    Parameters:
+
+      cached (dict): The cached connection, see ConnectionCache.get().
+
+      server_name (string): Name of the server, for verifying that the
+        cached connection URI still leads to that server.
+
+      session (requests.Session): The session for the connection.
+
+      timeout (tuple): The timeout for the requests of the session.
+
+    Returns:
+
+      plexapi.PlexServer: The connected PMS, or None if the connection
+        failed (a message has been printed).
+    """
+    uri = cached['server_uri']
+    print("Connecting to server {srv} at cached connection URI {uri}".
+          format(srv=server_name, uri=uri))
+    try:
+        with Watcher() as w:
+            # The cached connection URI is tried without retrying (unlike the
+            # further requests of the session), so that falling back to the
+            # Plex account is fast if the URI no longer works.
+            with retries_disabled(session):
+                plex = plexapi.server.PlexServer(
+                    uri, cached['server_token'], session=session,
+                    timeout=timeout)
+    except (plexapi.exceptions.PlexApiException,
+            requests.exceptions.RequestException) as exc:
+        print("Cannot connect to server {srv} at cached connection URI "
+              "{uri}: {msg} ({w.debug_str})".
+              format(srv=server_name, uri=uri, msg=exc, w=w))
+        return None
+    if plex.friendlyName != server_name:
+        print("Cached connection URI {uri} leads to server {name} instead of "
+              "server {srv}".
+              format(uri=uri, name=plex.friendlyName, srv=server_name))
+        return None
+    return plex
+
+
 def parse_args():
     """
     Parse command line arguments for this script and return the result of
@@ -244,6 +747,69 @@ def parse_args():
         '-n', '--dryrun', dest='dryrun',
         action='store_true', default=False,
         help='Run fixups in dryrun mode (Print what would be done)')
+    general_arggroup.add_argument(
+        '-j', '--jobs', dest='jobs', metavar='N',
+        action='store', type=int, default=None,
+        help='Process N items concurrently. Default: jobs parameter in config '
+        'file, or 1')
+    general_arggroup.add_argument(
+        '--engine', dest='engine', metavar='ENGINE',
+        action='store', choices=['threads', 'asyncio'], default=None,
+        help='Execution engine for the walk through the library sections: '
+        'threads, asyncio. Default: engine parameter in config file, or '
+        'threads')
+    scan_arggroup = general_arggroup.add_mutually_exclusive_group()
+    scan_arggroup.add_argument(
+        '--incremental', dest='incremental',
+        action='store_true', default=None,
+        help='Process only the items that have changed since the last '
+        'successful run. Default: incremental parameter in config file, or '
+        'full scan')
+    scan_arggroup.add_argument(
+        '--full', dest='incremental',
+        action='store_false', default=None,
+        help='Process all items, even if the incremental parameter in the '
+        'config file is true')
+    daemon_arggroup = general_arggroup.add_mutually_exclusive_group()
+    daemon_arggroup.add_argument(
+        '--daemon', dest='daemon',
+        action='store_const', const='notifications', default=None,
+        help='After processing the library sections, keep running and '
+        'process the items that are added or changed on the Plex Media '
+        'Server, based on its notifications. Stop with Ctrl-C')
+    daemon_arggroup.add_argument(
+        '--webhook', dest='daemon',
+        action='store_const', const='webhook', default=None,
+        help='Like --daemon, but receive the webhooks of the Plex Media '
+        'Server on a local HTTP server instead of its notifications')
+    daemon_arggroup.add_argument(
+        '--schedule', dest='daemon',
+        action='store_const', const='schedule', default=None,
+        help='Keep running and run each fixup at the interval and in the '
+        'time window configured for it in the config file. Stop with Ctrl-C')
+    cassette_arggroup = general_arggroup.add_mutually_exclusive_group()
+    cassette_arggroup.add_argument(
+        '--record-cassette', dest='record_cassette', metavar='FILE',
+        action='store', default=None,
+        help='Record the HTTP exchanges with the Plex Media Server in cassette '
+        'file FILE. Access tokens in request URLs are not recorded, but the '
+        'responses are recorded as received')
+    cassette_arggroup.add_argument(
+        '--replay-cassette', dest='replay_cassette', metavar='FILE',
+        action='store', default=None,
+        help='Do not send any requests to the Plex Media Server, but answer '
+        'them with the responses recorded in cassette file FILE. Requests '
+        'that have not been recorded fail')
+    general_arggroup.add_argument(
+        '--replay-latency', dest='replay_latency',
+        action='store_true', default=False,
+        help='With --replay-cassette, delay each response by its recorded '
+        'elapsed time')
+    general_arggroup.add_argument(
+        '--rebuild-probe-cache', dest='rebuild_probe_cache',
+        action='store_true', default=False,
+        help='Discard all entries of the probe cache, so that all media files '
+        'are probed again')
     general_arggroup.add_argument(
         '--version', dest='version',
         action='store_true', default=False,
@@ -293,14 +859,94 @@ def main():
     direct_connection = config.data['direct_connection']  # required item
     server_name = config.data['server_name']  # optional but defaulted item
     fixups = config.data['fixups']  # optional but defaulted item
+    page_size = config.data['page_size']  # optional but defaulted item
+    prefetch_batch_size = config.data['prefetch_batch_size']  # opt. defaulted
+    jobs = config.data['jobs']  # optional but defaulted item
+    if args.jobs is not None:
+        jobs = args.jobs
+    if jobs < 1:
+        print("Error: Invalid number of jobs specified: {jobs}".
+              format(jobs=jobs))
+        return 1
+    engine = config.data['engine']  # optional but defaulted item
+    edit_batching = config.data['edit_batching']  # optional but defaulted
+    verification = config.data['verification']  # optional but defaulted
+    if args.engine is not None:
+        engine = args.engine
+    incremental = config.data['incremental']  # optional but defaulted item
+    if args.incremental is not None:
+        incremental = args.incremental
+    state_file = config.abspath(config.data['state_file'])  # opt. defaulted
+    probe_cache = config.data['probe_cache']  # optional but defaulted item
+    http_session = config.data['http_session']  # optional but defaulted item
+    connection_cache = config.data['connection_cache']  # opt. defaulted item
+    daemon = config.data['daemon']  # optional but defaulted item
+    webhook = config.data['webhook']  # optional but defaulted item
     fixup_mgr = FixupManager()
 
+    if args.replay_cassette and args.daemon:
+        print("Error: Option --replay-cassette cannot be used with "
+              "option --daemon, --webhook or --schedule")
+        return 1
+
+    if args.replay_latency and not args.replay_cassette:
+        print("Error: Option --replay-latency can only be used with "
+              "option --replay-cassette")
+        return 1
+
+    if args.rebuild_probe_cache and probe_cache['file']:
+        probe_cache_file = config.abspath(probe_cache['file'])
+        print("Rebuilding probe cache: {file}".format(file=probe_cache_file))
+        cache = ProbeCache(probe_cache_file)
+        try:
+            cache.open()
+            cache.clear()
+            cache.close()
+        except ProbeCacheError as exc:
+            print("Error: {}".format(exc))
+            return 1
+
+    print("Using state file: {file}".format(file=state_file))
+    state = StateFile(state_file)
+    try:
+        state.load()
+    except StateFileError as exc:
+        print("Error: {}".format(exc))
+        return 1
+
     if not plexapi_config_path:
         plexapi_config_path = plexapi.CONFIG_PATH
     print("Using PlexAPI config file: {file}".
           format(file=plexapi_config_path))
     plexapi_config = plexapi.config.PlexConfig(plexapi_config_path)
 
+    # All requests to the PMS go through a single session, whose connection
+    # pool allows for the concurrent requests of the worker threads.
+    pool_size = http_session['pool_size']
+    if pool_size is None:
+        pool_size = jobs + POOL_SIZE_EXTRA
+    recorder = None
+    player = None
+    try:
+        if args.record_cassette:
+            print("Recording cassette file: {file}".
+                  format(file=args.record_cassette))
+            recorder = CassetteRecorder(args.record_cassette)
+        if args.replay_cassette:
+            print("Replaying cassette file: {file}".
+                  format(file=args.replay_cassette))
+            player = CassettePlayer(args.replay_cassette)
+    except CassetteError as exc:
+        print("Error: {}".format(exc))
+        return 1
+    session = create_session(pool_size, http_session['compression'],
+                             http_session['retries'],
+                             http_session['backoff_factor'],
+                             recorder, player, args.replay_latency)
+    timeout = session_timeout(
+        http_session['connect_timeout'], http_session['read_timeout'],
+        plexapi_config.get('plexapi.timeout', plexapi.TIMEOUT, int))
+
     # Verify that the fixups can be loaded
     for fixup in fixups:
         name = fixup['name']  # required item
@@ -333,10 +979,12 @@ def main():
         try:
             with Watcher() as w:
                 # If the PMS is not reachable on the network, this raises
-                # requests.exceptions.ConnectionError (using max_retries=0 and
-                # the connect and read timeout configured in the plexapi config
-                # file as plexapi.timeout).
-                plex = plexapi.server.PlexServer()
+                # requests.exceptions.ConnectionError once the retries of the
+                # session are exhausted (see create_session()), each attempt
+                # using the connect and read timeout of the session.
+                plex = plexapi.server.PlexServer(
+                    server_baseurl, server_token, session=session,
+                    timeout=timeout)
         except (plexapi.exceptions.PlexApiException,
                 requests.exceptions.RequestException) as exc:
             print("Error: Cannot connect to Plex server at {url}: {msg} "
@@ -372,50 +1020,151 @@ def main():
                   format(file=config.filepath))
             return 1
 
-        print("Connecting indirectly to server {srv} of Plex account {user}".
-              format(srv=server_name, user=myplex_username))
+        conn_cache = None
+        cached = None
+        # With a cassette, the connection cache is not used, because the
+        # cached connection is probed outside of the session, and a replayed
+        # run must send the same requests as the recorded run.
+        if connection_cache['file'] and not (recorder or player):
+            conn_cache = ConnectionCache(
+                config.abspath(connection_cache['file']),
+                connection_cache['ttl'])
+            try:
+                conn_cache.load()
+            except ConnectionCacheError as exc:
+                print("Error: {}".format(exc))
+                return 1
+            cached = conn_cache.get(myplex_username, server_name)
 
-        try:
-            with Watcher() as w:
-                account = plexapi.myplex.MyPlexAccount(
-                    myplex_username, myplex_password)
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot login to Plex account {user}: {msg} "
-                  "({w.debug_str})".
-                  format(user=myplex_username, msg=exc, w=w))
-            return 1
+        plex = None
+        if cached:
+            plex = connect_cached(cached, server_name, session, timeout)
 
-        try:
-            with Watcher() as w:
-                plex = account.resource(server_name).connect()
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot connect to server {srv} of Plex account "
-                  "{user}: {msg} ({w.debug_str})".
-                  format(srv=server_name, user=myplex_username, msg=exc, w=w))
-            return 1
+        if plex is None:
+
+            print("Connecting indirectly to server {srv} of Plex account "
+                  "{user}".
+                  format(srv=server_name, user=myplex_username))
+
+            account = None
+            if cached:
+                # The cached URI did not work, but the cached account token
+                # saves logging in with the password.
+                try:
+                    with Watcher() as w:
+                        account = plexapi.myplex.MyPlexAccount(
+                            token=cached['account_token'], session=session,
+                            timeout=timeout)
+                except (plexapi.exceptions.PlexApiException,
+                        requests.exceptions.RequestException):
+                    account = None
+
+            if account is None:
+                try:
+                    with Watcher() as w:
+                        account = plexapi.myplex.MyPlexAccount(
+                            myplex_username, myplex_password,
+                            session=session, timeout=timeout)
+                except (plexapi.exceptions.PlexApiException,
+                        requests.exceptions.RequestException) as exc:
+                    print("Error: Cannot login to Plex account {user}: {msg} "
+                          "({w.debug_str})".
+                          format(user=myplex_username, msg=exc, w=w))
+                    return 1
+
+            try:
+                with Watcher() as w:
+                    plex = account.resource(server_name).connect(
+                        timeout=timeout)
+            except (plexapi.exceptions.PlexApiException,
+                    requests.exceptions.RequestException) as exc:
+                print("Error: Cannot connect to server {srv} of Plex account "
+                      "{user}: {msg} ({w.debug_str})".
+                      format(srv=server_name, user=myplex_username, msg=exc,
+                             w=w))
+                return 1
 
-        print("Connected indirectly to server {srv} of Plex account {user}".
-              format(srv=server_name, user=myplex_username))
+            if conn_cache:
+                # pylint: disable=protected-access
+                conn_cache.set(myplex_username, server_name,
+                               account.authenticationToken, plex._baseurl,
+                               plex._token)
+                try:
+                    conn_cache.save()
+                except ConnectionCacheError as exc:
+                    print("Error: {}".format(exc))
+                    return 1
 
+        print("Connected indirectly to server {srv} of Plex account {user} "
+              "at {url}".
+              format(srv=server_name, user=myplex_username,
+                     url=plex._baseurl))  # pylint: disable=protected-access
+
+    # All enabled fixups are executed in a single walk through the library
+    # sections, so that the items are listed only once per run.
+    dryrun = args.dryrun
+    if engine == 'asyncio':
+        walker_class = AsyncLibraryWalker
+    else:
+        walker_class = LibraryWalker
+    walker = walker_class(
+        plex, verbose=args.verbose, page_size=page_size, jobs=jobs,
+        edit_flush_size=edit_batching['flush_size'],
+        edit_flush_interval=edit_batching['flush_interval'],
+        verify_mode=verification['mode'],
+        verify_sample_percent=verification['sample_percent'],
+        prefetch_batch_size=prefetch_batch_size,
+        state=state, incremental=incremental)
+    names = []
+    schedules = []
     for fixup in fixups:
         name = fixup['name']  # required item
         enabled = fixup['enabled']  # required item
-        dryrun = args.dryrun
         fixup_kwargs = fixup.get('kwargs', dict())
+        requests_per_second = fixup.get('requests_per_second', None)
+        interval = fixup.get('interval', DEFAULT_INTERVAL)
+        time_window = fixup.get('time_window', None)
         if enabled:
             fixup = fixup_mgr.get_fixup(name)
-            print("Executing fixup: {name} (dryrun={dryrun})".
+            print("Preparing fixup: {name} (dryrun={dryrun})".
                   format(name=name, dryrun=dryrun))
-            rc = fixup.run(plex=plex, dryrun=dryrun, verbose=args.verbose,
-                           config=config, fixup_kwargs=fixup_kwargs)
-            if rc:
+            fixup_run = walker.add_fixup(fixup, dryrun, config, fixup_kwargs,
+                                         requests_per_second)
+            if fixup_run is None:
                 print("Error: Fixup {name} has encountered errors - aborting".
                       format(name=name))
                 return 1
-            print("Fixup succeeded: {name} (dryrun={dryrun})".
-                  format(name=name, dryrun=dryrun))
+            names.append(name)
+            schedules.append(Schedule(fixup_run, interval, time_window))
+
+    print("Executing fixups: {names} (dryrun={dryrun}, incremental={inc})".
+          format(names=', '.join(names), dryrun=dryrun, inc=incremental))
+    if args.daemon == 'schedule':
+        rc = Scheduler(walker, schedules).run()
+    elif args.daemon:
+        if args.daemon == 'webhook':
+            listener_factory = functools.partial(
+                WebhookListener, host=webhook['host'], port=webhook['port'],
+                events=webhook['events'])
+        else:
+            listener_factory = None
+        rc = FixupDaemon(walker, daemon['debounce'], daemon['max_queue'],
+                         listener_factory).run()
+    else:
+        rc = walker.walk()
+    if recorder:
+        recorder.close()
+        print("Recorded {n} requests in cassette file {file}".
+              format(n=recorder.count, file=recorder.filepath))
+    if player:
+        print("Replayed {n} requests from cassette file {file} "
+              "({r} recorded)".
+              format(n=player.count, file=player.filepath,
+                     r=player.recorded))
+    if rc:
+        return 1
+    print("Fixups succeeded: {names} (dryrun={dryrun})".
+          format(names=', '.join(names), dryrun=dryrun))
 
     return 0
 
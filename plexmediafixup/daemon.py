@@ -0,0 +1,378 @@
+"""
+Daemon mode that keeps the items of the Plex Media Server fixed up in near
+real time.
+
+The FixupDaemon class walks the library sections once, and listens for
+notifications about added or changed items, by default on the websocket
+notification stream of the PMS (see also the webhook module). The items are
+put on a debounced queue, and after the initial walk the fixups are run
+against just those items. Notifications about the edits of the fixups
+themselves are ignored. If the queue overflows or the listener stops, the
+library sections are walked again in incremental mode, so that no changes are
+missed.
+
+Each batch of items and each walk is a separate run of the fixups, i.e. the
+fixups are prepared and finished for each of them (see LibraryWalker.walk()).
+"""
+
+from __future__ import print_function, absolute_import
+import re
+import sys
+import time
+import threading
+import collections
+import plexapi.alert
+from .utils.signals import sigterm_interrupts
+
+# Default number of seconds an item is held back after its last notification,
+# so that a burst of notifications for the same item (e.g. while it is being
+# scanned and matched) results in processing it once
+DEFAULT_DEBOUNCE = 10
+
+# Default maximum number of items in the queue. If more items are changed
+# before they can be processed (e.g. during a scan of a new library), the
+# library sections are walked again instead.
+DEFAULT_MAX_QUEUE = 10000
+
+# Number of seconds between checks of the notification listener while no
+# items are due
+POLL_INTERVAL = 1
+
+# Initial and maximum number of seconds to wait before reconnecting to the
+# notification stream
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 300
+
+# Identifier of the timeline entries of library items
+LIBRARY_IDENTIFIER = 'com.plexapp.plugins.library'
+
+# Plex search types of the library items that are processed
+ALERT_ITEM_TYPES = {1: 'movie', 2: 'show', 4: 'episode'}
+
+# State of a timeline entry for an item whose processing (e.g. after it was
+# added or its metadata was changed) has completed
+TIMELINE_STATE_PROCESSED = 5
+
+# Pattern for the key of the item of an activity
+ITEM_KEY_PATTERN = re.compile(r'^/library/metadata/(\d+)$')
+
+
+def alert_rating_keys(data):
+    """
+    Return the rating keys of the library items that have been added or
+    changed according to a notification of the PMS.
+
+    Parameters:
+
+      data (dict): The notification, i.e. the content of its
+        NotificationContainer element.
+
+    Returns:
+
+      list of string: The rating keys.
+    """
+    rating_keys = []
+    if data.get('type') == 'timeline':
+        for entry in data.get('TimelineEntry', []):
+            if entry.get('identifier') == LIBRARY_IDENTIFIER and \
+                    entry.get('type') in ALERT_ITEM_TYPES and \
+                    entry.get('state') == TIMELINE_STATE_PROCESSED and \
+                    entry.get('itemID'):
+                rating_keys.append(str(entry['itemID']))
+    elif data.get('type') == 'activity':
+        for entry in data.get('ActivityNotification', []):
+            if entry.get('event') != 'ended':
+                continue
+            context = entry.get('Activity', {}).get('Context', {})
+            m = ITEM_KEY_PATTERN.match(context.get('key', ''))
+            if m:
+                rating_keys.append(m.group(1))
+    return rating_keys
+
+
+class ListenerError(Exception):
+    """
+    A listener for notifications could not be started.
+    """
+    pass
+
+
+class _AlertListener(plexapi.alert.AlertListener):
+    """
+    Listener for the websocket notification stream of the PMS.
+    """
+
+    description = "notifications of the Plex Media Server"
+
+
+def alert_listener(plex, callback):
+    """
+    Factory for the listener for the websocket notification stream of the
+    PMS.
+
+    A listener is a thread that calls the callback function with the rating
+    keys of the items that have been added or changed. In addition, it has a
+    'description' attribute, and a stop() method.
+
+    Parameters:
+
+      plex (plexapi.PlexServer): PMS whose notifications are received.
+
+      callback (callable): Callback function, called with a list of rating
+        keys.
+
+    Returns:
+
+      threading.Thread: The listener, not yet started.
+
+    Raises:
+      ListenerError: The listener cannot be created.
+    """
+    try:
+        import websocket  # noqa: F401 pylint: disable=unused-import
+    except ImportError:
+        raise ListenerError("Listening for notifications of the Plex Media "
+                            "Server requires the websocket-client package")
+    return _AlertListener(plex, lambda data: callback(alert_rating_keys(data)))
+
+
+class DebounceQueue(object):
+    """
+    A bounded queue of item keys, in which a key becomes due only after it has
+    not been put for the debounce time. Putting a key that is already in the
+    queue postpones it.
+
+    If a key is put while the queue is full, the key is dropped and the queue
+    is marked as overflowed, so that the consumer can recover by other means.
+
+    The queue can be used from multiple threads.
+    """
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE, max_size=DEFAULT_MAX_QUEUE):
+        """
+        Parameters:
+
+          debounce (int or float): Debounce time in seconds.
+
+          max_size (int): Maximum number of keys in the queue.
+        """
+        self.debounce = debounce
+        self.max_size = max_size
+        self._cond = threading.Condition()
+        self._due = collections.OrderedDict()  # Due times by key, in order
+        self.overflowed = False
+
+    def __len__(self):
+        with self._cond:
+            return len(self._due)
+
+    def put(self, key):
+        """
+        Put a key into the queue, or postpone it if it is already in the
+        queue.
+        """
+        with self._cond:
+            if key in self._due:
+                del self._due[key]
+            elif len(self._due) >= self.max_size:
+                self.overflowed = True
+                self._cond.notify()
+                return
+            self._due[key] = time.monotonic() + self.debounce
+            self._cond.notify()
+
+    def get(self, max_keys, timeout):
+        """
+        Wait until keys are due, and remove and return them.
+
+        Parameters:
+
+          max_keys (int): Maximum number of keys that are returned.
+
+          timeout (int or float): Maximum time in seconds to wait.
+
+        Returns:
+
+          list: The due keys, in the order they became due. The list is empty
+            if no keys became due within the timeout, or the queue has
+            overflowed.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self.overflowed:
+                now = time.monotonic()
+                if self._due:
+                    first_due = next(iter(self._due.values()))
+                    if first_due <= now:
+                        keys = []
+                        for key, due in self._due.items():
+                            if due > now or len(keys) >= max_keys:
+                                break
+                            keys.append(key)
+                        for key in keys:
+                            del self._due[key]
+                        return keys
+                    wait_until = min(first_due, deadline)
+                else:
+                    wait_until = deadline
+                if wait_until <= now:
+                    break
+                self._cond.wait(wait_until - now)
+            return []
+
+    def clear(self):
+        """
+        Remove all keys from the queue and reset its overflow mark.
+        """
+        with self._cond:
+            self._due.clear()
+            self.overflowed = False
+
+
+class FixupDaemon(object):
+    """
+    Daemon that runs the fixups of a library walker against the items that
+    are added or changed on the PMS, based on its notifications.
+    """
+
+    def __init__(self, walker, debounce=DEFAULT_DEBOUNCE,
+                 max_queue=DEFAULT_MAX_QUEUE, listener_factory=None):
+        """
+        Parameters:
+
+          walker (LibraryWalker): The library walker, with the fixups added.
+
+          debounce (int or float): Number of seconds an item is held back
+            after its last notification.
+
+          max_queue (int): Maximum number of items waiting to be processed.
+
+          listener_factory (callable): Factory for the listener that receives
+            the notifications, see alert_listener(). None means
+            alert_listener.
+        """
+        self.walker = walker
+        self.queue = DebounceQueue(debounce, max_queue)
+        self._listener_factory = listener_factory or alert_listener
+        self._listener = None
+        self._reconnect_delay = RECONNECT_DELAY
+
+    def run(self):
+        """
+        Run the daemon until it is interrupted (e.g. with Ctrl-C or SIGTERM):
+        Walk the library sections once, and then process the items that are
+        added or changed, including those changed during the initial walk.
+        Errors while processing items are reported, and the daemon continues
+        with the next items.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        try:
+            with sigterm_interrupts():
+                try:
+                    # The listener is started before the initial walk, so
+                    # that the items changed during the walk are queued.
+                    try:
+                        self._start_listener()
+                    except ListenerError as exc:
+                        print("Error: {}".format(exc))
+                        return 1
+                    try:
+                        rc = self.walker.walk()
+                        if rc:
+                            return rc
+                        print("Listening for {what} (press Ctrl-C to stop)".
+                              format(what=self._listener.description))
+                        sys.stdout.flush()
+                        self._serve()
+                    finally:
+                        self._stop_listener()
+                except KeyboardInterrupt:
+                    print("Stopping daemon")
+            return 0
+        finally:
+            self.walker.cleanup_fixups()
+
+    def _serve(self):
+        """
+        Process the items from the queue, forever.
+        """
+        while True:
+
+            catch_up = False
+            if not self._listener.is_alive():
+                print("Stopped listening for {what}; restarting in {d} s".
+                      format(what=self._listener.description,
+                             d=self._reconnect_delay))
+                sys.stdout.flush()
+                time.sleep(self._reconnect_delay)
+                self._reconnect_delay = min(self._reconnect_delay * 2,
+                                            MAX_RECONNECT_DELAY)
+                try:
+                    self._start_listener()
+                except ListenerError as exc:
+                    print("Error: {}".format(exc))
+                    continue
+                catch_up = True
+            if self.queue.overflowed:
+                print("More than {n} items changed; walking the library "
+                      "sections instead".
+                      format(n=self.queue.max_size))
+                catch_up = True
+
+            if catch_up:
+                # The changes that were missed are picked up by walking the
+                # library sections in incremental mode.
+                self.queue.clear()
+                rc = self.walker.walk(incremental=True)
+                if rc:
+                    print("Error: Walking the library sections failed; "
+                          "continuing with further notifications")
+                sys.stdout.flush()
+                continue
+
+            rating_keys = self.queue.get(self.walker.prefetch_batch_size,
+                                         POLL_INTERVAL)
+            if rating_keys:
+                rc = self.walker.walk(rating_keys=rating_keys)
+                if rc:
+                    print("Error: Processing of changed items failed; "
+                          "continuing with further notifications")
+                sys.stdout.flush()
+
+    def _on_rating_keys(self, rating_keys):
+        """
+        Callback for the rating keys of the items that have been added or
+        changed, called in the thread of the listener.
+
+        The items that have just been edited by the fixups are skipped, since
+        their notifications are caused by the daemon itself.
+        """
+        self._reconnect_delay = RECONNECT_DELAY
+        for rating_key in rating_keys:
+            if not self.walker.recently_edited(rating_key):
+                self.queue.put(rating_key)
+
+    def _start_listener(self):
+        """
+        Start a new listener.
+
+        Raises:
+          ListenerError: The listener could not be started.
+        """
+        self._listener = self._listener_factory(self.walker.plex,
+                                                self._on_rating_keys)
+        self._listener.start()
+
+    def _stop_listener(self):
+        """
+        Stop the notification listener, if it is still running.
+        """
+        if self._listener is not None and self._listener.is_alive():
+            try:
+                self._listener.stop()
+            except Exception:  # pylint: disable=broad-except
+                pass
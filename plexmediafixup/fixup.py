@@ -3,10 +3,42 @@ Fixup support.
 
 Fixups are plugins that can be dynamically loaded and perform some function
 on the Plex Media Server.
+
+The library sections of the Plex Media Server are walked only once per run,
+by a LibraryWalker object. Each item found in the walk is passed on to all
+enabled fixups that are interested in that item.
 """
 
+from __future__ import print_function, absolute_import
+import re
+import sys
+import time
 import importlib
 import inspect
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import six
+import plexapi
+import plexapi.exceptions
+import requests.exceptions
+from .utils.watcher import Watcher
+from .utils.library import iter_section_pages, prefetch_full_items, \
+    fetch_full_items, server_time, \
+    item_changed_at, DEFAULT_PAGE_SIZE, DEFAULT_PREFETCH_BATCH_SIZE, \
+    EPISODE_TYPE
+from .utils.state_file import StateFileError
+from .utils.thread_output import ThreadOutput
+from .utils.rate_limiter import RateLimiter, rate_limited
+from .utils.edit_batcher import EditBatcher, DEFAULT_FLUSH_SIZE, \
+    DEFAULT_FLUSH_INTERVAL
+from .utils.edit_verifier import EditVerifier, VERIFY_FULL, \
+    DEFAULT_SAMPLE_PERCENT
+
+# Library section types that can be processed by fixups
+SECTION_TYPES = ['movie', 'show']
+
+# Item types that can be processed by fixups
+ITEM_TYPES = ['movie', 'show', 'episode']
 
 
 class FixupManager(object):
@@ -59,11 +91,37 @@ class FixupManager(object):
 
 
 class Fixup(object):
-    # pylint: disable=too-few-public-methods
     """
     Base class for fixup classes in fixup modules.
+
+    A fixup class declares the library section types and item types it can
+    process, and implements the per-item hook process_item(). The library
+    sections are walked by a LibraryWalker object, which calls the hooks of
+    all fixups that are interested in an item.
     """
 
+    # Library section types that can be processed by the fixup. Must be a
+    # subset of SECTION_TYPES.
+    valid_section_types = ['movie', 'show']
+
+    # Item types that are passed to process_item(). Valid values are 'movie',
+    # 'show' and 'episode'. For 'show', the show items of show sections are
+    # passed. For 'episode', the episode items of the shows in show sections
+    # are passed.
+    item_types = ['movie', 'show']
+
+    # Boolean indicating whether the fixup needs show context for the episode
+    # items passed to process_item(), i.e. needs them to be passed right
+    # after their show item. If False, the episodes of show sections are
+    # listed section-wide, independently of their shows, which saves a
+    # request per show.
+    show_context = False
+
+    # Boolean indicating whether the fixup needs the full metadata of the
+    # items passed to process_item() (e.g. all of their genres). If True, the
+    # full metadata is prefetched for multiple items per request.
+    full_items = False
+
     def __init__(self, name):
         """
         Init function, must be called by fixup subclass.
@@ -74,9 +132,121 @@ class Fixup(object):
         """
         self.name = name
 
+    def prepare(self, fixup_run):
+        # pylint: disable=unused-argument,no-self-use
+        """
+        Prepare the fixup for a run of the library walk, before any items are
+        processed. May be implemented in fixup subclass.
+
+        Fixup-specific parameters derived from the fixup_kwargs config
+        parameter should be stored in fixup_run.params.
+
+        The fixup may be run repeatedly (e.g. by a daemon). Each run is
+        prepared, finished and cleaned up separately, so any state of the
+        fixup (e.g. caches) is valid for the duration of one run.
+
+        Parameters:
+
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        return 0
+
+    def process_item(self, fixup_run, item):
+        """
+        Process one item of the library walk. Must be implemented in fixup
+        subclass.
+
+        Parameters:
+
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+
+          item (plexapi.video.Video): The movie, show or episode item, with
+            its type being one of the item types of the fixup.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        raise NotImplementedError
+
+    def look_ahead(self, fixup_run, items):
+        # pylint: disable=unused-argument,no-self-use
+        """
+        Announce items that will be passed to process_item() soon, so that
+        the fixup can start slow work for them in the background (e.g.
+        probing their media files) while earlier items are processed. May be
+        implemented in fixup subclass.
+
+        Parameters:
+
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+
+          items (list of plexapi.video.Video): The upcoming items, with their
+            types being item types of the fixup.
+        """
+        pass
+
+    def finish_section(self, fixup_run, section):
+        # pylint: disable=unused-argument,no-self-use
+        """
+        Finish the processing of one library section, after all of its items
+        have been passed to process_item() successfully and before the edits
+        of the fixup in that section are sent and verified. This allows the
+        fixup to process items it has deferred (e.g. items with slow media
+        files). May be implemented in fixup subclass.
+
+        Parameters:
+
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+
+          section (plexapi.library.LibrarySection): The library section.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        return 0
+
+    def finish(self, fixup_run):
+        # pylint: disable=unused-argument,no-self-use
+        """
+        Finish the fixup after all items have been processed successfully.
+        May be implemented in fixup subclass.
+
+        Parameters:
+
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        return 0
+
+    def cleanup(self, fixup_run):
+        # pylint: disable=unused-argument,no-self-use
+        """
+        Release the resources of the fixup at the end of the library walk,
+        whether it succeeded or not. May be implemented in fixup subclass.
+
+        Parameters:
+
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+        """
+        pass
+
     def run(self, plex, dryrun, verbose, config, fixup_kwargs):
         """
-        Funxtion to execute the fixup. Must be implemented in fixup subclass.
+        Execute this fixup on its own, by walking the library sections of the
+        PMS just for this fixup.
 
         Parameters:
 
@@ -86,8 +256,1039 @@ class Fixup(object):
 
           verbose (bool): Verbose flag from command line.
 
-          config (dict): The entire config file.
+          config (ConfigFile): The config file.
 
           fixup_kwargs (dict): The kwargs config parameter for the fixup.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
         """
-        raise NotImplementedError
+        walker = LibraryWalker(plex, verbose)
+        fixup_run = walker.add_fixup(self, dryrun, config, fixup_kwargs)
+        if fixup_run is None:
+            return 1
+        return walker.walk()
+
+
+class FixupRun(object):
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    A fixup together with its parameters, for one run of the library walk.
+
+    The same fixup may be specified more than once in the config file, so
+    any state of a fixup that depends on its parameters is kept in this
+    object and not in the fixup object.
+    """
+
+    def __init__(self, fixup, plex, dryrun, verbose, config, fixup_kwargs):
+        """
+        Parameters:
+
+          fixup (Fixup): The fixup.
+
+          plex (plexapi.PlexServer): PMS to work against.
+
+          dryrun (bool): Dryrun flag from command line.
+
+          verbose (bool): Verbose flag from command line.
+
+          config (ConfigFile): The config file.
+
+          fixup_kwargs (dict): The kwargs config parameter for the fixup,
+            with the following items that are handled for all fixups:
+
+            section_types (string or iterable(string)):
+              The library section types that should be processed. Must be
+              valid section types for the fixup. A value of None (null in
+              config file) means to process all valid section types of the
+              fixup. Optional, default is None.
+
+            section_pattern (string):
+              Regex pattern defining library section names that should be
+              processed within the configured section types. A value of None
+              (null in config file) means to process all library sections of
+              the configured types. Optional, default is None.
+        """
+        self.fixup = fixup
+        self.name = fixup.name
+        self.plex = plex
+        self.dryrun = dryrun
+        self.verbose = verbose
+        self.config = config
+        self.fixup_kwargs = fixup_kwargs
+        self.section_types = None  # Set in setup()
+        self.section_pattern = None  # Set in setup()
+        self.params = dict()  # Fixup-specific parameters, set in prepare()
+        self.prepared = False  # Indicates that the fixup has been prepared
+        self.edit_batcher = None  # EditBatcher for the fixup, set by walker
+        self.edit_verifier = None  # EditVerifier for the fixup, set by walker
+        self.state_key = fixup.name  # Key in the state file, set by walker
+        self.since = None  # Watermark for the current section, set by walker
+        self.rate_limiter = None  # RateLimiter for the fixup, set by walker
+
+    def setup(self):
+        """
+        Set up the parameters that are handled for all fixups, and prepare
+        the fixup for a run.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        section_types = self.fixup_kwargs.get('section_types', None)
+        if section_types is None:
+            section_types = list(self.fixup.valid_section_types)
+        elif isinstance(section_types, six.string_types):
+            section_types = [section_types]
+        for st in section_types:
+            if st not in self.fixup.valid_section_types:
+                print("Error: Invalid section type specified for fixup "
+                      "{fixup}: {type}".
+                      format(fixup=self.name, type=st))
+                return 1
+        self.section_types = section_types
+        self.section_pattern = self.fixup_kwargs.get('section_pattern', None)
+        self.params = dict()
+        rc = self.fixup.prepare(self)
+        self.prepared = rc == 0
+        return rc
+
+    def wants_section(self, section):
+        """
+        Return a boolean indicating whether the fixup processes the specified
+        library section.
+        """
+        if section.type not in self.section_types:
+            return False
+        if self.section_pattern is not None and \
+                re.search(self.section_pattern, section.title) is None:
+            if self.verbose:
+                print("Skipping {s.type} section {s.title!r} for fixup "
+                      "{name} that does not match the specified pattern".
+                      format(s=section, name=self.name))
+                sys.stdout.flush()
+            return False
+        return True
+
+    def wants_item_type(self, item_type):
+        """
+        Return a boolean indicating whether the fixup processes items of the
+        specified item type.
+        """
+        return item_type in self.fixup.item_types
+
+
+class LibraryWalker(object):
+    """
+    Traversal engine that walks the library sections of a PMS once and passes
+    each item on to all fixups that are interested in it.
+
+    Within an item, the fixups are called in the order in which they have
+    been added. Processing is aborted on the first fixup that returns an
+    error.
+
+    If more than one job is specified, the items are processed on a bounded
+    pool of worker threads. The output printed while processing an item is
+    captured and printed in the order of the items, and no further items are
+    started once an item has failed.
+    """
+
+    def __init__(self, plex, verbose, page_size=DEFAULT_PAGE_SIZE, jobs=1,
+                 edit_flush_size=DEFAULT_FLUSH_SIZE,
+                 edit_flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 verify_mode=VERIFY_FULL,
+                 verify_sample_percent=DEFAULT_SAMPLE_PERCENT,
+                 prefetch_batch_size=DEFAULT_PREFETCH_BATCH_SIZE,
+                 state=None, incremental=False):
+        """
+        Parameters:
+
+          plex (plexapi.PlexServer): PMS to work against.
+
+          verbose (bool): Verbose flag from command line.
+
+          page_size (int): Number of items that are requested from the PMS
+            per page when listing the items of a library section.
+
+          jobs (int): Number of items that are processed concurrently.
+
+          edit_flush_size (int): Maximum number of items per multi-item edit
+            request of a fixup. 1 means that each edit is sent immediately.
+
+          edit_flush_interval (float): Maximum time in seconds a pending
+            edit of a fixup is held back. Pending edits are sent at the latest
+            at the end of each library section.
+
+          verify_mode (string): Verification mode for the edits of the
+            fixups, see EditVerifier. The edits are verified in bulk at the
+            end of each library section.
+
+          verify_sample_percent (int): Percentage of edits that are verified
+            in sampled verification mode.
+
+          prefetch_batch_size (int): Number of items whose full metadata is
+            prefetched per request, for fixups that need full items.
+
+          state (StateFile): State file with the watermarks of the fixups,
+            i.e. the time of the last change of the items that have been
+            processed. The watermarks are updated and the state file is saved
+            after each library section that has been processed successfully
+            by fixups not in dryrun mode. None means not to maintain
+            watermarks.
+
+          incremental (bool): Process only the items that have changed since
+            the watermark of each fixup. Requires a state file.
+        """
+        self.plex = plex
+        self.verbose = verbose
+        self.page_size = page_size
+        self.jobs = jobs
+        self.edit_flush_size = edit_flush_size
+        self.edit_flush_interval = edit_flush_interval
+        self.verify_mode = verify_mode
+        self.verify_sample_percent = verify_sample_percent
+        self.prefetch_batch_size = prefetch_batch_size
+        self.state = state
+        self.incremental = incremental
+        self.fixup_runs = []
+        self._high_water = None  # Latest change of the items of the section
+        self._listing_start = None  # Server time when the listing started
+
+    def add_fixup(self, fixup, dryrun, config, fixup_kwargs,
+                  requests_per_second=None):
+        """
+        Add a fixup to the walk and prepare it.
+
+        Parameters:
+
+          fixup (Fixup): The fixup.
+
+          dryrun (bool): Dryrun flag from command line.
+
+          config (ConfigFile): The config file.
+
+          fixup_kwargs (dict): The kwargs config parameter for the fixup.
+
+          requests_per_second (int or float): Maximum rate of the requests to
+            the PMS while items are processed by the fixup. The requests for
+            listing and fetching the items of a walk are limited by the
+            strictest limit of the fixups of the walk (see
+            strictest_rate_limiter()). None means no limit.
+
+        Returns:
+
+          FixupRun: The fixup with its parameters for this run, or None if
+            the fixup could not be prepared (an error message has been
+            printed).
+        """
+        fixup_run = FixupRun(fixup, self.plex, dryrun, self.verbose, config,
+                             fixup_kwargs)
+        fixup_run.edit_verifier = EditVerifier(
+            self.plex, self.verify_mode, self.verify_sample_percent)
+        fixup_run.edit_batcher = EditBatcher(
+            self.plex, self.edit_flush_size, self.edit_flush_interval,
+            fixup_run.edit_verifier)
+        if requests_per_second is not None:
+            fixup_run.rate_limiter = RateLimiter(requests_per_second)
+        # The same fixup may be specified more than once, so its further
+        # occurrences get their own watermarks.
+        count = len([fr for fr in self.fixup_runs if fr.name == fixup.name])
+        if count:
+            fixup_run.state_key = '{name}#{n}'.format(name=fixup.name,
+                                                      n=count + 1)
+        rc = fixup_run.setup()
+        if rc:
+            return None
+        self.fixup_runs.append(fixup_run)
+        return fixup_run
+
+    def walk(self, incremental=None, fixup_runs=None, rating_keys=None):
+        """
+        Run the fixups once: Walk the library sections once, process the
+        items with the fixups and finish the fixups. The fixups are cleaned
+        up in any case.
+
+        This may be done repeatedly (e.g. by a daemon). The fixups are
+        prepared when they are added to the walker, and are prepared again
+        for each further run, so that their state (e.g. caches) does not
+        outlive a run.
+
+        Parameters:
+
+          incremental (bool): Overrides the incremental mode of the walker for
+            this run. None means to use the incremental mode of the walker.
+
+          fixup_runs (list of FixupRun): The fixups for this run, as a subset
+            of the fixups of the walker. None means all fixups of the walker.
+
+          rating_keys (iterable): If not None, just the items with these
+            rating keys are processed by all fixups of the walker, instead of
+            walking the library sections (see walk_items()).
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        fixup_runs = fixup_runs or self.fixup_runs
+        try:
+            rc = self.prepare_fixups(fixup_runs)
+            if rc:
+                return rc
+            if rating_keys is not None:
+                rc = self.walk_items(rating_keys)
+            else:
+                rc = self.walk_library(incremental, fixup_runs)
+            if rc:
+                return rc
+            return self.finish_fixups(fixup_runs)
+        finally:
+            self.cleanup_fixups(fixup_runs)
+
+    def walk_library(self, incremental=None, fixup_runs=None):
+        """
+        Walk the library sections once and process the items with the
+        prepared fixups, without finishing the fixups.
+
+        Parameters:
+
+          incremental (bool): Overrides the incremental mode of the walker for
+            this walk. None means to use the incremental mode of the walker.
+
+          fixup_runs (list of FixupRun): The fixups for this walk, as a subset
+            of the fixups of the walker. None means all fixups of the walker.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        saved_incremental = self.incremental
+        if incremental is not None:
+            self.incremental = incremental
+        try:
+            return self._walk_library(fixup_runs or self.fixup_runs)
+        finally:
+            self.incremental = saved_incremental
+
+    def _walk_library(self, walk_fixup_runs):
+        """
+        Walk the library sections once and process the items with the
+        specified fixups.
+        """
+
+        try:
+            with Watcher() as w:
+                with rate_limited(
+                        self.strictest_rate_limiter(walk_fixup_runs)):
+                    sections = self.plex.library.sections()
+        except (plexapi.exceptions.PlexApiException,
+                requests.exceptions.RequestException) as exc:
+            print("Error: Cannot list sections: {msg} ({w.debug_str})".
+                  format(msg=exc, w=w))
+            return 1
+
+        for section in sections:
+
+            if section.type not in SECTION_TYPES:
+                continue
+            fixup_runs = [fr for fr in walk_fixup_runs
+                          if fr.wants_section(section)]
+            if not fixup_runs:
+                continue
+
+            self._listing_start = None
+            if self.state is not None:
+                try:
+                    with Watcher() as w:
+                        with rate_limited(
+                                self.strictest_rate_limiter(fixup_runs)):
+                            self._listing_start = server_time(self.plex)
+                except requests.exceptions.RequestException as exc:
+                    print("Error: Cannot get the time of the Plex Media "
+                          "Server: {msg} ({w.debug_str})".
+                          format(msg=exc, w=w))
+                    return 1
+
+            params = self.begin_section(section, fixup_runs)
+            rc = self.walk_section(section, fixup_runs, params)
+            if rc:
+                return rc
+
+            rc = self.finish_section(section, fixup_runs)
+            if rc:
+                return rc
+
+        return 0
+
+    def walk_items(self, rating_keys):
+        """
+        Process specific items with the prepared fixups (e.g. items that have
+        just been added or changed), instead of walking the library sections,
+        without finishing the fixups.
+
+        The full metadata of the items is fetched for multiple items per
+        request, and the items are processed per library section, with the
+        fixups for the section and item type. Items that no longer exist are
+        ignored. The watermarks of the fixups are not changed.
+
+        Parameters:
+
+          rating_keys (iterable): The rating keys of the items.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+
+        try:
+            with Watcher() as w:
+                with rate_limited(
+                        self.strictest_rate_limiter(self.fixup_runs)):
+                    items = fetch_full_items(self.plex, rating_keys,
+                                             self.prefetch_batch_size)
+                    sections = dict([(str(s.key), s)
+                                     for s in self.plex.library.sections()])
+        except (plexapi.exceptions.PlexApiException,
+                requests.exceptions.RequestException) as exc:
+            print("Error: Cannot fetch items: {msg} ({w.debug_str})".
+                  format(msg=exc, w=w))
+            return 1
+
+        section_items = collections.OrderedDict()
+        for item in items:
+            section = sections.get(str(item.librarySectionID))
+            if section is None or section.type not in SECTION_TYPES:
+                continue
+            section_items.setdefault(section.key, (section, []))[1]. \
+                append(item)
+
+        for section, items in section_items.values():
+
+            fixup_runs = [fr for fr in self.fixup_runs
+                          if fr.wants_section(section)]
+            units = []
+            for item in items:
+                item_fixup_runs = [fr for fr in fixup_runs
+                                   if fr.wants_item_type(item.type)]
+                if item_fixup_runs:
+                    units.append((item, item_fixup_runs))
+            if not units:
+                continue
+
+            print("Processing {n} changed items in {s.type} section "
+                  "{s.title!r} for fixups: {names}".
+                  format(n=len(units), s=section,
+                         names=', '.join([fr.name for fr in fixup_runs])))
+            sys.stdout.flush()
+
+            self._high_water = None
+            for fixup_run in fixup_runs:
+                fixup_run.since = None
+            self.look_ahead(units, fixup_runs)
+            rc = self.process_units(units)
+            if rc:
+                return rc
+
+            rc = self.finish_section(section, fixup_runs)
+            if rc:
+                return rc
+
+        return 0
+
+    def process_units(self, units):
+        """
+        Process a list of units of work, with the number of jobs of the
+        walker.
+
+        Parameters:
+
+          units (list of tuple(item, fixup_runs)): The units of work.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        if self.jobs > 1:
+            return self.process_work_parallel(iter(units))
+        for unit in units:
+            rc = self.process_item(*unit)
+            if rc:
+                return rc
+        return 0
+
+    def prepare_fixups(self, fixup_runs=None):
+        """
+        Prepare the fixups for a run, unless they are still prepared.
+
+        Parameters:
+
+          fixup_runs (list of FixupRun): The fixups. None means all fixups of
+            the walker.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        for fixup_run in fixup_runs or self.fixup_runs:
+            if not fixup_run.prepared:
+                rc = fixup_run.setup()
+                if rc:
+                    return self._failed(fixup_run)
+        return 0
+
+    def finish_fixups(self, fixup_runs=None):
+        """
+        Finish the fixups after the walk of a run has succeeded.
+
+        Parameters:
+
+          fixup_runs (list of FixupRun): The fixups. None means all fixups of
+            the walker.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        for fixup_run in fixup_runs or self.fixup_runs:
+            rc = fixup_run.fixup.finish(fixup_run)
+            if rc:
+                return self._failed(fixup_run)
+        return 0
+
+    def cleanup_fixups(self, fixup_runs=None):
+        """
+        Clean up the prepared fixups at the end of a run, whether it
+        succeeded or not.
+
+        Parameters:
+
+          fixup_runs (list of FixupRun): The fixups. None means all fixups of
+            the walker.
+        """
+        for fixup_run in fixup_runs or self.fixup_runs:
+            if fixup_run.prepared:
+                fixup_run.prepared = False
+                fixup_run.fixup.cleanup(fixup_run)
+
+    def recently_edited(self, rating_key):
+        """
+        Return whether an edit of an item has recently been sent by any of the
+        fixups (see EditBatcher.recently_edited()).
+
+        Parameters:
+
+          rating_key (string or int): Rating key of the item.
+
+        Returns:
+
+          bool: The item has been edited recently.
+        """
+        return any(fixup_run.edit_batcher.recently_edited(rating_key)
+                   for fixup_run in self.fixup_runs
+                   if fixup_run.edit_batcher is not None)
+
+    @staticmethod
+    def strictest_rate_limiter(fixup_runs):
+        """
+        Return the rate limiter with the lowest rate of the specified fixups,
+        for the requests that are made on behalf of all of them (e.g. listing
+        the items of a library section), or None if none of the fixups is
+        rate limited.
+        """
+        limiters = [fr.rate_limiter for fr in fixup_runs
+                    if fr.rate_limiter is not None]
+        if not limiters:
+            return None
+        return min(limiters, key=lambda limiter: limiter.rate)
+
+    def call_rate_limited(self, fixup_runs, func, *args):
+        """
+        Call a function whose requests are made on behalf of the specified
+        fixups, rate limited by their strictest rate limiter, and return its
+        result.
+        """
+        with rate_limited(self.strictest_rate_limiter(fixup_runs)):
+            return func(*args)
+
+    @staticmethod
+    def section_id(section):
+        """
+        Return the identifier of a library section in the state file.
+        """
+        return section.uuid or str(section.key)
+
+    def begin_section(self, section, fixup_runs):
+        """
+        Begin the processing of one library section by the specified fixups:
+        Set their watermarks for the section, and return the additional
+        query parameters for listing the items of the section.
+
+        In incremental mode, the items are listed with a server-side filter
+        on the earliest watermark of the fixups, unless a fixup has no
+        watermark yet or the episodes are listed per show (their shows are
+        not necessarily changed).
+
+        Returns:
+
+          dict: Additional query parameters for the listing requests, or None.
+        """
+        self._high_water = None
+        for fixup_run in fixup_runs:
+            fixup_run.since = None
+            if self.incremental:
+                fixup_run.since = self.state.get_watermark(
+                    self.plex.machineIdentifier, self.section_id(section),
+                    fixup_run.state_key)
+        watermarks = [fr.since for fr in fixup_runs]
+        if None in watermarks:
+            return None
+        if section.type == 'show' and self.episodes_by_show(fixup_runs):
+            return None
+        since = min(watermarks)
+        if self.verbose:
+            print("Listing items changed since {time} in {s.type} section "
+                  "{s.title!r}".
+                  format(time=time.strftime('%Y-%m-%d %H:%M:%S',
+                                            time.localtime(since)),
+                         s=section))
+            sys.stdout.flush()
+        # The '>>=' operator of the PMS means 'after'. Items changed in the
+        # same second as the watermark are included.
+        return {'updatedAt>>': since - 1}
+
+    @staticmethod
+    def episodes_by_show(fixup_runs):
+        """
+        Return a boolean indicating whether the episodes in show sections
+        need to be listed per show for the specified fixups, because a fixup
+        that processes episodes needs show context.
+        """
+        return any([fr.fixup.show_context for fr in fixup_runs
+                    if fr.wants_item_type('episode')])
+
+    def section_listings(self, section, fixup_runs, params=None):
+        """
+        Return the listings of items for walking one library section with
+        the specified fixups.
+
+        In show sections, the show items and the episode items are listed
+        separately, each page by page for the whole section, unless the
+        episodes need to be listed per show (see episodes_by_show()). In that
+        case, the episodes of each show item are listed after the show item.
+
+        Parameters:
+
+          section (plexapi.library.LibrarySection): The library section.
+
+          fixup_runs (list of FixupRun): The fixups for the section.
+
+          params (dict): Additional query parameters for listing the items of
+            the section, see begin_section().
+
+        Returns:
+
+          list of tuple(params, fixup_runs, ep_fixup_runs): The listings, each
+            with its query parameters, the fixups for its items, and the
+            fixups for the episodes of its show items (empty if the episodes
+            are not listed per show).
+        """
+        ep_fixup_runs = [fr for fr in fixup_runs
+                         if fr.wants_item_type('episode')]
+        if section.type != 'show' or not ep_fixup_runs:
+            return [(params, fixup_runs, [])]
+        if self.episodes_by_show(fixup_runs):
+            return [(params, fixup_runs, ep_fixup_runs)]
+        listings = []
+        show_fixup_runs = [fr for fr in fixup_runs
+                           if fr.wants_item_type('show')]
+        if show_fixup_runs:
+            listings.append((params, show_fixup_runs, []))
+        ep_params = dict(params or {})
+        ep_params['type'] = EPISODE_TYPE
+        listings.append((ep_params, ep_fixup_runs, []))
+        return listings
+
+    def item_fixup_runs(self, item, fixup_runs):
+        """
+        Return those of the specified fixups for which an item has changed
+        since their watermark, and account for the item in the watermark of
+        the section.
+        """
+        changed_at = item_changed_at(item)
+        if changed_at is None:
+            return fixup_runs
+        if self._high_water is None or changed_at > self._high_water:
+            self._high_water = changed_at
+        return [fr for fr in fixup_runs
+                if fr.since is None or changed_at >= fr.since]
+
+    @staticmethod
+    def look_ahead(units, fixup_runs):
+        """
+        Announce upcoming units of work to the specified fixups, see
+        Fixup.look_ahead().
+
+        Parameters:
+
+          units (list of tuple(item, fixup_runs)): The upcoming units of work.
+
+          fixup_runs (list of FixupRun): The fixups for the units.
+        """
+        for fixup_run in fixup_runs:
+            items = [item for item, item_fixup_runs in units
+                     if fixup_run in item_fixup_runs and
+                     fixup_run.wants_item_type(item.type)]
+            if items:
+                fixup_run.fixup.look_ahead(fixup_run, items)
+
+    def walk_section(self, section, fixup_runs, params=None):
+        """
+        Walk one library section and process its items with the specified
+        fixups.
+
+        Parameters:
+
+          section (plexapi.library.LibrarySection): The library section.
+
+          fixup_runs (list of FixupRun): The fixups for the section.
+
+          params (dict): Additional query parameters for listing the items of
+            the section, see begin_section().
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+
+        print("Processing {s.type} section {s.title!r} for fixups: {names}".
+              format(s=section,
+                     names=', '.join([fr.name for fr in fixup_runs])))
+        sys.stdout.flush()
+
+        work = self.iter_section_work(section, fixup_runs, params)
+        if self.jobs > 1:
+            return self.process_work_parallel(work)
+
+        for unit in work:
+            if unit is None:
+                return 1
+            rc = self.process_item(*unit)
+            if rc:
+                return rc
+        return 0
+
+    def finish_section(self, section, fixup_runs):
+        """
+        Finish the processing of one library section by the specified fixups,
+        after all of its items have been processed successfully: Let the
+        fixups process their deferred items, send their pending edits, verify
+        their edits in bulk, and update their watermarks in the state file.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        for fixup_run in fixup_runs:
+            with rate_limited(fixup_run.rate_limiter):
+                rc = fixup_run.fixup.finish_section(fixup_run, section) or \
+                    fixup_run.edit_batcher.flush() or \
+                    fixup_run.edit_verifier.verify()
+            if rc:
+                return self._failed(fixup_run)
+        if self.state is None or self._high_water is None:
+            return 0
+        # Items of earlier pages may have changed while later pages were
+        # listed, so the watermark must not be later than the time the
+        # listing started, even if later pages showed later changes.
+        high_water = self._high_water
+        if self._listing_start is not None:
+            high_water = min(high_water, self._listing_start)
+        updated = False
+        for fixup_run in fixup_runs:
+            if fixup_run.dryrun:
+                continue
+            if fixup_run.since is None or high_water > fixup_run.since:
+                self.state.set_watermark(
+                    self.plex.machineIdentifier, self.section_id(section),
+                    fixup_run.state_key, high_water)
+                updated = True
+        if updated:
+            try:
+                self.state.save()
+            except StateFileError as exc:
+                print("Error: {}".format(exc))
+                return 1
+        return 0
+
+    def iter_section_work(self, section, fixup_runs, params=None):
+        """
+        Generator that lists the items of one library section and yields the
+        units of work for processing them.
+
+        The items are listed page by page, and each page is processed as soon
+        as it has arrived. The episodes of show sections are listed if any of
+        the fixups processes episodes, see section_listings(). The full
+        metadata of the items is prefetched if any of the fixups needs it. In
+        incremental mode, an item is passed only to the fixups for which it
+        has changed.
+
+        Yields:
+
+          tuple(item, fixup_runs): A unit of work, with the item and the list
+            of fixups for the item. None is yielded after an error message
+            has been printed, and the generator then stops.
+        """
+        for list_params, list_fixup_runs, ep_fixup_runs in \
+                self.section_listings(section, fixup_runs, params):
+            for unit in self.iter_listing_work(
+                    section, list_fixup_runs, ep_fixup_runs, list_params):
+                yield unit
+                if unit is None:
+                    return
+
+    def iter_listing_work(self, section, fixup_runs, ep_fixup_runs,
+                          params=None):
+        """
+        Generator that lists the items of one listing of a library section
+        (see section_listings()) and yields the units of work for processing
+        them, including the episodes of show items if fixups for them are
+        specified.
+
+        Yields:
+
+          tuple(item, fixup_runs): A unit of work, see iter_section_work().
+        """
+
+        limiter = self.strictest_rate_limiter(fixup_runs)
+        ep_limiter = self.strictest_rate_limiter(ep_fixup_runs)
+        pages = iter_section_pages(section, self.page_size, params)
+        while True:
+
+            try:
+                with Watcher() as w:
+                    with rate_limited(limiter):
+                        items = next(pages, None)
+            except (plexapi.exceptions.PlexApiException,
+                    requests.exceptions.RequestException) as exc:
+                print("Error: Cannot list items in {s.type} section "
+                      "{s.title!r}: {msg} ({w.debug_str})".
+                      format(s=section, msg=exc, w=w))
+                yield None
+                return
+            if items is None:
+                return
+
+            units = [(item, self.item_fixup_runs(item, fixup_runs))
+                     for item in items]
+            rc = self.prefetch_items(
+                [item for item, item_fixup_runs in units if item_fixup_runs],
+                fixup_runs,
+                "{s.type} section {s.title!r}".format(s=section))
+            if rc:
+                yield None
+                return
+            self.look_ahead(units, fixup_runs)
+
+            for item, item_fixup_runs in units:
+
+                if item.type not in ITEM_TYPES:
+                    print("Error: Invalid item type {type!r} encountered "
+                          "in section {s.title!r}".
+                          format(type=item.type, s=section))
+                    yield None
+                    return
+
+                if item_fixup_runs:
+                    yield item, item_fixup_runs
+
+                if item.type == 'show' and ep_fixup_runs:
+
+                    try:
+                        with Watcher() as w:
+                            with rate_limited(ep_limiter):
+                                ep_items = item.episodes()
+                    except (plexapi.exceptions.PlexApiException,
+                            requests.exceptions.RequestException) as exc:
+                        print("Error: Cannot list episodes of show {show!r}: "
+                              "{msg} ({w.debug_str})".
+                              format(show=item.title, msg=exc, w=w))
+                        yield None
+                        return
+
+                    ep_units = [
+                        (ep_item, self.item_fixup_runs(ep_item, ep_fixup_runs))
+                        for ep_item in ep_items]
+                    rc = self.prefetch_items(
+                        [ep_item for ep_item, runs in ep_units if runs],
+                        ep_fixup_runs,
+                        "show {show!r}".format(show=item.title))
+                    if rc:
+                        yield None
+                        return
+                    self.look_ahead(ep_units, ep_fixup_runs)
+
+                    for ep_item, ep_item_fixup_runs in ep_units:
+                        if ep_item_fixup_runs:
+                            yield ep_item, ep_item_fixup_runs
+
+    def prefetch_items(self, items, fixup_runs, location):
+        """
+        Prefetch the full metadata of those of the specified items that are
+        processed by fixups that need full items.
+
+        Parameters:
+
+          items (list of plexapi.video.Video): The items.
+
+          fixup_runs (list of FixupRun): The fixups for the items.
+
+          location (string): Location of the items for error messages.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        item_types = set()
+        for fixup_run in fixup_runs:
+            if fixup_run.fixup.full_items:
+                item_types.update(fixup_run.fixup.item_types)
+        items = [item for item in items if item.type in item_types]
+        if not items:
+            return 0
+        try:
+            with Watcher() as w:
+                with rate_limited(self.strictest_rate_limiter(fixup_runs)):
+                    prefetch_full_items(self.plex, items,
+                                        self.prefetch_batch_size)
+        except (plexapi.exceptions.PlexApiException,
+                requests.exceptions.RequestException) as exc:
+            print("Error: Cannot fetch metadata of items in {loc}: {msg} "
+                  "({w.debug_str})".
+                  format(loc=location, msg=exc, w=w))
+            return 1
+        return 0
+
+    def process_work_parallel(self, work):
+        """
+        Process the units of work on a bounded pool of worker threads.
+
+        At most twice the number of jobs are submitted ahead of the unit whose
+        result is awaited. The output of each unit is printed in the order of
+        the units. After the first failed unit, no further units are started,
+        and the output of units that are already running is still printed.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        output = ThreadOutput(sys.stdout)
+        sys.stdout = output
+        pending = collections.deque()
+        rc = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                try:
+                    for unit in work:
+                        if unit is None:
+                            rc = 1
+                            break
+                        pending.append(executor.submit(
+                            self._process_captured, output, *unit))
+                        if len(pending) >= 2 * self.jobs:
+                            rc = self._complete(output, pending.popleft())
+                            if rc:
+                                break
+                    if rc:
+                        for future in pending:
+                            future.cancel()
+                    while pending:
+                        future = pending.popleft()
+                        if not future.cancelled():
+                            _rc = self._complete(output, future)
+                            rc = rc or _rc
+                except BaseException:
+                    for future in pending:
+                        future.cancel()
+                    raise
+        finally:
+            sys.stdout = output.stream
+        return rc
+
+    def _process_captured(self, output, item, fixup_runs):
+        """
+        Process one unit of work in a worker thread, capturing its output.
+
+        Returns:
+
+          tuple(rc, text, exc_info): Return code, captured output and
+            exception info (or None) of processing the item.
+        """
+        buffer = six.StringIO()
+        with output.capture(buffer):
+            try:
+                rc = self.process_item(item, fixup_runs)
+            except Exception:  # pylint: disable=broad-except
+                return None, buffer.getvalue(), sys.exc_info()
+        return rc, buffer.getvalue(), None
+
+    @staticmethod
+    def _complete(output, future):
+        """
+        Wait for a unit of work, print its output and return its return code.
+        Exceptions raised while processing the unit are re-raised.
+        """
+        return LibraryWalker._print_result(output, future.result())
+
+    @staticmethod
+    def _print_result(output, result):
+        """
+        Print the output of a unit of work and return its return code.
+        Exceptions raised while processing the unit are re-raised.
+        """
+        rc, text, exc_info = result
+        output.stream.write(text)
+        output.stream.flush()
+        if exc_info:
+            six.reraise(*exc_info)
+        return rc
+
+    def process_item(self, item, fixup_runs):
+        """
+        Process one item with those of the specified fixups that are
+        interested in its item type.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        for fixup_run in fixup_runs:
+            if not fixup_run.wants_item_type(item.type):
+                continue
+            with rate_limited(fixup_run.rate_limiter):
+                rc = fixup_run.fixup.process_item(fixup_run, item)
+            if rc:
+                return self._failed(fixup_run)
+        return 0
+
+    @staticmethod
+    def _failed(fixup_run):
+        """
+        Report that the specified fixup has encountered errors and return
+        the error return code.
+        """
+        print("Error: Fixup {name} has encountered errors - aborting".
+              format(name=fixup_run.name))
+        return 1
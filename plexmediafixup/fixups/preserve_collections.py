@@ -7,19 +7,13 @@ The file name of the collections file can be configured in the config file.
 
 from __future__ import print_function, absolute_import
 import os
-import re
 import json
 import six
 import yaml  # PyYAML package
 import yamlloader
 from unidecode import unidecode
-import plexapi
-import plexapi.exceptions
-import plexapi.utils
-import requests.exceptions
 from plexmediafixup.fixup import Fixup
 from plexmediafixup.utils.unicode import ensure_bytes, ensure_unicode
-from plexmediafixup.utils.watcher import Watcher
 
 
 FIXUP_NAME = os.path.splitext(os.path.basename(__file__))[0]
@@ -27,23 +21,18 @@ FIXUP_NAME = os.path.splitext(os.path.basename(__file__))[0]
 
 class PreserveCollections(Fixup):
 
+    full_items = True
+
     def __init__(self):
         super(PreserveCollections, self).__init__(FIXUP_NAME)
 
-    def run(self, plex, dryrun, verbose, config, fixup_kwargs):
+    def prepare(self, fixup_run):
         """
         Parameters:
 
-          plex (plexapi.PlexServer): PMS to work against.
-
-          dryrun (bool): Dryrun flag from command line.
-
-          verbose (bool): Verbose flag from command line.
-
-          config (ConfigFile): The config file.
-
-          fixup_kwargs (dict): The kwargs config parameter for the fixup,
-            with the following items:
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+            Its fixup_kwargs attribute is the kwargs config parameter for the
+            fixup, with the following items:
 
             section_types (string or iterable(string)):
               String or list of strings that specify the library section types
@@ -65,9 +54,8 @@ class PreserveCollections(Fixup):
               file is created if needed, and has a YAML format.
         """
 
-        section_types = fixup_kwargs.get('section_types', None)
-        section_pattern = fixup_kwargs.get('section_pattern', None)
-        coll_file = fixup_kwargs.get('collections_file', None)
+        verbose = fixup_run.verbose
+        coll_file = fixup_run.fixup_kwargs.get('collections_file', None)
 
         if not coll_file:
             print("Error: No 'collections_file' config parameter specified for "
@@ -77,7 +65,7 @@ class PreserveCollections(Fixup):
 
         if not os.path.isabs(coll_file):
             coll_file = os.path.join(
-                os.path.dirname(config.filepath),
+                os.path.dirname(fixup_run.config.filepath),
                 coll_file)
         print("Using collections file: {f}".format(f=coll_file))
 
@@ -99,67 +87,27 @@ class PreserveCollections(Fixup):
                   format(f=coll_file, msg=exc))
             return 1
 
-        if section_types is None:
-           section_types = ['movie', 'show']
-        elif isinstance(section_types, six.string_types):
-            section_types = [section_types]
-        for st in section_types:
-            if st not in ['movie', 'show']:
-                print("Error: Invalid section type specified for fixup "
-                      "{fixup}: {type}".
-                      format(fixup=FIXUP_NAME, type=st))
-                return 1
-
-        try:
-            with Watcher() as w:
-                sections = plex.library.sections()
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot list sections: {msg} ({w.debug_str})".
-                  format(msg=exc, w=w))
-            return 1
-
-        for section in sections:
+        fixup_run.params['coll_file'] = coll_file
+        fixup_run.params['coll_dict'] = coll_dict
+        return 0
 
-            if section.type not in section_types:
-                continue
-            if section_pattern is not None and \
-                    re.search(section_pattern, section.title) is None:
-                if verbose:
-                    print("Skipping {s.type} section {s.title!r} "
-                          "that does not match the specified pattern".
-                          format(s=section))
-                continue
+    def process_item(self, fixup_run, item):
+        """
+        Process one movie or show item.
+        """
+        return process_item(fixup_run.dryrun, fixup_run.verbose, item,
+                            fixup_run.params['coll_dict'])
 
-            print("Processing {s.type} section {s.title!r}".
-                  format(s=section))
+    def finish(self, fixup_run):
+        """
+        Write the collections file.
+        """
 
-            try:
-                with Watcher() as w:
-                    items = section.all()
-            except (plexapi.exceptions.PlexApiException,
-                    requests.exceptions.RequestException) as exc:
-                print("Error: Cannot list all items in {s.type} section "
-                      "{s.title!r}: {msg} ({w.debug_str})".
-                      format(s=section, msg=exc, w=w))
-                return 1
+        verbose = fixup_run.verbose
+        coll_file = fixup_run.params['coll_file']
+        coll_dict = fixup_run.params['coll_dict']
 
-            for item in items:
-                if item.type == 'movie':
-                    rc = process_item(dryrun, verbose, item, coll_dict)
-                    if rc:
-                        return rc
-                elif item.type == 'show':
-                    rc = process_item(dryrun, verbose, item, coll_dict)
-                    if rc:
-                        return rc
-                else:
-                    print("Error: Invalid section type {type!r} encountered in "
-                          "section {s.title!r}".
-                          format(type=item.type, s=section))
-                    return 1
-
-        if not dryrun:
+        if not fixup_run.dryrun:
             data = yaml.dump(
                 coll_dict, encoding=None, allow_unicode=True,
                 default_flow_style=False, indent=4,
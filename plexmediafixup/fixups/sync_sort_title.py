@@ -8,17 +8,11 @@ removed.
 
 from __future__ import print_function, absolute_import
 import os
-import re
 import json
-import six
 from unidecode import unidecode
-import plexapi
-import plexapi.exceptions
-import plexapi.utils
-import requests.exceptions
 from plexmediafixup.fixup import Fixup
 from plexmediafixup.utils.unicode import ensure_bytes, ensure_unicode
-from plexmediafixup.utils.watcher import Watcher
+from plexmediafixup.utils.edit_batcher import EditBatcher
 
 
 FIXUP_NAME = os.path.splitext(os.path.basename(__file__))[0]
@@ -50,23 +44,18 @@ def title_sort(title, as_ascii, remove_specials):
 
 class SyncSortTitle(Fixup):
 
+    item_types = ['movie', 'show', 'episode']
+
     def __init__(self):
         super(SyncSortTitle, self).__init__(FIXUP_NAME)
 
-    def run(self, plex, dryrun, verbose, config, fixup_kwargs):
+    def prepare(self, fixup_run):
         """
         Parameters:
 
-          plex (plexapi.PlexServer): PMS to work against.
-
-          dryrun (bool): Dryrun flag from command line.
-
-          verbose (bool): Verbose flag from command line.
-
-          config (ConfigFile): The config file.
-
-          fixup_kwargs (dict): The kwargs config parameter for the fixup,
-            with the following items:
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+            Its fixup_kwargs attribute is the kwargs config parameter for the
+            fixup, with the following items:
 
             section_types (string or iterable(string)):
               The library section types that should be processed. Valid values
@@ -90,96 +79,31 @@ class SyncSortTitle(Fixup):
               Boolean that controls whether special characters in the sort
               title will be replaced with space. Optional, default is False.
         """
-
-        section_types = fixup_kwargs.get('section_types', None)
-        section_pattern = fixup_kwargs.get('section_pattern', None)
-        as_ascii = fixup_kwargs.get('as_ascii', False)
-        remove_specials = fixup_kwargs.get('remove_specials', False)
-
-        if section_types is None:
-           section_types = ['movie', 'show']
-        elif isinstance(section_types, six.string_types):
-            section_types = [section_types]
-        for st in section_types:
-            if st not in ['movie', 'show']:
-                print("Error: Invalid section type specified for fixup "
-                      "{fixup}: {type}".
-                      format(fixup=FIXUP_NAME, type=st))
-                return 1
-
-        try:
-            with Watcher() as w:
-                sections = plex.library.sections()
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot list sections: {msg} ({w.debug_str})".
-                  format(msg=exc, w=w))
-            return 1
-
-        for section in sections:
-
-            if section.type not in section_types:
-                continue
-            if section_pattern is not None and \
-                    re.search(section_pattern, section.title) is None:
-                if verbose:
-                    print("Skipping {s.type} section {s.title!r} "
-                          "that does not match the specified pattern".
-                          format(s=section))
-                continue
-
-            print("Processing {s.type} section {s.title!r}".
-                  format(s=section))
-
-            try:
-                with Watcher() as w:
-                    items = section.all()
-            except (plexapi.exceptions.PlexApiException,
-                    requests.exceptions.RequestException) as exc:
-                print("Error: Cannot list all items in {s.type} section "
-                      "{s.title!r}: {msg} ({w.debug_str})".
-                      format(s=section, msg=exc, w=w))
-                return 1
-
-            for item in items:
-                if item.type == 'movie':
-                    rc = process_item(dryrun, verbose, item, as_ascii,
-                                      remove_specials)
-                    if rc:
-                        return rc
-                elif item.type == 'show':
-                    rc = process_item(dryrun, verbose, item, as_ascii,
-                                      remove_specials)
-                    if rc:
-                        return rc
-
-                    try:
-                        with Watcher() as w:
-                            ep_items = item.episodes()
-                    except (plexapi.exceptions.PlexApiException,
-                            requests.exceptions.RequestException) as exc:
-                        print("Error: Cannot list episodes of show {show!r}: "
-                              "{msg} ({w.debug_str})".
-                              format(show=item.title, msg=exc, w=w))
-                        return 1
-
-                    for ep_item in ep_items:
-                        rc = process_item(dryrun, verbose, ep_item, as_ascii,
-                                          remove_specials)
-                        if rc:
-                            return rc
-                else:
-                    print("Error: Invalid section type {type!r} encountered in "
-                          "section {s.title!r}".
-                          format(type=item.type, s=section))
-                    return 1
-
+        fixup_kwargs = fixup_run.fixup_kwargs
+        fixup_run.params['as_ascii'] = fixup_kwargs.get('as_ascii', False)
+        fixup_run.params['remove_specials'] = \
+            fixup_kwargs.get('remove_specials', False)
         return 0
 
+    def process_item(self, fixup_run, item):
+        """
+        Process one movie, show or episode item.
+        """
+        return process_item(
+            fixup_run.dryrun, fixup_run.verbose, item,
+            fixup_run.params['as_ascii'], fixup_run.params['remove_specials'],
+            fixup_run.edit_batcher)
+
 
-def process_item(dryrun, verbose, item, as_ascii, remove_specials):
+def process_item(dryrun, verbose, item, as_ascii, remove_specials,
+                 edit_batcher=None):
+    # pylint: disable=protected-access
     """
-    Process one movie, show or episode item
+    Process one movie, show or episode item.
+
+    The sort title field is changed using the specified EditBatcher object,
+    i.e. the change may be sent and verified later together with changes of
+    other items. None means to send and verify the change immediately.
     """
 
     # If the item has no title, we cannot sync from it
@@ -206,31 +130,27 @@ def process_item(dryrun, verbose, item, as_ascii, remove_specials):
 
         # Change the sort title field
         new_title_sort_bytes = ensure_bytes(new_title_sort)
-        parm_type = plexapi.utils.SEARCHTYPES[item.type]
         parms = {
-            'type': parm_type,
-            'id': item.ratingKey,
             'titleSort.value': new_title_sort_bytes,
             'titleSort.locked': 1,
         }
+        what = "set the sort title field of {i.type} item to {new_title!r}". \
+            format(i=item, new_title=new_title_sort)
+
+        def check(item):
+            """
+            Verify the sort title field was changed, on a freshly loaded item.
+            """
+            if item.titleSort != new_title_sort:
+                print("Error: Attempt to set the sort title field of "
+                      "{i.type} item to {new_title!r} did not stick, "
+                      "it is still {i.titleSort!r}".
+                      format(i=item, new_title=new_title_sort))
+                return 1
+            return 0
 
-        try:
-            with Watcher() as w:
-                item.edit(**parms)
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot set the sort title field of "
-                  "{i.type} item to {new_title!r}: {msg} ({w.debug_str})".
-                  format(i=item, new_title=new_title_sort, msg=exc, w=w))
-            return 1
-
-        # Verify the sort title field was changed
-        item.reload()
-        if item.titleSort != new_title_sort:
-            print("Error: Attempt to set the sort title field of "
-                  "{i.type} item to {new_title!r} did not stick, "
-                  "it is still {i.titleSort!r}".
-                  format(i=item, new_title=new_title_sort))
-            return 1
+        if edit_batcher is None:
+            edit_batcher = EditBatcher(item._server)
+        return edit_batcher.edit(item, parms, what, check)
 
     return 0
@@ -6,48 +6,102 @@ tag found in the media file.
 
 from __future__ import print_function, absolute_import
 import os
+import re
+import time
+import errno
 import sys
 import locale
-import re
 import json
-import six
+import functools
 import ffmpy
 import subprocess
-import plexapi
-import plexapi.exceptions
-import plexapi.utils
-import requests.exceptions
 from plexmediafixup.fixup import Fixup
 from plexmediafixup.utils.unicode import ensure_bytes, ensure_unicode
-from plexmediafixup.utils.watcher import Watcher
+from plexmediafixup.utils.edit_batcher import EditBatcher
+from plexmediafixup.utils.probe_cache import ProbeCache, ProbeCacheError
+from plexmediafixup.utils.media_tags import read_title_tag, TitleDecodeError
+from plexmediafixup.utils.probe_pool import ProbePool, DEFAULT_PROBE_JOBS, \
+    DEFAULT_PROBE_JOBS_PER_MOUNT
+from plexmediafixup.utils.probe_stats import ProbeStats
+from plexmediafixup.utils.path_mapper import PathMapper
+from plexmediafixup.utils.dir_cache import DirCache
 
 
 FIXUP_NAME = os.path.splitext(os.path.basename(__file__))[0]
 
 # Encodings that will be tried in order when decoding the metadata of any AVI
-# files.
-AVI_METADATA_ENCODINGS = ['cp1252', 'utf-8']
+# files. The first one that succeeds is used.
+AVI_METADATA_ENCODINGS = ['utf-8', 'cp1252']
+
+# Default profile for invoking ffprobe. It limits the amount of data ffprobe
+# reads from each media file, which matters on network storage.
+DEFAULT_PROBE_PROFILE = {
+    # Maximum number of bytes read for analyzing the streams (ffprobe
+    # -probesize option). None means the ffprobe default (5 MB).
+    'probesize': 1000000,
+    # Maximum duration in microseconds analyzed for the streams (ffprobe
+    # -analyzeduration option). None means the ffprobe default (5 s).
+    'analyzeduration': 1000000,
+    # ffprobe output writer: 'json' or 'compact' (which just prints the
+    # title value).
+    'writer': 'json',
+    # Boolean indicating whether the number of bytes read from each media
+    # file is reported (runs ffprobe with -v verbose).
+    'report_bytes': False,
+}
+
+# Default number of seconds after which an ffprobe process that has not
+# completed is killed. None means no timeout.
+DEFAULT_PROBE_TIMEOUT = 30
+
+# Default number of times the probe of a media file that timed out is retried
+# at the end of the library section.
+DEFAULT_PROBE_RETRIES = 2
+
+# Number of seconds to wait for a killed ffprobe process to terminate. A
+# process that is stuck in uninterruptible I/O (e.g. on a network share that
+# does not respond) may not terminate, and is then left behind.
+KILL_WAIT = 5
+
+# ffprobe output writers by writer name of the probe profile. The 'sv=ignore'
+# option is explained in get_title_tag().
+PROBE_WRITERS = {
+    'json': 'json=sv=ignore',
+    'compact': 'compact=p=0:nk=1:e=none:sv=ignore',
+}
+
+# Pattern for the I/O statistics ffprobe logs at the verbose log level
+STATISTICS_PATTERN = re.compile(br'Statistics: (\d+) bytes read, (\d+) seeks')
+
+
+class ProbeError(Exception):
+    """
+    An error when probing a media file for its title tag.
+    """
+    pass
+
+
+class ProbeTimeout(ProbeError):
+    """
+    A probe of a media file that did not complete within its timeout.
+    """
+    pass
 
 
 class SyncTitle(Fixup):
 
+    item_types = ['movie', 'episode']
+
     def __init__(self):
         super(SyncTitle, self).__init__(FIXUP_NAME)
 
-    def run(self, plex, dryrun, verbose, config, fixup_kwargs):
+    def prepare(self, fixup_run):
         """
         Parameters:
 
-          plex (plexapi.PlexServer): PMS to work against.
-
-          dryrun (bool): Dryrun flag from command line.
-
-          verbose (bool): Verbose flag from command line.
-
-          config (ConfigFile): The config file.
-
-          fixup_kwargs (dict): The kwargs config parameter for the fixup,
-            with the following items:
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+            Its fixup_kwargs attribute is the kwargs config parameter for the
+            fixup, with the following items:
 
             section_types (string or iterable(string)):
               The library section types that should be processed. Valid values
@@ -61,91 +115,215 @@ class SyncTitle(Fixup):
               processed within the configured section types. A value of None
               (null in config file) means to process all library sections of
               the configured types. Optional, default is None.
-        """
-
-        path_mappings = config.data.get('path_mappings', [])
-
-        section_types = fixup_kwargs.get('section_types', None)
-        section_pattern = fixup_kwargs.get('section_pattern', None)
 
-        if section_types is None:
-           section_types = ['movie', 'show']
-        elif isinstance(section_types, six.string_types):
-            section_types = [section_types]
-        for st in section_types:
-            if st not in ['movie', 'show']:
-                print("Error: Invalid section type specified for fixup "
-                      "{fixup}: {type}".
-                      format(fixup=FIXUP_NAME, type=st))
+            probe_jobs (int):
+              Number of media files that are probed concurrently. The media
+              files of the items of a page of the section listing are probed
+              ahead while earlier items are processed. Optional, default is 4.
+
+            probe_jobs_per_mount (int):
+              Number of media files that are probed concurrently on the same
+              mount point. Optional, default is 2.
+
+            native_reader (bool):
+              Read the title tag of Matroska, MP4 and AVI media files
+              in-process, instead of running ffprobe. Media files in other
+              formats are still probed using ffprobe. Optional, default is
+              True.
+
+            probe_profile (dict):
+              Profile for invoking ffprobe, with items 'probesize' (int,
+              bytes), 'analyzeduration' (int, microseconds), 'writer'
+              ('json' or 'compact') and 'report_bytes' (bool). Missing items
+              default to DEFAULT_PROBE_PROFILE.
+
+            probe_timeout (int or float):
+              Number of seconds after which an ffprobe process that has not
+              completed is killed. An item whose media file probe timed out
+              is deferred to the end of the library section, so that it does
+              not hold up the other items. A value of None (null in config
+              file) means no timeout. Optional, default is 30.
+
+            probe_retries (int):
+              Number of times the probe of a media file of a deferred item is
+              retried at the end of the library section, before the item
+              fails. Optional, default is 2.
+        """
+        fixup_run.params['path_mapper'] = PathMapper(
+            fixup_run.config.data.get('path_mappings', []))
+
+        probe_jobs = fixup_run.fixup_kwargs.get(
+            'probe_jobs', DEFAULT_PROBE_JOBS)
+        probe_jobs_per_mount = fixup_run.fixup_kwargs.get(
+            'probe_jobs_per_mount', DEFAULT_PROBE_JOBS_PER_MOUNT)
+        for name, value in (('probe_jobs', probe_jobs),
+                            ('probe_jobs_per_mount', probe_jobs_per_mount)):
+            if not isinstance(value, int) or value < 1:
+                print("Error: Invalid '{name}' config parameter specified "
+                      "for fixup {fixup}: {value!r}".
+                      format(name=name, fixup=FIXUP_NAME, value=value))
                 return 1
-
-        try:
-            with Watcher() as w:
-                sections = plex.library.sections()
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot list sections: {msg} ({w.debug_str})".
-                  format(msg=exc, w=w))
+        native_reader = fixup_run.fixup_kwargs.get('native_reader', True)
+
+        profile = dict(DEFAULT_PROBE_PROFILE)
+        profile.update(fixup_run.fixup_kwargs.get('probe_profile', None) or {})
+        for name in ('probesize', 'analyzeduration'):
+            value = profile[name]
+            if value is not None and (not isinstance(value, int) or
+                                      value < 1):
+                print("Error: Invalid '{name}' item in 'probe_profile' "
+                      "config parameter specified for fixup {fixup}: "
+                      "{value!r}".
+                      format(name=name, fixup=FIXUP_NAME, value=value))
+                return 1
+        if profile['writer'] not in PROBE_WRITERS:
+            print("Error: Invalid 'writer' item in 'probe_profile' config "
+                  "parameter specified for fixup {fixup}: {value!r}".
+                  format(fixup=FIXUP_NAME, value=profile['writer']))
             return 1
 
-        for section in sections:
-
-            if section.type not in section_types:
-                continue
-            if section_pattern is not None and \
-                    re.search(section_pattern, section.title) is None:
-                if verbose:
-                    print("Skipping {s.type} section {s.title!r} "
-                          "that does not match the specified pattern".
-                          format(s=section))
-                    sys.stdout.flush()
-                continue
-
-            print("Processing {s.type} section {s.title!r}".
-                  format(s=section))
-            sys.stdout.flush()
+        probe_timeout = fixup_run.fixup_kwargs.get(
+            'probe_timeout', DEFAULT_PROBE_TIMEOUT)
+        if probe_timeout is not None and (
+                isinstance(probe_timeout, bool) or
+                not isinstance(probe_timeout, (int, float)) or
+                probe_timeout <= 0):
+            print("Error: Invalid 'probe_timeout' config parameter specified "
+                  "for fixup {fixup}: {value!r}".
+                  format(fixup=FIXUP_NAME, value=probe_timeout))
+            return 1
+        probe_retries = fixup_run.fixup_kwargs.get(
+            'probe_retries', DEFAULT_PROBE_RETRIES)
+        if not isinstance(probe_retries, int) or probe_retries < 0:
+            print("Error: Invalid 'probe_retries' config parameter specified "
+                  "for fixup {fixup}: {value!r}".
+                  format(fixup=FIXUP_NAME, value=probe_retries))
+            return 1
 
+        # The probe cache is opened once the parameters are valid, since a
+        # fixup that failed to prepare is not cleaned up.
+        probe_cache = None
+        cache_parms = fixup_run.config.data.get('probe_cache', {})
+        if cache_parms.get('file', None):
+            cache_file = fixup_run.config.abspath(cache_parms['file'])
+            print("Using probe cache file: {f}".format(f=cache_file))
+            probe_cache = ProbeCache(cache_file, cache_parms['max_age'])
             try:
-                with Watcher() as w:
-                    items = section.all()
-            except (plexapi.exceptions.PlexApiException,
-                    requests.exceptions.RequestException) as exc:
-                print("Error: Cannot list all items in {s.type} section "
-                      "{s.title!r}: {msg} ({w.debug_str})".
-                      format(s=section, msg=exc, w=w))
+                probe_cache.open()
+            except ProbeCacheError as exc:
+                print("Error: {}".format(exc))
                 return 1
+        fixup_run.params['probe_cache'] = probe_cache
+
+        probe_stats = ProbeStats()
+        fixup_run.params['probe_stats'] = probe_stats
+
+        dir_cache = DirCache()
+        fixup_run.params['dir_cache'] = dir_cache
+
+        probe = functools.partial(
+            probe_title_tag, probe_cache=probe_cache,
+            native_reader=native_reader, profile=profile, stats=probe_stats,
+            timeout=probe_timeout, dir_cache=dir_cache)
+        fixup_run.params['probe_pool'] = ProbePool(
+            probe, probe_jobs, probe_jobs_per_mount)
+        fixup_run.params['probe_retry'] = functools.partial(
+            probe, retries=probe_retries)
+
+        # Items deferred due to slow media files. The list is appended to
+        # from the worker threads of the library walk.
+        fixup_run.params['deferred'] = []
+        return 0
 
-            for item in items:
-                if item.type == 'movie':
-                    rc = process_item(
-                        dryrun, verbose, item, path_mappings)
-                    if rc:
-                        return rc
-                elif item.type == 'show':
-
-                    try:
-                        with Watcher() as w:
-                            ep_items = item.episodes()
-                    except (plexapi.exceptions.PlexApiException,
-                            requests.exceptions.RequestException) as exc:
-                        print("Error: Cannot list episodes of show {show!r}: "
-                              "{msg} ({w.debug_str})".
-                              format(show=item.title, msg=exc, w=w))
-                        return 1
-
-                    for ep_item in ep_items:
-                        rc = process_item(
-                            dryrun, verbose, ep_item, path_mappings)
-                        if rc:
-                            return rc
-                else:
-                    print("Error: Invalid section type {type!r} encountered in "
-                          "section {s.title!r}".
-                          format(type=item.type, s=section))
-                    return 1
+    def look_ahead(self, fixup_run, items):
+        """
+        Start probing the media files of upcoming movie or episode items.
+        """
+        probe_pool = fixup_run.params['probe_pool']
+        path_mapper = fixup_run.params['path_mapper']
+        for item in items:
+            for part in item.iterParts():
+                if not part.file:
+                    continue
+                local_file = path_mapper.local_path(ensure_unicode(part.file))
+                if local_file is not None:
+                    probe_pool.submit(local_file)
+
+    def process_item(self, fixup_run, item):
+        """
+        Process one movie or episode item.
+        """
+        return process_item(
+            fixup_run.dryrun, fixup_run.verbose, item,
+            fixup_run.params['path_mapper'], fixup_run.edit_batcher,
+            fixup_run.params['probe_pool'].result,
+            fixup_run.params['probe_stats'], fixup_run.params['deferred'],
+            fixup_run.params['dir_cache'])
+
+    def finish_section(self, fixup_run, section):
+        """
+        Process the items of the library section that were deferred due to
+        slow media files, retrying the probes of their media files.
+        """
+        deferred = fixup_run.params['deferred']
+        if not deferred:
+            return 0
+        print("Processing {n} deferred items with slow media files in "
+              "{s.type} section {s.title!r}".
+              format(n=len(deferred), s=section))
+        sys.stdout.flush()
+        while deferred:
+            item = deferred.pop(0)
+            rc = process_item(
+                fixup_run.dryrun, fixup_run.verbose, item,
+                fixup_run.params['path_mapper'], fixup_run.edit_batcher,
+                fixup_run.params['probe_retry'],
+                fixup_run.params['probe_stats'],
+                dir_cache=fixup_run.params['dir_cache'])
+            if rc:
+                return rc
+        return 0
 
+    def finish(self, fixup_run):
+        """
+        Print the probe statistics, close the probe cache, evicting its
+        stale entries, and discard the directory listings of this run.
+        """
+        fixup_run.params['probe_pool'].shutdown()
+        fixup_run.params['dir_cache'].clear()
+        print("Probe statistics: {s}".
+              format(s=fixup_run.params['probe_stats'].summary()))
+        probe_cache = fixup_run.params['probe_cache']
+        if probe_cache is None:
+            return 0
+        if fixup_run.verbose:
+            print("Probe cache: {c.hits} hits, {c.misses} misses".
+                  format(c=probe_cache))
+        try:
+            probe_cache.close()
+        except ProbeCacheError as exc:
+            print("Error: {}".format(exc))
+            return 1
         return 0
 
+    def cleanup(self, fixup_run):
+        """
+        Stop probing media files, close the probe cache if the run did not
+        get to finish it, and discard the directory listings of this run.
+        """
+        probe_pool = fixup_run.params.get('probe_pool', None)
+        if probe_pool is not None:
+            probe_pool.shutdown()
+        dir_cache = fixup_run.params.get('dir_cache', None)
+        if dir_cache is not None:
+            dir_cache.clear()
+        probe_cache = fixup_run.params.get('probe_cache', None)
+        if probe_cache is not None and probe_cache.is_open:
+            try:
+                probe_cache.close()
+            except ProbeCacheError as exc:
+                print("Error: {}".format(exc))
+
 
 def local_path(server_path, path_mappings):
     """
@@ -156,32 +334,100 @@ def local_path(server_path, path_mappings):
 
     The returned local path uses the path separator of the OS running this
     module.
+
+    For mapping many paths, create a PathMapper object once and use its
+    local_path() method instead.
     """
-    for mapping in path_mappings:
+    return PathMapper(path_mappings).local_path(server_path)
 
-        server_root = mapping.get('server').replace('\\', '/')
-        if not server_root.endswith('/'):
-            server_root += '/'
 
-        server_path = server_path.replace('\\', '/')
+def run_ffprobe(ffprobe, timeout=None):
+    # pylint: disable=protected-access
+    """
+    Run the specified ffmpy.FFprobe object like its run() method does, with
+    its standard output and standard error captured, but kill the ffprobe
+    process if it has not completed within the specified timeout in seconds
+    (None means no timeout).
 
-        if server_path.startswith(server_root):
-            relpath = server_path[len(server_root):].replace('/', os.path.sep)
-            local_root = mapping.get('local'). \
-                replace('\\', os.path.sep).replace('/', os.path.sep)
-            return os.path.join(local_root, relpath)
+    FFprobe.run() waits for the ffprobe process without a timeout, so the
+    process is created here from the command line of the FFprobe object.
 
-    return None
+    Returns:
 
+      tuple(stdout, stderr): The captured output as byte strings.
 
-def get_title_tag(media_file):
+    Raises:
+      ffmpy.FFExecutableNotFoundError: The ffprobe command was not found.
+      ffmpy.FFRuntimeError: The ffprobe command failed.
+      ProbeTimeout: The ffprobe command did not complete within the timeout.
+    """
+    try:
+        process = subprocess.Popen(
+            ffprobe._cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+    except OSError as exc:
+        if exc.errno == errno.ENOENT:
+            raise ffmpy.FFExecutableNotFoundError(
+                "Executable '{exe}' not found".format(exe=ffprobe.executable))
+        raise
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        try:
+            process.communicate(timeout=KILL_WAIT)
+        except subprocess.TimeoutExpired:
+            pass
+        raise ProbeTimeout(
+            "ffprobe did not complete within {t} s and was killed: {cmd}".
+            format(t=timeout, cmd=ffprobe.cmd))
+    if process.returncode != 0:
+        raise ffmpy.FFRuntimeError(ffprobe.cmd, process.returncode, stdout,
+                                   stderr)
+    return stdout, stderr
+
+
+def get_title_tag(media_file, native_reader=True, profile=None, stats=None,
+                  timeout=None, retries=0):
     """
     Retrieve the title tag from the metadata of the specified media_file
-    using the ffprobe command and return it as a unicode string.
+    and return it as a unicode string, or None if the media file has no title
+    tag.
+
+    If native_reader is True and the container format of the media file is
+    supported by read_title_tag(), the title tag is read in-process.
+    Otherwise, the ffprobe command is used, invoked according to the
+    specified probe profile (a dict like DEFAULT_PROBE_PROFILE, None means
+    DEFAULT_PROBE_PROFILE). If the profile has 'report_bytes' set, the number
+    of bytes read by ffprobe is recorded in the specified ProbeStats object.
+
+    An ffprobe process that has not completed within the specified timeout
+    in seconds (None means no timeout) is killed, and is retried up to the
+    specified number of times. The timeouts are recorded in the specified
+    ProbeStats object. Reading the title tag in-process is not subject to
+    the timeout.
+
+    Raises:
+      ProbeTimeout: ffprobe did not complete within the timeout, in any of
+        the retries.
+      ProbeError: The title tag could not be retrieved.
     """
 
     media_file = ensure_unicode(media_file)
 
+    if native_reader:
+        try:
+            supported, title_tag = read_title_tag(
+                media_file, AVI_METADATA_ENCODINGS)
+        except TitleDecodeError as exc:
+            raise ProbeError(
+                "Cannot decode title tag of media file {file!r} using any "
+                "of the encodings {encs}: {raw!r}".
+                format(file=media_file, encs=','.join(exc.encodings),
+                       raw=exc.raw_title))
+        if supported:
+            return title_tag
+
     ext = os.path.splitext(media_file)[1].lower()
 
     # When invoking a system command, its command line arguments need to be
@@ -198,58 +444,152 @@ def get_title_tag(media_file):
     # with the Unicode replacement character (U+FFFD). The 'sv=ignore' writer
     # option causes ffprobe to ignore non-ASCII characters and to return them
     # unchanged.
+    if profile is None:
+        profile = DEFAULT_PROBE_PROFILE
+    global_options = ['-hide_banner']
+    if profile['report_bytes']:
+        global_options += ['-v', 'verbose']
+    if profile['probesize'] is not None:
+        global_options += ['-probesize', str(profile['probesize'])]
+    if profile['analyzeduration'] is not None:
+        global_options += ['-analyzeduration', str(profile['analyzeduration'])]
+    global_options += ['-show_entries', 'format_tags=title',
+                       '-of', PROBE_WRITERS[profile['writer']]]
     ffprobe = ffmpy.FFprobe(
-        global_options=['-hide_banner', '-show_format',
-                        '-of', 'json=sv=ignore'],
+        global_options=global_options,
         inputs={media_file: None})
 
-    try:
-        stdout, stderr = ffprobe.run(
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
-    except (UnicodeDecodeError, UnicodeEncodeError) as exc:
-        print("Error: Unicode conversion issue when invoking {cmd!r}: "
-              "{msg!r}".
-              format(cmd=ffprobe.cmd, msg=exc))
-        return 1
-    except ffmpy.FFRuntimeError as exc:
-        print("Error: ffprobe failed on media file {file!r}: {msg!r}".
-              format(file=media_file, msg=exc))
-        return 1
+    attempt = 0
+    while True:
+        try:
+            stdout, stderr = run_ffprobe(ffprobe, timeout)
+            break
+        except ProbeTimeout:
+            if stats is not None:
+                stats.add_timeout()
+            if attempt >= retries:
+                raise
+            attempt += 1
+        except (UnicodeDecodeError, UnicodeEncodeError) as exc:
+            raise ProbeError(
+                "Unicode conversion issue when invoking {cmd!r}: {msg!r}".
+                format(cmd=ffprobe.cmd, msg=exc))
+        except ffmpy.FFRuntimeError as exc:
+            raise ProbeError(
+                "ffprobe failed on media file {file!r}: {msg!r}".
+                format(file=media_file, msg=exc))
+
+    if profile['report_bytes'] and stats is not None:
+        bytes_read = seeks = 0
+        for m in STATISTICS_PATTERN.finditer(stderr or b''):
+            bytes_read += int(m.group(1))
+            seeks += int(m.group(2))
+        stats.add(media_file, bytes_read, seeks)
 
     if ext == '.avi':
         stdout_u = None
         for enc in AVI_METADATA_ENCODINGS:
             try:
                 stdout_u = ensure_unicode(stdout, encoding=enc)
-            except UnicodeDecodeError as exc:
+                break
+            except UnicodeDecodeError:
                 continue
         if stdout_u is None:
-            print("Error: Cannot decode ffprobe metadata output for AVI file "
-                  "{file!r} using any of the encodings {enc}: {out!r}".
-                  format(file=media_file, out=stdout,
-                         encs=','.joinAVI_METADATA_ENCODINGS()))
-            return 1
+            raise ProbeError(
+                "Cannot decode ffprobe metadata output for AVI file "
+                "{file!r} using any of the encodings {encs}: {out!r}".
+                format(file=media_file, out=stdout,
+                       encs=','.join(AVI_METADATA_ENCODINGS)))
     else:
         stdout_u = ensure_unicode(stdout)  # UTF-8 by default
 
+    if profile['writer'] == 'compact':
+        # The compact writer prints just the title value (unescaped) in a
+        # line, or nothing if there is no title tag.
+        if stdout_u.endswith('\n'):
+            stdout_u = stdout_u[:-1]
+        return stdout_u or None
+
     try:
         out = json.loads(stdout_u)
     except ValueError:
-        print("Error: ffprobe returned invalid JSON for media file "
-              "{file!r}: {out!r}".
-              format(file=media_file, out=stdout_u))
-        return 1
+        raise ProbeError(
+            "ffprobe returned invalid JSON for media file {file!r}: "
+            "{out!r}".
+            format(file=media_file, out=stdout_u))
 
-    tags = out['format'].get('tags', dict())
+    tags = out.get('format', dict()).get('tags', dict())
     title_tag = tags.get('title', None)
 
     return title_tag
 
 
-def process_item(dryrun, verbose, item, path_mappings):
+def probe_title_tag(media_file, probe_cache=None, native_reader=True,
+                    profile=None, stats=None, timeout=None, retries=0,
+                    dir_cache=None):
+    """
+    Return the title tag of the specified media_file as a unicode string.
+
+    If a probe cache is specified and has an entry for the media file with
+    the current size and modification time of the file, the cached title tag
+    is returned. Otherwise, the title tag is retrieved using get_title_tag()
+    and stored in the probe cache. The size and modification time of the
+    file are taken from the specified DirCache object, if specified. The
+    time needed for retrieving the title tag is recorded in the specified
+    ProbeStats object.
+
+    Raises:
+      ProbeTimeout: ffprobe did not complete within the timeout.
+      ProbeError: The title tag could not be retrieved.
+      ProbeCacheError: The title tag could not be stored in the probe cache.
+    """
+    media_file = ensure_unicode(media_file)
+    if probe_cache is not None:
+        stat = dir_cache.stat(media_file) if dir_cache is not None else None
+        if stat is None:
+            stat = os.stat(media_file)
+        hit, title_tag = probe_cache.get(media_file, stat.st_size,
+                                         stat.st_mtime)
+        if hit:
+            return title_tag
+
+    start_time = time.time()
+    title_tag = get_title_tag(media_file, native_reader, profile, stats,
+                              timeout, retries)
+    if stats is not None:
+        stats.add_latency(media_file, time.time() - start_time)
+
+    if probe_cache is not None:
+        probe_cache.put(media_file, stat.st_size, stat.st_mtime, title_tag)
+    return title_tag
+
+
+def process_item(dryrun, verbose, item, path_mapper, edit_batcher=None,
+                 probe=None, probe_stats=None, deferred=None, dir_cache=None):
+    # pylint: disable=protected-access
     """
-    Process one movie or episode item
+    Process one movie or episode item.
+
+    The media files of the item are mapped to local path names using the
+    specified PathMapper object. Their existence is checked using the
+    specified DirCache object. None means to check each media file directly.
+
+    The title field is changed using the specified EditBatcher object, i.e.
+    the change may be sent and verified later together with changes of other
+    items. None means to send and verify the change immediately.
+
+    The title tags of the media files are retrieved by calling the specified
+    probe function with the local path name of each media file, e.g. the
+    result() method of a ProbePool object that may have started probing them
+    already. None means to probe the media files directly using
+    probe_title_tag().
+
+    If a media file probe times out and a deferred list is specified, the
+    item is appended to that list for being processed again later, instead
+    of failing.
+
+    In verbose mode, the number of bytes read from each media file is
+    printed if recorded in the specified ProbeStats object.
     """
 
     title_info_list = []  # list items: tuple(local_file, title_tag)
@@ -262,18 +602,47 @@ def process_item(dryrun, verbose, item, path_mappings):
         # characers, or otherwise a unicode string.
         server_file = ensure_unicode(part.file)
 
-        local_file = local_path(server_file, path_mappings)
+        local_file = path_mapper.local_path(server_file)
         if local_file is None:
             print("Error: Cannot map server file {sf!r} using path "
                   "mappings {pm!r}".
-                  format(sf=part.file, pm=path_mappings))
+                  format(sf=part.file, pm=path_mapper.path_mappings))
             return 1
-        if not os.path.exists(local_file):
+        if dir_cache is not None:
+            local_file_exists = dir_cache.exists(local_file)
+        else:
+            local_file_exists = os.path.exists(local_file)
+        if not local_file_exists:
             print("Error: Cannot find local media file {lf!r} for {i.type} "
                   "{i.title!r}".
                   format(i=item, lf=local_file))
             return 1
-        title_tag = get_title_tag(local_file)
+        try:
+            if probe is not None:
+                title_tag = probe(local_file)
+            else:
+                title_tag = probe_title_tag(local_file)
+        except ProbeTimeout as exc:
+            if deferred is None:
+                print("Error: {}".format(exc))
+                return 1
+            if verbose:
+                print("Deferring {i.type} {i.title!r} with slow media file "
+                      "{file!r} to the end of the section".
+                      format(i=item, file=local_file))
+                sys.stdout.flush()
+            if probe_stats is not None:
+                probe_stats.add_deferred()
+            deferred.append(item)
+            return 0
+        except (ProbeError, ProbeCacheError) as exc:
+            print("Error: {}".format(exc))
+            return 1
+        if probe_stats is not None:
+            file_stats = probe_stats.pop(local_file)
+            if verbose and file_stats is not None:
+                print("Probed media file {f!r}: {b} bytes read, {s} seeks".
+                      format(f=local_file, b=file_stats[0], s=file_stats[1]))
         title_info_list.append((local_file, title_tag))
 
     title_tag = None
@@ -314,30 +683,31 @@ def process_item(dryrun, verbose, item, path_mappings):
         # Change the title field
         new_title = title_tag
         new_title_b = ensure_bytes(new_title)
-        parm_type = plexapi.utils.SEARCHTYPES[item.type]
         parms = {
-            'type': parm_type,
-            'id': item.ratingKey,
             'title.value': new_title_b,
             'title.locked': 1,
         }
+        what = "set the title field of {i.type} {i.title!r} to " \
+            "{new_title!r}".format(i=item, new_title=new_title)
+
+        def check(item):
+            """
+            Verify the title field was changed, on a freshly loaded item.
+            """
+            if item.title != new_title:
+                print("Error: Attempt to set the title field of {i.type} "
+                      "{i.title!r} to {new_title!r} did not stick".
+                      format(i=item, new_title=new_title))
+                return 1
+            return 0
 
-        try:
-            with Watcher() as w:
-                item.edit(**parms)
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot set the title field of {i.type} {i.title!r} "
-                  "to {new_title!r}: {msg} ({w.debug_str})".
-                  format(i=item, new_title=new_title, msg=exc, w=w))
-            return 1
+        if edit_batcher is None:
+            edit_batcher = EditBatcher(item._server)
+        rc = edit_batcher.edit(item, parms, what, check)
 
-        # Verify the title field was changed
-        item.reload()
-        if item.title != new_title:
-            print("Error: Attempt to set the title field of {i.type} "
-                  "{i.title!r} to {new_title!r} did not stick".
-                  format(i=item, new_title=new_title))
-            return 1
+        # Subsequent fixups for this item see the new title, even if the
+        # change is still pending.
+        item.title = new_title
+        return rc
 
     return 0
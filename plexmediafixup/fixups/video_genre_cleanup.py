@@ -8,17 +8,12 @@ These changes can be configured in the config file.
 
 from __future__ import print_function, absolute_import
 import os
-import re
 import json
 import six
 from unidecode import unidecode
-import plexapi
-import plexapi.exceptions
-import plexapi.utils
-import requests.exceptions
 from plexmediafixup.fixup import Fixup
 from plexmediafixup.utils.unicode import ensure_bytes, ensure_unicode
-from plexmediafixup.utils.watcher import Watcher
+from plexmediafixup.utils.edit_batcher import EditBatcher
 
 
 FIXUP_NAME = os.path.splitext(os.path.basename(__file__))[0]
@@ -55,23 +50,18 @@ def reversed_change_dict(change):
 
 class CleanupGenre(Fixup):
 
+    full_items = True
+
     def __init__(self):
         super(CleanupGenre, self).__init__(FIXUP_NAME)
 
-    def run(self, plex, dryrun, verbose, config, fixup_kwargs):
+    def prepare(self, fixup_run):
         """
         Parameters:
 
-          plex (plexapi.PlexServer): PMS to work against.
-
-          dryrun (bool): Dryrun flag from command line.
-
-          verbose (bool): Verbose flag from command line.
-
-          config (ConfigFile): The config file.
-
-          fixup_kwargs (dict): The kwargs config parameter for the fixup,
-            with the following items:
+          fixup_run (FixupRun): The fixup with its parameters for this run.
+            Its fixup_kwargs attribute is the kwargs config parameter for the
+            fixup, with the following items:
 
             section_types (string or iterable(string)):
               String or list of strings that specify the library section types
@@ -93,11 +83,10 @@ class CleanupGenre(Fixup):
               language codes defined in ISO 639-1.
         """
 
-        video_genre_cleanup = config.data.get('video_genre_cleanup', [])
+        video_genre_cleanup = \
+            fixup_run.config.data.get('video_genre_cleanup', [])
 
-        section_types = fixup_kwargs.get('section_types', None)
-        section_pattern = fixup_kwargs.get('section_pattern', None)
-        language = fixup_kwargs.get('language', None)
+        language = fixup_run.fixup_kwargs.get('language', None)
 
         if not language:
             print("Error: No 'language' config parameter specified for fixup "
@@ -117,77 +106,26 @@ class CleanupGenre(Fixup):
             return 1
 
         change = config_cleanup['change']
-        remove = config_cleanup['remove']
-        if_empty = config_cleanup['if_empty']
-
-        change_rev = reversed_change_dict(change)
-
-        if section_types is None:
-           section_types = ['movie', 'show']
-        elif isinstance(section_types, six.string_types):
-            section_types = [section_types]
-        for st in section_types:
-            if st not in ['movie', 'show']:
-                print("Error: Invalid section type specified for fixup "
-                      "{fixup}: {type}".
-                      format(fixup=FIXUP_NAME, type=st))
-                return 1
-
-        try:
-            with Watcher() as w:
-                sections = plex.library.sections()
-        except (plexapi.exceptions.PlexApiException,
-                requests.exceptions.RequestException) as exc:
-            print("Error: Cannot list sections: {msg} ({w.debug_str})".
-                  format(msg=exc, w=w))
-            return 1
-
-        for section in sections:
-
-            if section.type not in section_types:
-                continue
-            if section_pattern is not None and \
-                    re.search(section_pattern, section.title) is None:
-                if verbose:
-                    print("Skipping {s.type} section {s.title!r} "
-                          "that does not match the specified pattern".
-                          format(s=section))
-                continue
-
-            print("Processing {s.type} section {s.title!r}".
-                  format(s=section))
-
-            try:
-                with Watcher() as w:
-                    items = section.all()
-            except (plexapi.exceptions.PlexApiException,
-                    requests.exceptions.RequestException) as exc:
-                print("Error: Cannot list all items in {s.type} section "
-                      "{s.title!r}: {msg} ({w.debug_str})".
-                      format(s=section, msg=exc, w=w))
-                return 1
-
-            for item in items:
-                if item.type == 'movie':
-                    rc = process_item(dryrun, verbose, item, change,
-                                      change_rev, remove, if_empty)
-                    if rc:
-                        return rc
-                elif item.type == 'show':
-                    rc = process_item(dryrun, verbose, item, change,
-                                      change_rev, remove, if_empty)
-                    if rc:
-                        return rc
-                else:
-                    print("Error: Invalid section type {type!r} encountered in "
-                          "section {s.title!r}".
-                          format(type=item.type, s=section))
-                    return 1
-
+        fixup_run.params['change'] = change
+        fixup_run.params['change_rev'] = reversed_change_dict(change)
+        fixup_run.params['remove'] = config_cleanup['remove']
+        fixup_run.params['if_empty'] = config_cleanup['if_empty']
         return 0
 
+    def process_item(self, fixup_run, item):
+        """
+        Process one movie or show item.
+        """
+        params = fixup_run.params
+        return process_item(
+            fixup_run.dryrun, fixup_run.verbose, item, params['change'],
+            params['change_rev'], params['remove'], params['if_empty'],
+            fixup_run.edit_batcher)
+
 
-def process_item(dryrun, verbose, item, change, change_rev, remove, if_empty):
+def process_item(dryrun, verbose, item, change, change_rev, remove, if_empty,
+                 edit_batcher=None):
+    # pylint: disable=protected-access
     """
     Process one movie or show item.
 
@@ -208,6 +146,10 @@ def process_item(dryrun, verbose, item, change, change_rev, remove, if_empty):
 
       if_empty (None or string): Genre to be set if list of genres is empty.
         None means not to set a genre if list is empty.
+
+      edit_batcher (EditBatcher): Batcher for changing the genres field,
+        i.e. the change may be sent and verified later together with changes
+        of other items. None means to send and verify the change immediately.
     """
 
     dryrun_str = "Dryrun: " if dryrun else ""
@@ -262,39 +204,34 @@ def process_item(dryrun, verbose, item, change, change_rev, remove, if_empty):
 
         if not dryrun:
 
-            parm_type = plexapi.utils.SEARCHTYPES[item.type]
-
             # Delete the actual genres and add the new genres
             parms = {
-                'type': parm_type,
-                'id': item.ratingKey,
                 # This deletes the actual genres:
                 'genre[].tag.tag-': ensure_bytes(','.join(act_genre_strs)),
             }
             for i, g_str in enumerate(new_genre_strs):
                 # This adds the new genres:
                 parms['genre[{i}].tag.tag'.format(i=i)] = ensure_bytes(g_str)
-            try:
-                with Watcher() as w:
-                    item.edit(**parms)
-            except (plexapi.exceptions.PlexApiException,
-                    requests.exceptions.RequestException) as exc:
-                print("Error: Cannot change the genres field of "
-                      "{i.type} {i.title!r} from {act!r} to {new!r}: "
-                      "{msg} ({w.debug_str})".
-                      format(i=item, act=act_genre_strs, new=new_genre_strs,
-                             msg=exc, w=w))
-                return 1
-
-            # Verify the genres field was changed
-            item.reload()
-            ver_genre_strs = [g.tag for g in item.genres]
-            if ver_genre_strs != new_genre_strs:
-                print("Error: Attempt to change the genres field of "
-                      "{i.type} {i.title!r} from {act!r} to {new!r} "
-                      "did not work, it is now {ver!r}".
-                      format(i=item, new=new_genre_strs, act=act_genre_strs,
-                             ver=ver_genre_strs))
-                return 1
+            what = "change the genres field of {i.type} {i.title!r} from " \
+                "{act!r} to {new!r}". \
+                format(i=item, act=act_genre_strs, new=new_genre_strs)
+
+            def check(item):
+                """
+                Verify the genres field was changed, on a freshly loaded item.
+                """
+                ver_genre_strs = [g.tag for g in item.genres]
+                if ver_genre_strs != new_genre_strs:
+                    print("Error: Attempt to change the genres field of "
+                          "{i.type} {i.title!r} from {act!r} to {new!r} "
+                          "did not work, it is now {ver!r}".
+                          format(i=item, new=new_genre_strs,
+                                 act=act_genre_strs, ver=ver_genre_strs))
+                    return 1
+                return 0
+
+            if edit_batcher is None:
+                edit_batcher = EditBatcher(item._server)
+            return edit_batcher.edit(item, parms, what, check)
 
     return 0
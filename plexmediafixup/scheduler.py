@@ -0,0 +1,230 @@
+"""
+In-process scheduler that runs the fixups at individual intervals.
+
+The Scheduler class keeps the connection to the Plex Media Server between
+the scheduled runs, and walks the library sections with just the fixups that
+are due. Each scheduled run prepares and finishes the due fixups (see
+LibraryWalker.walk()), so that e.g. their caches do not outlive the run. The
+fixups are not kept warm between the runs on purpose: The runs are typically
+hours apart, so a cache of directory listings would be outdated by then, and
+the probe cache keeps its entries in its file anyway, so reopening it for a
+run costs next to nothing compared to the walk. The time of the last
+successful run of each fixup is persisted in the state file, so that the
+intervals are kept across restarts.
+"""
+
+from __future__ import print_function, absolute_import
+import re
+import sys
+import time
+
+from .utils.state_file import StateFileError
+from .utils.signals import sigterm_interrupts
+
+# Default interval in hours between the runs of a fixup
+DEFAULT_INTERVAL = 24
+
+# Number of seconds after which a fixup whose run failed is retried
+RETRY_DELAY = 900
+
+# Maximum number of seconds the scheduler sleeps before checking which
+# fixups are due (e.g. for fixups that are due outside of their time window)
+MAX_SLEEP = 60
+
+# Pattern for a time window 'HH:MM-HH:MM'
+TIME_WINDOW_PATTERN = r'^([01]?\d|2[0-3]):([0-5]\d)-([01]?\d|2[0-3]):([0-5]\d)$'
+
+
+def parse_time_window(time_window):
+    """
+    Parse a time window in local time.
+
+    Parameters:
+
+      time_window (string): Time window in the format 'HH:MM-HH:MM'. The
+        window may span midnight (e.g. '22:00-06:00'), and its end is
+        exclusive.
+
+    Returns:
+
+      tuple(start, end): Start and end of the window in minutes after
+        midnight.
+
+    Raises:
+      ValueError: Invalid format of the time window.
+    """
+    m = re.match(TIME_WINDOW_PATTERN, time_window)
+    if m is None:
+        raise ValueError("Invalid time window: {w!r}".format(w=time_window))
+    return (int(m.group(1)) * 60 + int(m.group(2)),
+            int(m.group(3)) * 60 + int(m.group(4)))
+
+
+def in_time_window(window, timestamp):
+    """
+    Return whether a point in time is within a time window.
+
+    Parameters:
+
+      window (tuple(start, end)): The time window, see parse_time_window().
+        None means that any time is within the window.
+
+      timestamp (float): The point in time, as seconds since the epoch.
+    """
+    if window is None:
+        return True
+    local = time.localtime(timestamp)
+    minute = local.tm_hour * 60 + local.tm_min
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+class Schedule(object):
+    # pylint: disable=too-few-public-methods
+    """
+    The schedule of one fixup.
+    """
+
+    def __init__(self, fixup_run, interval=DEFAULT_INTERVAL,
+                 time_window=None):
+        """
+        Parameters:
+
+          fixup_run (FixupRun): The fixup.
+
+          interval (int or float): Interval in hours between the starts of
+            the runs of the fixup.
+
+          time_window (string): Time window in local time in which the fixup
+            is run, in the format 'HH:MM-HH:MM'. None means any time.
+
+        Raises:
+          ValueError: Invalid format of the time window.
+        """
+        self.fixup_run = fixup_run
+        self.interval = interval * 3600
+        self.window = parse_time_window(time_window) \
+            if time_window is not None else None
+        self.last_run = None  # Start time of last successful run
+        self.retry_at = None  # Time of retry after a failed run
+
+    def next_due(self):
+        """
+        Return the time at which the fixup is due next, ignoring its time
+        window.
+        """
+        if self.retry_at is not None:
+            return self.retry_at
+        if self.last_run is None:
+            return 0
+        return self.last_run + self.interval
+
+    def is_due(self, now):
+        """
+        Return whether the fixup is due and within its time window.
+        """
+        return self.next_due() <= now and in_time_window(self.window, now)
+
+
+class Scheduler(object):
+    """
+    Scheduler that runs the fixups of a library walker at individual
+    intervals, until it is interrupted (e.g. with Ctrl-C or SIGTERM).
+    """
+
+    def __init__(self, walker, schedules):
+        """
+        Parameters:
+
+          walker (LibraryWalker): The library walker, with the fixups added.
+
+          schedules (list of Schedule): The schedules of the fixups of the
+            walker.
+        """
+        self.walker = walker
+        self.schedules = schedules
+
+    def run(self):
+        """
+        Run the fixups when they are due, until interrupted. A failed run of
+        fixups is reported and retried after RETRY_DELAY seconds.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        state = self.walker.state
+        server_id = self.walker.plex.machineIdentifier
+        if state is not None:
+            for schedule in self.schedules:
+                schedule.last_run = state.get_last_run(
+                    server_id, schedule.fixup_run.state_key)
+
+        try:
+            with sigterm_interrupts():
+                try:
+                    while True:
+                        rc = self._run_due(state, server_id)
+                        if rc:
+                            return rc
+                        self._sleep()
+                except KeyboardInterrupt:
+                    print("Stopping scheduler")
+            return 0
+        finally:
+            self.walker.cleanup_fixups()
+
+    def _run_due(self, state, server_id):
+        """
+        Run the fixups that are due, if any: Walk the library sections with
+        them and finish them.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error that ends the scheduler
+            (an error message has been printed).
+        """
+        now = time.time()
+        due = [s for s in self.schedules if s.is_due(now)]
+        if not due:
+            return 0
+
+        print("Running scheduled fixups: {names} (at {now})".
+              format(names=', '.join([s.fixup_run.name for s in due]),
+                     now=time.strftime('%Y-%m-%d %H:%M:%S',
+                                       time.localtime(now))))
+        sys.stdout.flush()
+        rc = self.walker.walk(fixup_runs=[s.fixup_run for s in due])
+        if rc:
+            print("Error: Scheduled run of fixups failed; retrying in {d} s".
+                  format(d=RETRY_DELAY))
+            sys.stdout.flush()
+            for schedule in due:
+                schedule.retry_at = time.time() + RETRY_DELAY
+            return 0
+
+        for schedule in due:
+            schedule.last_run = now
+            schedule.retry_at = None
+            if state is not None and not schedule.fixup_run.dryrun:
+                state.set_last_run(server_id, schedule.fixup_run.state_key,
+                                   int(now))
+        if state is not None:
+            try:
+                state.save()
+            except StateFileError as exc:
+                print("Error: {}".format(exc))
+                return 1
+        sys.stdout.flush()
+        return 0
+
+    def _sleep(self):
+        """
+        Sleep until the next fixup is due, but at most MAX_SLEEP seconds.
+        """
+        next_due = min([s.next_due() for s in self.schedules])
+        delay = min(max(next_due - time.time(), 1), MAX_SLEEP)
+        time.sleep(delay)
@@ -0,0 +1,296 @@
+"""
+Support for recording the HTTP exchanges with the Plex Media Server into a
+cassette file, and for replaying them from the cassette file instead of
+sending the requests, e.g. for profiling the fixups offline and for
+detecting regressions in the number of requests.
+"""
+
+from __future__ import print_function, absolute_import
+import io
+import json
+import time
+import base64
+import threading
+import collections
+import requests
+import requests.adapters
+import requests.exceptions
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from six.moves.urllib.parse import urlsplit, parse_qsl, urlencode
+
+# Version of the cassette file format. Version 2 added the matched request
+# headers to the request keys.
+CASSETTE_VERSION = 2
+
+# Query parameters and headers that are not recorded, because they contain
+# credentials
+REDACTED_PARAMS = ('X-Plex-Token',)
+
+# Request headers that select the response, and are therefore part of the
+# request key (the container paging is requested with headers, see
+# plexmediafixup.utils.library)
+MATCHED_HEADERS = ('X-Plex-Container-Start', 'X-Plex-Container-Size')
+
+# Response headers that are not recorded, because they describe the
+# transport of the response (the recorded body is already decoded), or
+# change with every recording
+_SKIPPED_HEADERS = ('content-encoding', 'transfer-encoding', 'content-length',
+                    'connection', 'keep-alive', 'date')
+
+
+class CassetteError(Exception):
+    """
+    An error with the cassette file.
+    """
+    pass
+
+
+def request_key(method, url, headers=None):
+    """
+    Return the key by which a request is matched against the recorded
+    requests: The method, the path, the query parameters in sorted order
+    without the redacted parameters, and the matched request headers that are
+    present. The scheme, host and port are ignored, so that a cassette can be
+    replayed against any server URL.
+    """
+    parts = urlsplit(url)
+    query = sorted([(name, value) for name, value in
+                    parse_qsl(parts.query, keep_blank_values=True)
+                    if name not in REDACTED_PARAMS])
+    key = '{m} {p}{q}'.format(m=method, p=parts.path,
+                              q='?' + urlencode(query) if query else '')
+    headers = CaseInsensitiveDict(headers or {})
+    matched = ['{n}: {v}'.format(n=name, v=headers[name])
+               for name in MATCHED_HEADERS if name in headers]
+    if matched:
+        key += ' [{h}]'.format(h=', '.join(matched))
+    return key
+
+
+class CassetteRecorder(object):
+    """
+    Writer of a cassette file, in JSON lines format: A header line, followed
+    by one line per HTTP exchange, in the order the responses arrived.
+
+    The recorder can be used from multiple threads.
+    """
+
+    def __init__(self, filepath):
+        """
+        Create the cassette file, replacing an existing file.
+
+        Parameters:
+
+          filepath (string): Path name of the cassette file.
+
+        Raises:
+          CassetteError: The cassette file could not be created.
+        """
+        self.filepath = filepath
+        self.count = 0  # Number of recorded exchanges
+        self._lock = threading.Lock()
+        try:
+            self._fp = io.open(filepath, 'w', encoding='utf-8')
+            self._write({'version': CASSETTE_VERSION})
+        except (IOError, OSError) as exc:
+            raise CassetteError(
+                "Cassette file {file} could not be written: {msg}".
+                format(file=filepath, msg=exc))
+
+    def _write(self, obj):
+        self._fp.write(json.dumps(obj, sort_keys=True) + u'\n')
+        self._fp.flush()
+
+    def record(self, request, response):
+        """
+        Record an HTTP exchange.
+
+        Parameters:
+
+          request (requests.PreparedRequest): The request.
+
+          response (requests.Response): The response. Its content is read.
+        """
+        content = response.content
+        try:
+            body = content.decode('utf-8')
+            body_encoding = 'utf-8'
+        except UnicodeDecodeError:
+            body = base64.b64encode(content).decode('ascii')
+            body_encoding = 'base64'
+        exchange = {
+            'request': request_key(request.method, request.url,
+                                   request.headers),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict([(k, v) for k, v in response.headers.items()
+                             if k.lower() not in _SKIPPED_HEADERS]),
+            'body': body,
+            'body_encoding': body_encoding,
+            'elapsed': round(response.elapsed.total_seconds(), 6),
+        }
+        with self._lock:
+            self._write(exchange)
+            self.count += 1
+
+    def close(self):
+        """
+        Close the cassette file.
+        """
+        with self._lock:
+            self._fp.close()
+
+
+class CassettePlayer(object):
+    """
+    Reader of a cassette file, that provides the recorded responses by
+    request. The responses for the same request are provided in the order
+    they were recorded; after that, the last one is provided again.
+
+    The player can be used from multiple threads.
+    """
+
+    def __init__(self, filepath):
+        """
+        Load the cassette file.
+
+        Parameters:
+
+          filepath (string): Path name of the cassette file.
+
+        Raises:
+          CassetteError: The cassette file could not be read or has an
+            invalid format.
+        """
+        self.filepath = filepath
+        self.count = 0  # Number of replayed exchanges
+        self.recorded = 0  # Number of recorded exchanges
+        self._lock = threading.Lock()
+        self._exchanges = collections.defaultdict(collections.deque)
+        try:
+            with io.open(filepath, 'r', encoding='utf-8') as fp:
+                lines = fp.readlines()
+        except (IOError, OSError) as exc:
+            raise CassetteError(
+                "Cassette file {file} could not be read: {msg}".
+                format(file=filepath, msg=exc))
+        try:
+            header = json.loads(lines[0]) if lines else {}
+            if header.get('version') != CASSETTE_VERSION:
+                raise ValueError("unsupported version {v!r}".
+                                 format(v=header.get('version')))
+            for line in lines[1:]:
+                exchange = json.loads(line)
+                self._exchanges[exchange['request']].append(exchange)
+                self.recorded += 1
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            raise CassetteError(
+                "Cassette file {file} has an invalid format: {msg}".
+                format(file=filepath, msg=exc))
+
+    def play(self, method, url, headers=None):
+        """
+        Return the next recorded exchange for a request, or None if no
+        exchange has been recorded for it.
+        """
+        key = request_key(method, url, headers)
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                return None
+            exchange = exchanges[0]
+            if len(exchanges) > 1:
+                exchanges.popleft()
+            self.count += 1
+            return exchange
+
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """
+    Transport adapter that sends the requests and records the exchanges in a
+    cassette file.
+    """
+
+    def __init__(self, recorder, **kwargs):
+        """
+        Parameters:
+
+          recorder (CassetteRecorder): The recorder.
+
+          **kwargs: Keyword arguments for HTTPAdapter.
+        """
+        self.recorder = recorder
+        super(RecordingAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        # pylint: disable=arguments-differ
+        """
+        Send a request and record the exchange.
+        """
+        response = super(RecordingAdapter, self).send(request, **kwargs)
+        if not kwargs.get('stream', False):
+            self.recorder.record(request, response)
+        return response
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """
+    Transport adapter that does not send the requests, but returns the
+    recorded responses from a cassette file.
+
+    A request for which no response has been recorded fails with
+    requests.exceptions.ConnectionError.
+    """
+
+    def __init__(self, player, simulate_latency=False):
+        """
+        Parameters:
+
+          player (CassettePlayer): The player.
+
+          simulate_latency (bool): Delay each response by its recorded
+            elapsed time.
+        """
+        super(ReplayAdapter, self).__init__()
+        self.player = player
+        self.simulate_latency = simulate_latency
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        # pylint: disable=too-many-arguments
+        """
+        Return the recorded response for a request.
+        """
+        exchange = self.player.play(request.method, request.url,
+                                    request.headers)
+        if exchange is None:
+            raise requests.exceptions.ConnectionError(
+                "No recorded response in cassette {file} for request {req}".
+                format(file=self.player.filepath,
+                       req=request_key(request.method, request.url,
+                                       request.headers)),
+                request=request)
+        if self.simulate_latency:
+            time.sleep(exchange['elapsed'])
+        if exchange['body_encoding'] == 'base64':
+            content = base64.b64decode(exchange['body'])
+        else:
+            content = exchange['body'].encode('utf-8')
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.reason = exchange['reason']
+        response.headers = CaseInsensitiveDict(exchange['headers'])
+        response.headers['Content-Length'] = str(len(content))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        """
+        Nothing to close.
+        """
+        pass
@@ -3,6 +3,7 @@ Support for config files in YAML format that are validated using JSON schema.
 """
 
 from __future__ import print_function, absolute_import
+import os
 import errno
 import yaml  # PyYAML package
 import yamlloader
@@ -60,6 +61,15 @@ class ConfigFile(object):
         """
         return self._json_schema
 
+    def abspath(self, path):
+        """
+        Return the specified path name as an absolute path name, where a
+        relative path name is relative to the directory of the config file.
+        """
+        if os.path.isabs(path):
+            return path
+        return os.path.join(os.path.dirname(self.filepath), path)
+
     def help(self):
         """
         Returns a help text string explaining the structure of the config file,
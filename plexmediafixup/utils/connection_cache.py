@@ -0,0 +1,160 @@
+"""
+Support for a cache file that persists the resolution of indirect connections
+to a Plex Media Server between runs.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import time
+import errno
+import yaml  # PyYAML package
+import yamlloader
+
+# Default number of hours after which a cached connection is resolved again
+DEFAULT_TTL = 24
+
+
+class ConnectionCacheError(Exception):
+    """
+    An error with the connection cache file.
+    """
+    pass
+
+
+class ConnectionCache(object):
+    """
+    A cache file in YAML format that persists the authentication token of a
+    Plex account and the last working connection URI and access token of a
+    server of that account, so that later runs can connect to the server
+    directly instead of logging in to the Plex account and trying all
+    advertised connections of the server.
+
+    The cache file contains authentication tokens, so it is saved with
+    permissions for the owner only.
+
+    The structure of the cache file is:
+
+        connections:
+          <Plex account user name>:
+            <server name>:
+              account_token: <authentication token of Plex account>
+              server_uri: <last working connection URI of server>
+              server_token: <access token of server>
+              resolved_at: <timestamp>
+    """
+
+    def __init__(self, filepath, ttl=DEFAULT_TTL):
+        """
+        Initialize the object. Does not yet load the cache file.
+
+        Parameters:
+
+            filepath (string): Path name of the cache file.
+
+            ttl (int or float): Number of hours after which a cached
+              connection expires.
+        """
+        self._filepath = filepath
+        self.ttl = ttl
+        self._data = {}
+
+    @property
+    def filepath(self):
+        """
+        string: Path name of the cache file.
+        """
+        return self._filepath
+
+    def load(self):
+        """
+        Load the cache file. A cache file that does not exist is treated as
+        empty.
+
+        Raises:
+            ConnectionCacheError: The cache file could not be read or parsed.
+        """
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as fp:
+                data = yaml.safe_load(fp)
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                raise ConnectionCacheError(
+                    "Connection cache file {file} could not be opened: {msg}".
+                    format(file=self.filepath, msg=exc))
+            data = None
+        except yaml.YAMLError as exc:
+            raise ConnectionCacheError(
+                "Cannot parse connection cache file {file} as YAML: {msg}".
+                format(file=self.filepath, msg=exc))
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ConnectionCacheError(
+                "Connection cache file {file} has an invalid format".
+                format(file=self.filepath))
+        self._data = data
+
+    def save(self):
+        """
+        Save the cache file.
+
+        Raises:
+            ConnectionCacheError: The cache file could not be written.
+        """
+        data = yaml.dump(
+            self._data, encoding=None, allow_unicode=True,
+            default_flow_style=False, indent=4,
+            Dumper=yamlloader.ordereddict.CSafeDumper)
+        try:
+            fd = os.open(self.filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o600)
+            with open(fd, 'w', encoding='utf-8') as fp:
+                # The permissions of os.open() only apply when the file is
+                # created, so an existing file is restricted here, before the
+                # tokens are written to it.
+                if hasattr(os, 'fchmod'):
+                    os.fchmod(fd, 0o600)
+                fp.write(data)
+        except (IOError, OSError) as exc:
+            raise ConnectionCacheError(
+                "Connection cache file {file} could not be written: {msg}".
+                format(file=self.filepath, msg=exc))
+
+    def get(self, username, server_name):
+        """
+        Return the cached connection to a server of a Plex account, or None
+        if there is none or it has expired.
+
+        Returns:
+
+          dict: The cached connection, with items 'account_token',
+            'server_uri', 'server_token' and 'resolved_at'.
+        """
+        connections = self._data.get('connections', {})
+        connection = connections.get(username, {}).get(server_name, None)
+        if not isinstance(connection, dict):
+            return None
+        resolved_at = connection.get('resolved_at', 0)
+        if time.time() - resolved_at > self.ttl * 3600:
+            return None
+        return connection
+
+    def set(self, username, server_name, account_token, server_uri,
+            server_token):
+        """
+        Set the connection to a server of a Plex account, as resolved now.
+        """
+        connections = self._data.setdefault('connections', {})
+        connections.setdefault(username, {})[server_name] = {
+            'account_token': account_token,
+            'server_uri': server_uri,
+            'server_token': server_token,
+            'resolved_at': int(time.time()),
+        }
+
+    def remove(self, username, server_name):
+        """
+        Remove the cached connection to a server of a Plex account, if any.
+        """
+        connections = self._data.get('connections', {})
+        connections.get(username, {}).pop(server_name, None)
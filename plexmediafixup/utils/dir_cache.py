@@ -0,0 +1,115 @@
+"""
+Support for a cache of directory listings.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import threading
+import collections
+
+# Default maximum number of directories whose listings are cached
+DEFAULT_MAX_DIRS = 1024
+
+
+class DirCache(object):
+    """
+    A cache of the listings of the directories of local media files, that
+    answers existence, size and modification time queries for the files in
+    them.
+
+    Each directory is listed once using os.scandir(), when a file in it is
+    queried for the first time. On network storage, this replaces a
+    round-trip for each existence query by one directory listing. The stat
+    results of the files are taken from the directory entries and cached
+    with them: On Windows, the file attributes are returned along with the
+    listing; on POSIX systems, os.DirEntry.stat() still stats the file once.
+
+    A file that is not in the listing of its directory is checked directly,
+    so that files added after the directory was listed are found, and so
+    that the name matching of case-insensitive file systems applies.
+
+    The listings are not refreshed, so the cache should only be used for the
+    duration of a single run, and should be cleared using clear() before it
+    is used for another run. The least recently used listings are discarded
+    when the maximum number of directories is exceeded.
+
+    The cache can be used from multiple threads.
+    """
+
+    def __init__(self, max_dirs=DEFAULT_MAX_DIRS):
+        """
+        Parameters:
+
+          max_dirs (int): Maximum number of directories whose listings are
+            cached.
+        """
+        self.max_dirs = max_dirs
+        self._lock = threading.Lock()
+        self._dirs = collections.OrderedDict()  # Entries by directory path
+        self._dir_locks = {}  # Locks of directories being listed
+
+    def clear(self):
+        """
+        Discard the cached directory listings.
+        """
+        with self._lock:
+            self._dirs.clear()
+
+    def exists(self, path):
+        """
+        Return a boolean indicating whether the specified file (or directory)
+        exists.
+        """
+        dirpath, name = os.path.split(path)
+        if name in self._entries(dirpath):
+            return True
+        return os.path.exists(path)
+
+    def stat(self, path):
+        """
+        Return the stat result (os.stat_result) of the specified file,
+        following symbolic links, or None if the file does not exist or
+        cannot be accessed.
+        """
+        dirpath, name = os.path.split(path)
+        entry = self._entries(dirpath).get(name)
+        try:
+            if entry is None:
+                return os.stat(path)
+            return entry.stat()
+        except OSError:
+            return None
+
+    def _entries(self, dirpath):
+        """
+        Return the directory entries of the specified directory as a dict of
+        os.DirEntry objects by file name, listing the directory if needed. A
+        directory that cannot be listed has no entries.
+        """
+        with self._lock:
+            entries = self._dirs.get(dirpath)
+            if entries is not None:
+                self._dirs.move_to_end(dirpath)
+                return entries
+            dir_lock = self._dir_locks.setdefault(dirpath, threading.Lock())
+
+        # The directory is listed outside of the cache lock, so that a slow
+        # listing does not block queries for other directories. The
+        # directory lock lets concurrent queries for the same directory wait
+        # for a single listing.
+        with dir_lock:
+            with self._lock:
+                entries = self._dirs.get(dirpath)
+            if entries is not None:
+                return entries
+            try:
+                entries = {entry.name: entry
+                           for entry in os.scandir(dirpath or os.curdir)}
+            except OSError:
+                entries = {}
+            with self._lock:
+                self._dirs[dirpath] = entries
+                self._dir_locks.pop(dirpath, None)
+                while len(self._dirs) > self.max_dirs:
+                    self._dirs.popitem(last=False)
+        return entries
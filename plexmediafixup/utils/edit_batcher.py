@@ -0,0 +1,219 @@
+"""
+Support for editing items of a Plex Media Server in batches.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import threading
+from collections import OrderedDict
+import plexapi
+import plexapi.exceptions
+import plexapi.utils
+import requests.exceptions
+from .unicode import ensure_unicode
+from .watcher import Watcher
+
+# Default maximum number of items per multi-item edit request
+DEFAULT_FLUSH_SIZE = 1
+
+# Default maximum time in seconds a pending edit is held back
+DEFAULT_FLUSH_INTERVAL = 10.0
+
+# Number of seconds the rating keys of the items whose edits have been sent
+# are remembered, see EditBatcher.recently_edited()
+RECENT_EDIT_TIME = 60.0
+
+
+class _EditGroup(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Pending edits with identical parameters.
+    """
+
+    def __init__(self, section_id, parm_type, parms):
+        self.section_id = section_id
+        self.parm_type = parm_type
+        self.parms = parms
+        self.created = time.time()
+        self.entries = []  # list of tuple(item, what, check)
+
+
+class EditBatcher(object):
+    """
+    Collects pending edits of items, and sends the edits with identical
+    parameters as a single multi-item edit request to the PMS (i.e. with a
+    comma-separated list of rating keys in the 'id' parameter).
+
+    A group of pending edits is sent when it has reached the flush size, or
+    when an edit is added after the group has been held back for the flush
+    interval. The remaining groups are sent by flush().
+
+    The sent edits are verified using an EditVerifier object, or immediately
+    by reloading each edited item if no verifier is specified.
+
+    The rating keys of the items whose edits have been sent are remembered for
+    RECENT_EDIT_TIME seconds, so that the notifications the PMS sends about
+    these edits can be told apart from other changes (see
+    recently_edited()).
+
+    Edits can be added from multiple threads.
+    """
+
+    def __init__(self, plex, flush_size=DEFAULT_FLUSH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, verifier=None):
+        """
+        Parameters:
+
+          plex (plexapi.PlexServer): PMS to work against.
+
+          flush_size (int): Maximum number of items per multi-item edit
+            request. 1 means that each edit is sent immediately.
+
+          flush_interval (float): Maximum time in seconds a pending edit is
+            held back before it is sent with the next added edit.
+
+          verifier (EditVerifier): Verifier for the sent edits. None means to
+            verify each sent edit immediately by reloading the item.
+        """
+        self._plex = plex
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.verifier = verifier
+        self._lock = threading.Lock()
+        self._groups = OrderedDict()  # _EditGroup by group key
+        self._sent = OrderedDict()  # Send time by rating key, oldest first
+
+    def edit(self, item, parms, what, check):
+        """
+        Add an edit of an item. Any groups of pending edits that are due are
+        sent, including the group of this edit.
+
+        Parameters:
+
+          item (plexapi.video.Video): The item to be edited.
+
+          parms (dict): The edit parameters for the PMS, e.g.
+            {'titleSort.value': 'abc', 'titleSort.locked': 1}. The 'type'
+            and 'id' parameters are added automatically.
+
+          what (string): Description of the edit for error messages, e.g.
+            "set the sort title field of movie 'Abc' to 'abc'".
+
+          check (callable): Function that verifies the edit. It is called with
+            a freshly loaded copy of the item after the edit has been sent,
+            and returns a return code (0 if the edit did stick, 1 after an
+            error message has been printed).
+
+        Returns:
+
+          int: Return code of sending any due groups of pending edits: 0 for
+            success, 1 for error (an error message has been printed).
+        """
+        parm_type = plexapi.utils.SEARCHTYPES[item.type]
+        parms = [(k, ensure_unicode(v)) for k, v in parms.items()
+                 if k not in ('type', 'id')]
+        key = (item.librarySectionID, parm_type, tuple(sorted(parms)))
+        now = time.time()
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = _EditGroup(item.librarySectionID, parm_type,
+                                   dict(parms))
+                self._groups[key] = group
+            group.entries.append((item, what, check))
+            due_keys = [k for k, g in self._groups.items()
+                        if len(g.entries) >= self.flush_size or
+                        now - g.created >= self.flush_interval]
+            due_groups = [self._groups.pop(k) for k in due_keys]
+        return self._send_groups(due_groups)
+
+    def flush(self):
+        """
+        Send all groups of pending edits.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        with self._lock:
+            groups = list(self._groups.values())
+            self._groups.clear()
+        return self._send_groups(groups)
+
+    def recently_edited(self, rating_key):
+        """
+        Return whether an edit of an item has been sent within the last
+        RECENT_EDIT_TIME seconds.
+
+        Parameters:
+
+          rating_key (string or int): Rating key of the item.
+
+        Returns:
+
+          bool: The item has been edited recently.
+        """
+        with self._lock:
+            self._expire_sent(time.time())
+            return str(rating_key) in self._sent
+
+    def _remember_sent(self, group):
+        """
+        Remember the rating keys of the items of a group that is being sent.
+        """
+        now = time.time()
+        with self._lock:
+            for item, _, _ in group.entries:
+                rating_key = str(item.ratingKey)
+                self._sent.pop(rating_key, None)
+                self._sent[rating_key] = now
+            self._expire_sent(now)
+
+    def _expire_sent(self, now):
+        # Must be called with the lock held
+        while self._sent:
+            rating_key, sent = next(iter(self._sent.items()))
+            if now - sent < RECENT_EDIT_TIME:
+                break
+            del self._sent[rating_key]
+
+    def _send_groups(self, groups):
+        rc = 0
+        for group in groups:
+            _rc = self._send(group)
+            rc = rc or _rc
+        return rc
+
+    def _send(self, group):
+        """
+        Send one group of pending edits as a multi-item edit request and
+        verify the edited items, or record them for verification.
+        """
+        args = dict(group.parms)
+        args['type'] = group.parm_type
+        args['id'] = ','.join([str(item.ratingKey)
+                               for item, _, _ in group.entries])
+        path = '/library/sections/{sid}/all{args}'. \
+            format(sid=group.section_id, args=plexapi.utils.joinArgs(args))
+        # The PMS may notify about the edit before the request returns
+        self._remember_sent(group)
+        try:
+            with Watcher() as w:
+                # pylint: disable=protected-access
+                self._plex.query(path, method=self._plex._session.put)
+        except (plexapi.exceptions.PlexApiException,
+                requests.exceptions.RequestException) as exc:
+            for _, what, _ in group.entries:
+                print("Error: Cannot {what}: {msg} ({w.debug_str})".
+                      format(what=what, msg=exc, w=w))
+            return 1
+        rc = 0
+        for item, _, check in group.entries:
+            if self.verifier is not None:
+                self.verifier.expect(item, check)
+            else:
+                item.reload()
+                _rc = check(item)
+                rc = rc or _rc
+        return rc
@@ -0,0 +1,122 @@
+"""
+Support for verifying edits of items of a Plex Media Server in bulk.
+"""
+
+from __future__ import print_function, absolute_import
+import threading
+import plexapi
+import plexapi.exceptions
+import requests.exceptions
+from .library import fetch_metadata_items
+from .watcher import Watcher
+
+# Verification modes
+VERIFY_FULL = 'full'  # Verify all edits
+VERIFY_SAMPLED = 'sampled'  # Verify a percentage of the edits
+VERIFY_OFF = 'off'  # Do not verify edits
+VERIFY_MODES = [VERIFY_FULL, VERIFY_SAMPLED, VERIFY_OFF]
+
+# Default percentage of edits verified in sampled mode
+DEFAULT_SAMPLE_PERCENT = 10
+
+# Maximum number of items fetched per multi-item metadata request
+VERIFY_BATCH_SIZE = 100
+
+
+class EditVerifier(object):
+    """
+    Records the expected outcome of edits of items, and verifies them later
+    in bulk, by fetching the metadata of the edited items with multi-item
+    metadata requests.
+
+    In sampled mode, an evenly spread percentage of the edits is verified.
+
+    Edits can be recorded from multiple threads.
+    """
+
+    def __init__(self, plex, mode=VERIFY_FULL,
+                 sample_percent=DEFAULT_SAMPLE_PERCENT):
+        """
+        Parameters:
+
+          plex (plexapi.PlexServer): PMS to work against.
+
+          mode (string): Verification mode, one of VERIFY_MODES.
+
+          sample_percent (int): Percentage of edits that are verified in
+            sampled mode.
+        """
+        self._plex = plex
+        self.mode = mode
+        self.sample_percent = sample_percent
+        self._lock = threading.Lock()
+        self._credit = 0
+        self._pending = []  # list of tuple(item, check)
+
+    def expect(self, item, check):
+        """
+        Record the expected outcome of an edit of an item, for later
+        verification.
+
+        Parameters:
+
+          item (plexapi.video.Video): The edited item.
+
+          check (callable): Function that is called with a freshly fetched
+            copy of the item, and that returns a return code (0 if the edit
+            did stick, 1 after an error message has been printed).
+        """
+        if self.mode == VERIFY_OFF:
+            return
+        with self._lock:
+            if self.mode == VERIFY_SAMPLED:
+                # The credit is accounted in percent, because adding up
+                # fractions would lose edits to rounding errors.
+                self._credit += self.sample_percent
+                if self._credit < 100:
+                    return
+                self._credit -= 100
+            self._pending.append((item, check))
+
+    def verify(self):
+        """
+        Verify all recorded edits. A failed verification is reported for
+        each item.
+
+        Returns:
+
+          int: Return code: 0 for success, 1 for error (an error message has
+            been printed).
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+
+        rc = 0
+        for i in range(0, len(pending), VERIFY_BATCH_SIZE):
+            chunk = pending[i:i + VERIFY_BATCH_SIZE]
+            rating_keys = []
+            for item, _ in chunk:
+                if item.ratingKey not in rating_keys:
+                    rating_keys.append(item.ratingKey)
+            try:
+                with Watcher() as w:
+                    items = fetch_metadata_items(self._plex, rating_keys)
+            except (plexapi.exceptions.PlexApiException,
+                    requests.exceptions.RequestException) as exc:
+                print("Error: Cannot fetch {n} edited items for "
+                      "verification: {msg} ({w.debug_str})".
+                      format(n=len(rating_keys), msg=exc, w=w))
+                return 1
+            fresh_items = dict([(str(fi.ratingKey), fi) for fi in items])
+            for item, check in chunk:
+                fresh_item = fresh_items.get(str(item.ratingKey))
+                if fresh_item is None:
+                    print("Error: Cannot verify edit of {i.type} {i.title!r}, "
+                          "the item was not found anymore".
+                          format(i=item))
+                    rc = 1
+                    continue
+                _rc = check(fresh_item)
+                rc = rc or _rc
+        return rc
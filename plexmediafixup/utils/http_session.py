@@ -0,0 +1,198 @@
+"""
+Support for the HTTP session used for the connections to the Plex Media
+Server.
+"""
+
+from __future__ import print_function, absolute_import
+import contextlib
+import requests
+import requests.adapters
+from urllib3.util.retry import Retry
+from .rate_limiter import current_rate_limiter
+from .cassette import RecordingAdapter, ReplayAdapter
+
+# Default number of additional connections in the connection pool, beyond
+# the number of jobs (e.g. for listing requests in the main thread and for
+# sending batched edits)
+POOL_SIZE_EXTRA = 2
+
+# Default number of times a request that failed with a transient error is
+# retried
+DEFAULT_RETRIES = 3
+
+# Default backoff factor for retrying requests: The n-th retry waits for
+# backoff_factor * 2 ** (n - 1) seconds (unless the PMS specified a
+# Retry-After time).
+DEFAULT_BACKOFF_FACTOR = 0.5
+
+# HTTP status codes of transient errors, for which a request is retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RateLimitedRetry(Retry):
+    """
+    A retry configuration whose retries of a request are rate limited like
+    the request itself, by the rate limiter of the current thread.
+
+    The retries are made by urllib3 underneath the request method of the
+    session, in the thread that made the request.
+    """
+
+    def increment(self, *args, **kwargs):
+        # pylint: disable=signature-differs
+        """
+        Count a retry, and wait for the rate limiter of the current thread
+        (if any) before the retry is made.
+        """
+        retry = super(RateLimitedRetry, self).increment(*args, **kwargs)
+        limiter = current_rate_limiter()
+        if limiter is not None:
+            limiter.acquire()
+        return retry
+
+
+class RateLimitedSession(requests.Session):
+    """
+    A requests session whose requests are rate limited by the rate limiter
+    of the work the current thread is doing (see
+    plexmediafixup.utils.rate_limiter.rate_limited()).
+
+    Each attempt of a request takes a token: The request method takes one
+    for the first attempt, and RateLimitedRetry takes one for each retry.
+    """
+
+    def request(self, *args, **kwargs):
+        # pylint: disable=arguments-differ
+        """
+        Send a request, after waiting for the rate limiter of the current
+        thread (if any).
+        """
+        limiter = current_rate_limiter()
+        if limiter is not None:
+            limiter.acquire()
+        return super(RateLimitedSession, self).request(*args, **kwargs)
+
+
+def create_session(pool_size, compression=True, retries=DEFAULT_RETRIES,
+                   backoff_factor=DEFAULT_BACKOFF_FACTOR, recorder=None,
+                   player=None, replay_latency=False):
+    # pylint: disable=too-many-arguments
+    """
+    Create a requests session for the connections to the Plex Media Server.
+
+    The session keeps its connections alive across requests, and keeps up to
+    pool_size connections per host, so that concurrent requests from multiple
+    worker threads do not serialize on a single connection, and do not pay
+    the TCP/TLS setup for each request.
+
+    Idempotent requests (e.g. GET and PUT, but not POST) that fail with a
+    transient error (a connection error, a timeout, or one of the
+    RETRY_STATUSES) are retried with exponential backoff. If the retries are
+    exhausted, the last error is surfaced as usual.
+
+    The requests and their retries are rate limited by the rate limiter of
+    the work the current thread is doing, see RateLimitedSession.
+
+    If a cassette recorder is specified, the exchanges of the session are
+    recorded in its cassette file. If a cassette player is specified, the
+    requests of the session are not sent, but answered with the responses
+    recorded in its cassette file (see plexmediafixup.utils.cassette).
+
+    Parameters:
+
+      pool_size (int): Maximum number of connections kept alive per host.
+        This should be at least the number of concurrent requests.
+
+      compression (bool): Request compressed responses ('Accept-Encoding:
+        gzip, deflate'). Otherwise, uncompressed responses are requested.
+
+      retries (int): Maximum number of retries of a request. 0 means that
+        requests are not retried.
+
+      backoff_factor (int or float): Backoff factor for the retries, see
+        DEFAULT_BACKOFF_FACTOR.
+
+      recorder (CassetteRecorder): Cassette recorder, or None.
+
+      player (CassettePlayer): Cassette player, or None.
+
+      replay_latency (bool): Delay the replayed responses by their recorded
+        elapsed time.
+
+    Returns:
+
+      requests.Session: The new session.
+    """
+    session = RateLimitedSession()
+    max_retries = RateLimitedRetry(
+        total=retries, connect=retries, read=retries, status=retries,
+        backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True, raise_on_status=False)
+    if player:
+        adapter = ReplayAdapter(player, replay_latency)
+    elif recorder:
+        adapter = RecordingAdapter(
+            recorder, pool_connections=4, pool_maxsize=pool_size,
+            max_retries=max_retries)
+    else:
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4, pool_maxsize=pool_size,
+            max_retries=max_retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+    session.headers['Accept-Encoding'] = \
+        'gzip, deflate' if compression else 'identity'
+    return session
+
+
+@contextlib.contextmanager
+def retries_disabled(session):
+    """
+    Context manager that disables the retries of the requests of a session
+    created with create_session() while the context is active, e.g. for
+    trying a connection that has a faster fallback than retrying it.
+
+    The retry configuration is changed on the adapters of the session, so
+    the session must not be used concurrently by other threads while the
+    context is active.
+
+    Parameters:
+
+      session (requests.Session): The session.
+    """
+    adapters = [adapter for adapter in set(session.adapters.values())
+                if isinstance(adapter, requests.adapters.HTTPAdapter)]
+    saved_retries = [adapter.max_retries for adapter in adapters]
+    for adapter in adapters:
+        adapter.max_retries = Retry(0, read=False)
+    try:
+        yield session
+    finally:
+        for adapter, max_retries in zip(adapters, saved_retries):
+            adapter.max_retries = max_retries
+
+
+def session_timeout(connect_timeout, read_timeout, default_timeout):
+    """
+    Return the timeout for the requests of a session, in the form accepted
+    by requests.
+
+    Parameters:
+
+      connect_timeout (int or float): Timeout in seconds for establishing a
+        connection, or None for the default timeout.
+
+      read_timeout (int or float): Timeout in seconds for waiting for data
+        of the response, or None for the default timeout.
+
+      default_timeout (int or float): Default timeout in seconds (e.g. the
+        plexapi.timeout parameter of the PlexAPI config file).
+
+    Returns:
+
+      tuple(connect_timeout, read_timeout): The timeout.
+    """
+    return (connect_timeout if connect_timeout is not None
+            else default_timeout,
+            read_timeout if read_timeout is not None else default_timeout)
@@ -0,0 +1,281 @@
+"""
+Support for listing the items of library sections of a Plex Media Server.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import calendar
+import email.utils
+import plexapi.utils
+
+# Default number of items that are requested from the PMS per page
+DEFAULT_PAGE_SIZE = 200
+
+# Value of the 'type' query parameter for listing the episodes of a show
+# section (the Plex search type of episodes)
+EPISODE_TYPE = 4
+
+# Default number of items whose full metadata is fetched per request
+DEFAULT_PREFETCH_BATCH_SIZE = 50
+
+
+def iter_section_pages(section, page_size=DEFAULT_PAGE_SIZE, params=None):
+    """
+    Generator that lists the items of a library section page by page, using
+    the container start/size window of the PMS.
+
+    Each page is yielded as soon as it has arrived. The generator does not
+    keep a reference to a page once the next page is requested, so earlier
+    pages can be garbage collected while the section is processed.
+
+    Parameters:
+
+      section (plexapi.library.LibrarySection): The library section.
+
+      page_size (int): Maximum number of items per page.
+
+      params (dict): Additional query parameters for the listing request,
+        e.g. a 'type' filter. None means no additional parameters.
+
+    Yields:
+
+      list of plexapi.video.Video: The items of the next page.
+
+    Raises:
+
+      plexapi.exceptions.PlexApiException: Error returned by the PMS.
+      requests.exceptions.RequestException: Error in the HTTP communication.
+    """
+    start = 0
+    while True:
+        page, total_size = fetch_section_page(section, start, page_size,
+                                              params)
+        if not page:
+            break
+        start += len(page)
+        last_page = start >= total_size if total_size is not None \
+            else len(page) < page_size
+        yield page
+        page = None
+        if last_page:
+            break
+
+
+def fetch_section_page(section, start, page_size, params=None):
+    """
+    Fetch one page of the items of a library section, using the container
+    start/size window of the PMS.
+
+    Parameters:
+
+      section (plexapi.library.LibrarySection): The library section.
+
+      start (int): Index of the first item of the page.
+
+      page_size (int): Maximum number of items in the page.
+
+      params (dict): Additional query parameters for the listing request,
+        e.g. a 'type' filter. None means no additional parameters.
+
+    Returns:
+
+      tuple(page, total_size): The items of the page as a list of
+        plexapi.video.Video objects, and the total number of items in the
+        section as reported by the PMS (or None if not reported).
+
+    Raises:
+
+      plexapi.exceptions.PlexApiException: Error returned by the PMS.
+      requests.exceptions.RequestException: Error in the HTTP communication.
+    """
+    key = '/library/sections/{key}/all{args}'. \
+        format(key=section.key, args=plexapi.utils.joinArgs(params or {}))
+    headers = {
+        'X-Plex-Container-Start': str(start),
+        'X-Plex-Container-Size': str(page_size),
+    }
+    # pylint: disable=protected-access
+    data = section._server.query(key, headers=headers)
+    page = section.findItems(data, initpath=key)
+    total_size = data.attrib.get('totalSize')
+    if total_size is not None:
+        total_size = int(total_size)
+    return page, total_size
+
+
+def iter_section_items(section, page_size=DEFAULT_PAGE_SIZE, params=None):
+    """
+    Generator that lists the items of a library section one by one, fetching
+    them page by page from the PMS. See iter_section_pages() for details.
+
+    Yields:
+
+      plexapi.video.Video: The next item.
+    """
+    for page in iter_section_pages(section, page_size, params):
+        for item in page:
+            yield item
+
+
+def item_changed_at(item):
+    """
+    Return the time of the last change of an item, as the later one of its
+    updatedAt and addedAt attributes.
+
+    Parameters:
+
+      item (plexapi.video.Video): The item.
+
+    Returns:
+
+      int: The time of the last change as seconds since the epoch, or None if
+        the PMS did not report it.
+    """
+    timestamps = []
+    for dt in (item.updatedAt, item.addedAt):
+        if dt is None:
+            continue
+        if dt.tzinfo is not None:
+            timestamps.append(calendar.timegm(dt.utctimetuple()))
+        else:
+            # plexapi creates naive datetime objects in local time
+            timestamps.append(int(time.mktime(dt.timetuple())))
+    return max(timestamps) if timestamps else None
+
+
+def server_time(plex):
+    """
+    Return the current time of the PMS, from the Date header of the response
+    to a request for its identity. If the PMS does not send a Date header,
+    the local time is returned.
+
+    Parameters:
+
+      plex (plexapi.PlexServer): PMS to work against.
+
+    Returns:
+
+      int: The current time of the PMS as seconds since the epoch.
+
+    Raises:
+
+      requests.exceptions.RequestException: Error in the HTTP communication,
+        or error returned by the PMS.
+    """
+    # pylint: disable=protected-access
+    response = plex._session.get(plex.url('/identity'),
+                                 headers=plex._headers(),
+                                 timeout=plex._timeout)
+    response.raise_for_status()
+    date = response.headers.get('Date')
+    parsed = email.utils.parsedate_tz(date) if date else None
+    if parsed is None:
+        return int(time.time())
+    return int(email.utils.mktime_tz(parsed))
+
+
+def fetch_metadata_items(plex, rating_keys):
+    """
+    Fetch the full metadata of multiple items with a single request, using
+    a comma-separated list of rating keys.
+
+    Parameters:
+
+      plex (plexapi.PlexServer): PMS to work against.
+
+      rating_keys (iterable): The rating keys of the items.
+
+    Returns:
+
+      list of plexapi.video.Video: The items that were found. Items that do
+        not exist (anymore) are omitted.
+
+    Raises:
+
+      plexapi.exceptions.PlexApiException: Error returned by the PMS.
+      requests.exceptions.RequestException: Error in the HTTP communication.
+    """
+    key = '/library/metadata/{keys}'. \
+        format(keys=','.join([str(k) for k in rating_keys]))
+    data = plex.query(key)
+    return plex.findItems(data, initpath=key)
+
+
+def fetch_full_items(plex, rating_keys,
+                     batch_size=DEFAULT_PREFETCH_BATCH_SIZE):
+    """
+    Fetch the full metadata of items by their rating keys, in batches of
+    multiple items per request.
+
+    Parameters:
+
+      plex (plexapi.PlexServer): PMS to work against.
+
+      rating_keys (iterable): The rating keys of the items.
+
+      batch_size (int): Maximum number of items per request.
+
+    Returns:
+
+      list of plexapi.video.Video: The items that were found, as full objects
+        (i.e. isFullObject() returns True). Items that do not exist (anymore)
+        are omitted.
+
+    Raises:
+
+      plexapi.exceptions.PlexApiException: Error returned by the PMS.
+      requests.exceptions.RequestException: Error in the HTTP communication.
+    """
+    # pylint: disable=protected-access
+    rating_keys = list(rating_keys)
+    items = []
+    for i in range(0, len(rating_keys), batch_size):
+        batch = fetch_metadata_items(plex, rating_keys[i:i + batch_size])
+        for item in batch:
+            # The item has been loaded from the data of its details key, so
+            # it is a full object.
+            item._initpath = getattr(item, '_details_key', None) or item.key
+        items.extend(batch)
+    return items
+
+
+def prefetch_full_items(plex, items, batch_size=DEFAULT_PREFETCH_BATCH_SIZE):
+    """
+    Fetch the full metadata of items that are not yet full objects, in
+    batches of multiple items per request, and load it into the items.
+
+    Afterwards, the items are full objects (i.e. isFullObject() returns True)
+    and do not need to be reloaded individually. Items whose metadata was not
+    returned by the PMS are left unchanged.
+
+    Parameters:
+
+      plex (plexapi.PlexServer): PMS to work against.
+
+      items (iterable of plexapi.video.Video): The items.
+
+      batch_size (int): Maximum number of items per request.
+
+    Raises:
+
+      plexapi.exceptions.PlexApiException: Error returned by the PMS.
+      requests.exceptions.RequestException: Error in the HTTP communication.
+    """
+    # pylint: disable=protected-access
+    partial_items = [item for item in items if not item.isFullObject()]
+    for i in range(0, len(partial_items), batch_size):
+        batch = partial_items[i:i + batch_size]
+        key = '/library/metadata/{keys}'. \
+            format(keys=','.join([str(item.ratingKey) for item in batch]))
+        data = plex.query(key)
+        elems = dict([(elem.attrib.get('ratingKey'), elem) for elem in data])
+        for item in batch:
+            elem = elems.get(str(item.ratingKey))
+            if elem is None:
+                continue
+            # The item is now loaded from the data of its details key, so it
+            # is a full object.
+            item._initpath = getattr(item, '_details_key', None) or item.key
+            load_data = getattr(item, '_invalidateCacheAndLoadData', None) or \
+                item._loadData
+            load_data(elem)
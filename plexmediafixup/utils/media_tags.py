@@ -0,0 +1,548 @@
+"""
+Support for reading the title tag of media files in-process, without running
+ffprobe.
+
+The supported container formats are Matroska/WebM (Segment Info Title and
+global TITLE tags), MP4/QuickTime (moov/udta/meta/ilst and moov/udta
+'\xa9nam' atoms) and AVI (RIFF LIST/INFO/INAM chunk). Only the element, atom
+and chunk headers and the small metadata elements are read; the media data is
+skipped by seeking over it.
+"""
+
+from __future__ import print_function, absolute_import
+import io
+import struct
+import six
+
+# The title tag atom in MP4 files
+MP4_TITLE_ATOM = b'\xa9nam'
+
+# EBML IDs in Matroska files
+_EBML = 0x1A45DFA3
+_EBML_DOCTYPE = 0x4282
+_SEGMENT = 0x18538067
+_SEEKHEAD = 0x114D9B74
+_SEEK = 0x4DBB
+_SEEK_ID = 0x53AB
+_SEEK_POSITION = 0x53AC
+_INFO = 0x1549A966
+_TITLE = 0x7BA9
+_CLUSTER = 0x1F43B675
+_TAGS = 0x1254C367
+_TAG = 0x7373
+_TARGETS = 0x63C0
+_TAG_TRACK_UID = 0x63C5
+_TAG_CHAPTER_UID = 0x63C4
+_TAG_ATTACHMENT_UID = 0x63C6
+_SIMPLE_TAG = 0x67C8
+_TAG_NAME = 0x45A3
+_TAG_STRING = 0x4487
+
+# Maximum size of a metadata element that is read into memory
+_MAX_ELEMENT_SIZE = 16 * 1024 * 1024
+
+# Maximum number of top level elements inspected before the first cluster of
+# a Matroska file
+_MAX_TOP_LEVEL_ELEMENTS = 64
+
+
+class MediaTagsError(Exception):
+    """
+    The media file has an unsupported format or is malformed.
+    """
+    pass
+
+
+class TitleDecodeError(Exception):
+    """
+    The title tag of a media file could not be decoded using any of the
+    specified encodings.
+    """
+
+    def __init__(self, raw_title, encodings):
+        super(TitleDecodeError, self).__init__(
+            "Cannot decode title tag {raw!r} using any of the encodings {encs}".
+            format(raw=raw_title, encs=','.join(encodings)))
+        self.raw_title = raw_title
+        self.encodings = encodings
+
+
+def read_title_tag(media_file, avi_encodings=('utf-8',)):
+    """
+    Read the title tag of a media file in-process, if its container format is
+    supported.
+
+    Parameters:
+
+      media_file (string): Path name of the media file.
+
+      avi_encodings (iterable of string): Encodings that are tried in order
+        when decoding the title tag of AVI files. The title tag of AVI files
+        is often not encoded in UTF-8, but e.g. in cp1252.
+
+    Returns:
+
+      tuple(supported, title): Boolean indicating whether the container
+        format of the media file is supported and the file could be read,
+        and the title tag as a unicode string (None if the media file has no
+        title tag). If the format is not supported, the title tag needs to be
+        retrieved in a different way, e.g. using ffprobe.
+
+    Raises:
+
+      TitleDecodeError: The title tag of an AVI file could not be decoded.
+    """
+    try:
+        with io.open(media_file, 'rb') as fp:
+            head = fp.read(12)
+            fp.seek(0)
+            if head[0:4] == b'\x1a\x45\xdf\xa3':
+                return True, read_mkv_title(fp)
+            if head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide',
+                             b'skip'):
+                return True, read_mp4_title(fp)
+            if head[0:4] == b'RIFF' and head[8:12] == b'AVI ':
+                return True, read_avi_title(fp, avi_encodings)
+    except (IOError, OSError, MediaTagsError, struct.error):
+        pass
+    return False, None
+
+
+def _decode(data):
+    """
+    Decode a string value from the metadata of a media file.
+    """
+    return data.rstrip(b'\x00').decode('utf-8', 'replace')
+
+
+def _read_exactly(fp, size):
+    """
+    Read the specified number of bytes from the file.
+    """
+    if size > _MAX_ELEMENT_SIZE:
+        raise MediaTagsError("Metadata element too large: {} bytes".
+                             format(size))
+    data = fp.read(size)
+    if len(data) != size:
+        raise MediaTagsError("Unexpected end of file")
+    return data
+
+
+def _ebml_vint(data, pos, keep_marker):
+    """
+    Decode a variable size integer (an element ID or size) in EBML data.
+
+    Returns:
+
+      tuple(value, length): The value (None for an unknown size) and the
+        length of the encoded integer in bytes.
+    """
+    if pos >= len(data):
+        raise MediaTagsError("Truncated EBML variable size integer")
+    first = six.indexbytes(data, pos)
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8 or pos + length > len(data):
+        raise MediaTagsError("Invalid EBML variable size integer")
+    value = first if keep_marker else first & (mask - 1)
+    all_ones = value == mask - 1
+    for i in range(1, length):
+        byte = six.indexbytes(data, pos + i)
+        all_ones = all_ones and byte == 0xFF
+        value = (value << 8) | byte
+    if not keep_marker and all_ones:
+        value = None
+    return value, length
+
+
+def _ebml_read_header(fp):
+    """
+    Read an element header from the file.
+
+    Returns:
+
+      tuple(id, size): The element ID and data size (None for unknown size),
+        or (None, None) at the end of the file.
+    """
+    data = fp.read(12)
+    if not data:
+        return None, None
+    if len(data) < 2:
+        raise MediaTagsError("Unexpected end of file")
+    elem_id, id_len = _ebml_vint(data, 0, keep_marker=True)
+    size, size_len = _ebml_vint(data, id_len, keep_marker=False)
+    fp.seek(id_len + size_len - len(data), 1)
+    return elem_id, size
+
+
+def _ebml_children(data):
+    """
+    Generator for the child elements in the data of an EBML master element.
+
+    Yields:
+
+      tuple(id, data): The element ID and data of each child element.
+    """
+    pos = 0
+    while pos < len(data):
+        elem_id, id_len = _ebml_vint(data, pos, keep_marker=True)
+        size, size_len = _ebml_vint(data, pos + id_len, keep_marker=False)
+        pos += id_len + size_len
+        if size is None:
+            size = len(data) - pos
+        yield elem_id, data[pos:pos + size]
+        pos += size
+
+
+def _ebml_uint(data):
+    value = 0
+    for i in range(len(data)):
+        value = (value << 8) | six.indexbytes(data, i)
+    return value
+
+
+def read_mkv_title(fp):
+    """
+    Read the title tag of a Matroska/WebM file, like ffprobe reports it: The
+    title in the Segment Info element, overridden by a TITLE tag that does
+    not target a specific track, chapter or attachment.
+
+    The top level elements are inspected up to the first cluster; a Tags
+    element after the clusters is found via the seek head.
+
+    Parameters:
+
+      fp (file): The media file, opened in binary mode.
+
+    Returns:
+
+      unicode string: The title tag, or None if the file has no title tag.
+
+    Raises:
+
+      MediaTagsError: The file is not a supported Matroska file.
+    """
+
+    elem_id, size = _ebml_read_header(fp)
+    if elem_id != _EBML or size is None:
+        raise MediaTagsError("Not a Matroska file")
+    for child_id, child_data in _ebml_children(_read_exactly(fp, size)):
+        if child_id == _EBML_DOCTYPE and \
+                _decode(child_data) not in ('matroska', 'webm'):
+            raise MediaTagsError("Unsupported EBML document type")
+
+    elem_id, size = _ebml_read_header(fp)
+    if elem_id != _SEGMENT:
+        raise MediaTagsError("No Matroska segment found")
+    segment_pos = fp.tell()
+    segment_end = segment_pos + size if size is not None else None
+
+    title = None
+    tags_title = None
+    seek_heads = []  # positions of seek heads not yet read
+    tags_pos = None
+    seen = set()
+    for _ in range(_MAX_TOP_LEVEL_ELEMENTS):
+        pos = fp.tell()
+        if segment_end is not None and pos >= segment_end:
+            break
+        elem_id, size = _ebml_read_header(fp)
+        if elem_id is None and segment_end is not None:
+            raise MediaTagsError("Unexpected end of file")
+        if elem_id is None or elem_id == _CLUSTER:
+            break
+        if size is None:
+            raise MediaTagsError("Top level element of unknown size")
+        seen.add(pos)
+        if elem_id == _INFO:
+            for child_id, child_data in \
+                    _ebml_children(_read_exactly(fp, size)):
+                if child_id == _TITLE:
+                    title = _decode(child_data)
+        elif elem_id == _TAGS:
+            tags_title = _mkv_tags_title(_read_exactly(fp, size))
+            tags_pos = pos
+        elif elem_id == _SEEKHEAD:
+            for seek_id, seek_pos in \
+                    _mkv_seek_entries(_read_exactly(fp, size)):
+                if seek_id == _TAGS and tags_pos is None:
+                    tags_pos = segment_pos + seek_pos
+                elif seek_id == _SEEKHEAD:
+                    seek_heads.append(segment_pos + seek_pos)
+        else:
+            fp.seek(size, 1)
+    else:
+        raise MediaTagsError("Too many top level elements")
+
+    # Follow a seek head that points to a further seek head
+    for pos in seek_heads:
+        if pos in seen or tags_pos is not None:
+            continue
+        fp.seek(pos)
+        elem_id, size = _ebml_read_header(fp)
+        if elem_id == _SEEKHEAD and size is not None:
+            for seek_id, seek_pos in \
+                    _mkv_seek_entries(_read_exactly(fp, size)):
+                if seek_id == _TAGS:
+                    tags_pos = segment_pos + seek_pos
+
+    if tags_pos is not None and tags_pos not in seen:
+        fp.seek(tags_pos)
+        elem_id, size = _ebml_read_header(fp)
+        if elem_id != _TAGS or size is None:
+            raise MediaTagsError("Invalid seek position for tags")
+        tags_title = _mkv_tags_title(_read_exactly(fp, size))
+
+    if tags_title is not None:
+        return tags_title
+    return title
+
+
+def _mkv_seek_entries(data):
+    """
+    Generator for the entries of a seek head, as tuple(id, position).
+    """
+    for seek_elem_id, seek_data in _ebml_children(data):
+        if seek_elem_id != _SEEK:
+            continue
+        seek_id = seek_pos = None
+        for child_id, child_data in _ebml_children(seek_data):
+            if child_id == _SEEK_ID:
+                seek_id = _ebml_uint(child_data)
+            elif child_id == _SEEK_POSITION:
+                seek_pos = _ebml_uint(child_data)
+        if seek_id is not None and seek_pos is not None:
+            yield seek_id, seek_pos
+
+
+def _mkv_tags_title(data):
+    """
+    Return the value of the last TITLE simple tag of the tags that do not
+    target a specific track, chapter or attachment, or None.
+    """
+    title = None
+    for tag_id, tag_data in _ebml_children(data):
+        if tag_id != _TAG:
+            continue
+        is_global = True
+        simple_tags = []
+        for child_id, child_data in _ebml_children(tag_data):
+            if child_id == _TARGETS:
+                for target_id, target_data in _ebml_children(child_data):
+                    if target_id in (_TAG_TRACK_UID, _TAG_CHAPTER_UID,
+                                     _TAG_ATTACHMENT_UID) and \
+                            _ebml_uint(target_data):
+                        is_global = False
+            elif child_id == _SIMPLE_TAG:
+                simple_tags.append(child_data)
+        if not is_global:
+            continue
+        for simple_tag in simple_tags:
+            name = value = None
+            for child_id, child_data in _ebml_children(simple_tag):
+                if child_id == _TAG_NAME:
+                    name = _decode(child_data)
+                elif child_id == _TAG_STRING:
+                    value = _decode(child_data)
+            if name is not None and name.upper() == 'TITLE' and \
+                    value is not None:
+                title = value
+    return title
+
+
+def _mp4_atoms(fp, end):
+    """
+    Generator for the atoms in a range of an MP4 file, reading only their
+    headers. The file is positioned at the data of each yielded atom.
+
+    Yields:
+
+      tuple(type, size): The atom type and the size of its data.
+    """
+    pos = fp.tell()
+    while end is None or pos + 8 <= end:
+        fp.seek(pos)
+        header = fp.read(8)
+        if len(header) < 8:
+            if end is not None:
+                # The enclosing atom extends beyond the end of the file
+                raise MediaTagsError("Unexpected end of file")
+            break
+        size, atom_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', _read_exactly(fp, 8))[0]
+            header_size = 16
+        elif size == 0:
+            if end is None:
+                fp.seek(0, 2)
+                size = fp.tell() - pos
+                fp.seek(pos + header_size)
+            else:
+                size = end - pos
+        if size < header_size:
+            raise MediaTagsError("Invalid MP4 atom size")
+        yield atom_type, size - header_size
+        pos += size
+
+
+def read_mp4_title(fp):
+    """
+    Read the title tag of an MP4/QuickTime file, like ffprobe reports it:
+    The value of the '\xa9nam' atom in moov/udta/meta/ilst, or of a
+    QuickTime style '\xa9nam' atom in moov/udta.
+
+    Parameters:
+
+      fp (file): The media file, opened in binary mode.
+
+    Returns:
+
+      unicode string: The title tag, or None if the file has no title tag.
+
+    Raises:
+
+      MediaTagsError: The file is not a supported MP4 file.
+    """
+    title = None
+    for atom_type, size in _mp4_atoms(fp, None):
+        if atom_type != b'moov':
+            continue
+        moov_end = fp.tell() + size
+        for moov_type, moov_size in _mp4_atoms(fp, moov_end):
+            if moov_type != b'udta':
+                continue
+            udta_end = fp.tell() + moov_size
+            for udta_type, udta_size in _mp4_atoms(fp, udta_end):
+                if udta_type == MP4_TITLE_ATOM:
+                    value = _mp4_quicktime_string(
+                        _read_exactly(fp, udta_size))
+                    if value is not None:
+                        title = value
+                elif udta_type == b'meta':
+                    value = _mp4_meta_title(fp, fp.tell() + udta_size)
+                    if value is not None:
+                        title = value
+        return title
+    raise MediaTagsError("No MP4 movie atom found")
+
+
+def _mp4_quicktime_string(data):
+    """
+    Return the value of a QuickTime style text atom (16-bit length, 16-bit
+    language code, string), or None.
+    """
+    if len(data) < 4:
+        return None
+    length = struct.unpack('>H', data[0:2])[0]
+    return _decode(data[4:4 + length])
+
+
+def _mp4_meta_title(fp, meta_end):
+    """
+    Return the value of the title atom in a meta atom, or None.
+    """
+    # The meta atom is a full atom with version and flags in MP4 files, but
+    # not in QuickTime files.
+    meta_pos = fp.tell()
+    header = _read_exactly(fp, 8)
+    if header[4:8] == b'hdlr':
+        fp.seek(meta_pos)
+    else:
+        fp.seek(meta_pos + 4)
+    title = None
+    for meta_type, meta_size in _mp4_atoms(fp, meta_end):
+        if meta_type != b'ilst':
+            continue
+        ilst_end = fp.tell() + meta_size
+        for ilst_type, ilst_size in _mp4_atoms(fp, ilst_end):
+            if ilst_type != MP4_TITLE_ATOM:
+                continue
+            item_end = fp.tell() + ilst_size
+            for data_type, data_size in _mp4_atoms(fp, item_end):
+                if data_type != b'data' or data_size < 8:
+                    continue
+                data = _read_exactly(fp, data_size)
+                # Type indicator 1 is UTF-8 text, 2 is UTF-16 text
+                type_indicator = struct.unpack('>I', data[0:4])[0] & 0xFFFFFF
+                if type_indicator == 2:
+                    title = data[8:].decode('utf-16-be', 'replace')
+                else:
+                    title = _decode(data[8:])
+    return title
+
+
+def read_avi_title(fp, encodings):
+    """
+    Read the title tag of an AVI file, i.e. the INAM chunk in the LIST/INFO
+    chunk of the first RIFF chunk, and decode it using the first of the
+    specified encodings that succeeds.
+
+    Parameters:
+
+      fp (file): The media file, opened in binary mode.
+
+      encodings (iterable of string): Encodings that are tried in order.
+
+    Returns:
+
+      unicode string: The title tag, or None if the file has no title tag.
+
+    Raises:
+
+      MediaTagsError: The file is not a supported AVI file.
+      TitleDecodeError: The title tag could not be decoded.
+    """
+    header = _read_exactly(fp, 12)
+    if header[0:4] != b'RIFF' or header[8:12] != b'AVI ':
+        raise MediaTagsError("Not an AVI file")
+    riff_size = struct.unpack('<I', header[4:8])[0]
+    # Some writers leave the size of the RIFF chunk at 0
+    end = 8 + riff_size if riff_size else None
+
+    raw_title = None
+    pos = 12
+    while end is None or pos + 8 <= end:
+        fp.seek(pos)
+        chunk_header = fp.read(8)
+        if len(chunk_header) < 8:
+            if end is not None:
+                # The RIFF chunk extends beyond the end of the file
+                raise MediaTagsError("Unexpected end of file")
+            break
+        chunk_id, size = struct.unpack('<4sI', chunk_header)
+        if chunk_id == b'LIST' and size >= 4 and fp.read(4) == b'INFO':
+            data = _read_exactly(fp, size - 4)
+            for sub_id, sub_data in _riff_chunks(data):
+                if sub_id == b'INAM':
+                    raw_title = sub_data
+        # Chunks are padded to an even size
+        pos += 8 + size + (size & 1)
+
+    if raw_title is None:
+        return None
+    raw_title = raw_title.rstrip(b'\x00')
+    for encoding in encodings:
+        try:
+            return raw_title.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    raise TitleDecodeError(raw_title, encodings)
+
+
+def _riff_chunks(data):
+    """
+    Generator for the sub-chunks in the data of a RIFF LIST chunk.
+
+    Yields:
+
+      tuple(id, data): The chunk ID and data of each sub-chunk.
+    """
+    pos = 0
+    while pos + 8 <= len(data):
+        chunk_id, size = struct.unpack('<4sI', data[pos:pos + 8])
+        yield chunk_id, data[pos + 8:pos + 8 + size]
+        pos += 8 + size + (size & 1)
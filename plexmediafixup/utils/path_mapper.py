@@ -0,0 +1,83 @@
+"""
+Support for mapping the path names of media files on the PMS to local path
+names.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+
+# Key of a node in the path mapping index that holds the mapping whose server
+# root ends at that node. Path name components are strings, so it cannot
+# collide with them.
+_MAPPING = None
+
+
+class PathMapper(object):
+    """
+    Maps the path names of media files on the PMS to local path names, using
+    the path mappings from the config file.
+
+    The path mappings are compiled once into an index keyed by the path name
+    components of their (normalized) server roots, so that mapping a path
+    name takes one walk down the index instead of normalizing and comparing
+    each path mapping. As before, the first path mapping in the list whose
+    server root is a prefix of the path name is used.
+
+    The object can be used from multiple threads.
+    """
+
+    def __init__(self, path_mappings):
+        """
+        Parameters:
+
+          path_mappings (list of dict): The path mappings, as a list of dicts
+            with items 'server' and 'local' that specify the root directories
+            on the PMS and locally. The root directories may use any path
+            separator.
+        """
+        self._path_mappings = path_mappings
+        self._index = {}
+        for i, mapping in enumerate(path_mappings):
+            server_root = mapping.get('server').replace('\\', '/')
+            if server_root.endswith('/'):
+                server_root = server_root[:-1]
+            local_root = mapping.get('local'). \
+                replace('\\', os.path.sep).replace('/', os.path.sep)
+            node = self._index
+            for name in server_root.split('/'):
+                node = node.setdefault(name, {})
+            # The first path mapping for a server root wins.
+            node.setdefault(_MAPPING, (i, local_root))
+
+    @property
+    def path_mappings(self):
+        """
+        list of dict: The path mappings, as specified.
+        """
+        return self._path_mappings
+
+    def local_path(self, server_path):
+        """
+        Return the local path name for a path name on the PMS, or None if no
+        path mapping applies to it.
+
+        The server_path may use any path separator. The returned local path
+        name uses the path separator of the OS running this module.
+        """
+        names = server_path.replace('\\', '/').split('/')
+        found = None
+        node = self._index
+        # The last name is the file name, whose path name cannot end at a
+        # server root because the server roots are directories.
+        for depth, name in enumerate(names[:-1]):
+            node = node.get(name)
+            if node is None:
+                break
+            mapping = node.get(_MAPPING)
+            if mapping is not None and (found is None or
+                                        mapping[0] < found[0][0]):
+                found = mapping, depth + 1
+        if found is None:
+            return None
+        (_, local_root), depth = found
+        return os.path.join(local_root, os.path.sep.join(names[depth:]))
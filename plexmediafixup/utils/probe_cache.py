@@ -0,0 +1,222 @@
+"""
+Support for a persistent cache of the results of probing media files.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import sqlite3
+import threading
+
+# Version of the database schema of the probe cache. A cache file with a
+# different version is discarded.
+SCHEMA_VERSION = 1
+
+# Default number of days after which an entry that has not been used is evicted
+DEFAULT_MAX_AGE = 30
+
+# Default number of stored entries after which they are committed to the cache
+# file. Committing each entry on its own would sync the file for every probed
+# media file.
+DEFAULT_COMMIT_SIZE = 100
+
+
+class ProbeCacheError(Exception):
+    """
+    An error with the probe cache file.
+    """
+    pass
+
+
+class ProbeCache(object):
+    """
+    A cache of the title tags of media files in an SQLite database file.
+
+    An entry is keyed by the local path name of the media file, and is valid
+    only as long as the size and modification time of the file are unchanged.
+    An entry for a changed file is replaced when the file is probed again.
+    Entries that have not been used for the maximum age (e.g. for files that
+    have been deleted or renamed) are evicted when the cache is closed.
+
+    Stored entries are committed to the cache file in batches, and when the
+    cache is closed. Entries stored since the last commit are lost if the
+    process dies; their media files are then simply probed again.
+
+    The cache can be used from multiple threads.
+    """
+
+    def __init__(self, filepath, max_age=DEFAULT_MAX_AGE,
+                 commit_size=DEFAULT_COMMIT_SIZE):
+        """
+        Initialize the object. Does not yet open the cache file.
+
+        Parameters:
+
+            filepath (string): Path name of the cache file.
+
+            max_age (int): Number of days after which an entry that has not
+              been used is evicted.
+
+            commit_size (int): Number of stored entries after which they are
+              committed to the cache file.
+        """
+        self._filepath = filepath
+        self.max_age = max_age
+        self.commit_size = commit_size
+        self._uncommitted = 0  # Number of entries stored since the commit
+        self._lock = threading.Lock()
+        self._conn = None
+        self._used = set()  # Paths of the entries used since opening
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def filepath(self):
+        """
+        string: Path name of the cache file.
+        """
+        return self._filepath
+
+    @property
+    def is_open(self):
+        """
+        bool: The cache file is open.
+        """
+        return self._conn is not None
+
+    def open(self):
+        """
+        Open the cache file, creating it if it does not exist.
+
+        Raises:
+            ProbeCacheError: The cache file could not be opened.
+        """
+        try:
+            conn = sqlite3.connect(self.filepath, check_same_thread=False)
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                conn.execute('DROP TABLE IF EXISTS probe')
+                conn.execute(
+                    'CREATE TABLE probe (path TEXT PRIMARY KEY, '
+                    'size INTEGER, mtime REAL, title TEXT, '
+                    'last_used INTEGER)')
+                conn.execute('PRAGMA user_version = {v}'.
+                             format(v=SCHEMA_VERSION))
+                conn.commit()
+        except sqlite3.Error as exc:
+            raise ProbeCacheError(
+                "Probe cache file {file} could not be opened: {msg}".
+                format(file=self.filepath, msg=exc))
+        self._conn = conn
+
+    def close(self):
+        """
+        Record the use of the entries that have been used, evict the entries
+        that have not been used for the maximum age, and close the cache
+        file.
+
+        Raises:
+            ProbeCacheError: The cache file could not be updated.
+        """
+        if self._conn is None:
+            return
+        now = int(time.time())
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    'UPDATE probe SET last_used = ? WHERE path = ?',
+                    [(now, path) for path in self._used])
+                self._conn.execute(
+                    'DELETE FROM probe WHERE last_used < ?',
+                    (now - self.max_age * 24 * 3600,))
+                self._conn.commit()
+            except sqlite3.Error as exc:
+                raise ProbeCacheError(
+                    "Probe cache file {file} could not be updated: {msg}".
+                    format(file=self.filepath, msg=exc))
+            finally:
+                self._conn.close()
+                self._conn = None
+                self._used = set()
+                self._uncommitted = 0
+
+    def clear(self):
+        """
+        Remove all entries from the cache file.
+
+        Raises:
+            ProbeCacheError: The cache file could not be updated.
+        """
+        with self._lock:
+            try:
+                self._conn.execute('DELETE FROM probe')
+                self._conn.commit()
+                self._uncommitted = 0
+            except sqlite3.Error as exc:
+                raise ProbeCacheError(
+                    "Probe cache file {file} could not be cleared: {msg}".
+                    format(file=self.filepath, msg=exc))
+
+    def get(self, path, size, mtime):
+        """
+        Look up the title tag of a media file.
+
+        Parameters:
+
+            path (unicode string): Local path name of the media file.
+
+            size (int): Size of the media file in bytes.
+
+            mtime (float): Modification time of the media file.
+
+        Returns:
+
+            tuple(hit, title): Boolean indicating whether a valid entry was
+              found, and the cached title tag (None if the file has no title
+              tag).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT size, mtime, title FROM probe WHERE path = ?',
+                (path,)).fetchone()
+            if row is None or row[0] != size or row[1] != mtime:
+                self.misses += 1
+                return False, None
+            self._used.add(path)
+            self.hits += 1
+            return True, row[2]
+
+    def put(self, path, size, mtime, title):
+        """
+        Store the title tag of a media file, replacing any existing entry for
+        the file. The entry is committed to the cache file together with the
+        next entries, see commit_size.
+
+        Parameters:
+
+            path (unicode string): Local path name of the media file.
+
+            size (int): Size of the media file in bytes.
+
+            mtime (float): Modification time of the media file.
+
+            title (unicode string): The title tag, or None if the file has no
+              title tag.
+
+        Raises:
+            ProbeCacheError: The cache file could not be updated.
+        """
+        with self._lock:
+            try:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO probe '
+                    '(path, size, mtime, title, last_used) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (path, size, mtime, title, int(time.time())))
+                self._uncommitted += 1
+                if self._uncommitted >= self.commit_size:
+                    self._conn.commit()
+                    self._uncommitted = 0
+            except sqlite3.Error as exc:
+                raise ProbeCacheError(
+                    "Probe cache file {file} could not be updated: {msg}".
+                    format(file=self.filepath, msg=exc))
@@ -0,0 +1,116 @@
+"""
+Support for probing media files concurrently.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Default number of media files that are probed concurrently
+DEFAULT_PROBE_JOBS = 4
+
+# Default number of media files that are probed concurrently on the same
+# mount point
+DEFAULT_PROBE_JOBS_PER_MOUNT = 2
+
+
+class ProbePool(object):
+    """
+    A pool of worker threads that probe media files concurrently, e.g. by
+    running ffprobe subprocesses.
+
+    Media files are submitted ahead of the time their result is needed, and
+    the result of a media file is picked up later by its path name. The
+    number of concurrent probes is limited in total and per mount point, so
+    that a single disk is not thrashed.
+
+    Media files can be submitted and their results picked up from multiple
+    threads.
+    """
+
+    def __init__(self, func, jobs=DEFAULT_PROBE_JOBS,
+                 jobs_per_mount=DEFAULT_PROBE_JOBS_PER_MOUNT):
+        """
+        Parameters:
+
+          func (callable): Function that probes a media file. It is called
+            with the path name of the media file, and its return value or
+            exception is the result of the media file.
+
+          jobs (int): Maximum number of media files that are probed
+            concurrently.
+
+          jobs_per_mount (int): Maximum number of media files that are probed
+            concurrently on the same mount point.
+        """
+        self._func = func
+        self.jobs = jobs
+        self.jobs_per_mount = jobs_per_mount
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._lock = threading.Lock()
+        self._futures = {}  # Pending futures by path name
+        self._mounts = {}  # Mount points by directory path name
+        self._mount_semaphores = {}  # Semaphores by mount point
+
+    def submit(self, path):
+        """
+        Submit a media file for probing, unless it is already pending.
+        """
+        with self._lock:
+            if path not in self._futures:
+                self._futures[path] = self._executor.submit(self._probe, path)
+
+    def result(self, path):
+        """
+        Return the result of probing a media file, waiting for it if needed.
+        A media file that has not been submitted is submitted first.
+
+        Raises:
+          Exception: The exception raised by the probe function.
+        """
+        self.submit(path)
+        with self._lock:
+            future = self._futures.pop(path)
+        return future.result()
+
+    def shutdown(self):
+        """
+        Cancel the media files that are not yet being probed, and wait for
+        the running probes to complete.
+        """
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+        self._executor.shutdown(wait=True)
+
+    def _probe(self, path):
+        """
+        Probe a media file in a worker thread, limited by the semaphore of
+        its mount point.
+        """
+        with self._mount_semaphore(path):
+            return self._func(path)
+
+    def _mount_semaphore(self, path):
+        """
+        Return the semaphore for the mount point of a media file.
+        """
+        dirpath = os.path.dirname(os.path.abspath(path))
+        with self._lock:
+            mount = self._mounts.get(dirpath)
+        if mount is None:
+            mount = dirpath
+            while not os.path.ismount(mount):
+                parent = os.path.dirname(mount)
+                if parent == mount:
+                    break
+                mount = parent
+        with self._lock:
+            self._mounts[dirpath] = mount
+            semaphore = self._mount_semaphores.get(mount)
+            if semaphore is None:
+                semaphore = threading.Semaphore(self.jobs_per_mount)
+                self._mount_semaphores[mount] = semaphore
+        return semaphore
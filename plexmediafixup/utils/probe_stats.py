@@ -0,0 +1,116 @@
+"""
+Support for statistics about probing media files.
+"""
+
+from __future__ import print_function, absolute_import
+import math
+import threading
+
+
+class ProbeStats(object):
+    """
+    Statistics about the media files that have been probed: The time needed
+    for probing each media file, the probes that timed out, and (if
+    recorded) the number of bytes read from each media file.
+
+    The statistics of a media file can be recorded in one thread (e.g. a
+    worker thread of a ProbePool) and picked up in another thread, so that
+    they can be printed together with the output for the item.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}  # Byte counts by path name, not yet picked up
+        self._latencies = []  # Probe times in seconds
+        self.max_latency = 0.0  # Maximum probe time in seconds
+        self.max_latency_file = None  # Path name of that file
+        self.timeouts = 0  # Number of probes that timed out
+        self.deferred = 0  # Number of items deferred due to slow media files
+        self.files = 0  # Number of media files with byte counts
+        self.bytes_read = 0  # Total number of bytes read
+        self.seeks = 0  # Total number of seeks
+        self.max_bytes_read = 0  # Maximum number of bytes read from a file
+        self.max_bytes_file = None  # Path name of that file
+
+    def add_latency(self, path, seconds):
+        """
+        Record the time needed for probing a media file.
+        """
+        with self._lock:
+            if self.max_latency_file is None or seconds > self.max_latency:
+                self.max_latency = seconds
+                self.max_latency_file = path
+            self._latencies.append(seconds)
+
+    def add_timeout(self):
+        """
+        Record a probe that timed out.
+        """
+        with self._lock:
+            self.timeouts += 1
+
+    def add_deferred(self):
+        """
+        Record an item that was deferred due to slow media files.
+        """
+        with self._lock:
+            self.deferred += 1
+
+    def add(self, path, bytes_read, seeks):
+        """
+        Record the number of bytes read and seeks for probing a media file.
+        """
+        with self._lock:
+            self._files[path] = (bytes_read, seeks)
+            self.files += 1
+            self.bytes_read += bytes_read
+            self.seeks += seeks
+            if bytes_read > self.max_bytes_read:
+                self.max_bytes_read = bytes_read
+                self.max_bytes_file = path
+
+    def pop(self, path):
+        """
+        Pick up the byte counts recorded for a media file.
+
+        Returns:
+
+          tuple(bytes_read, seeks): The statistics of the media file, or None
+            if no byte counts have been recorded for it.
+        """
+        with self._lock:
+            return self._files.pop(path, None)
+
+    def percentile(self, percent):
+        """
+        Return the specified percentile of the probe times in seconds (using
+        the nearest-rank method), or None if no media files have been probed.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        rank = int(math.ceil(percent / 100.0 * len(latencies)))
+        return latencies[max(rank, 1) - 1]
+
+    def summary(self):
+        """
+        Return a one-line summary of the statistics.
+        """
+        if not self._latencies:
+            return "no media files probed"
+        result = "{n} media files probed, probe time p50 {p50:.3f} s, " \
+            "p95 {p95:.3f} s, max {max:.3f} s for {file!r}, {t} timeouts, " \
+            "{d} items deferred". \
+            format(n=len(self._latencies), p50=self.percentile(50),
+                   p95=self.percentile(95), max=self.max_latency,
+                   file=self.max_latency_file, t=self.timeouts,
+                   d=self.deferred)
+        if self.files:
+            result += ", {b} bytes read by ffprobe ({avg} per file, " \
+                "max {max} for {file!r}), {s} seeks". \
+                format(b=self.bytes_read,
+                       avg=self.bytes_read // self.files,
+                       max=self.max_bytes_read, file=self.max_bytes_file,
+                       s=self.seeks)
+        return result
@@ -0,0 +1,83 @@
+"""
+Support for limiting the rate of the requests to the Plex Media Server.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import threading
+import contextlib
+
+# Rate limiter of the work the current thread is doing (e.g. processing an
+# item for a fixup)
+_current = threading.local()
+
+
+class RateLimiter(object):
+    """
+    A token bucket that limits the rate of requests.
+
+    Tokens are added to the bucket at the configured rate, up to the burst
+    size. Each request takes a token, and waits for it if the bucket is
+    empty. The waiting requests reserve their tokens in order, so that they
+    are spread out at the configured rate.
+
+    The rate limiter can be used from multiple threads.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Parameters:
+
+          rate (int or float): Maximum number of requests per second.
+
+          burst (int or float): Maximum number of requests that can be made
+            at once after a period without requests. None means the rate,
+            but at least 1.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst) if burst is not None else max(self.rate, 1.0)
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._last = time.monotonic()
+        self.waits = 0  # Number of requests that had to wait
+        self.wait_time = 0.0  # Total time in seconds requests have waited
+
+    def acquire(self):
+        """
+        Take a token for a request, waiting until it is available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait > 0:
+                self.waits += 1
+                self.wait_time += wait
+        if wait > 0:
+            time.sleep(wait)
+
+
+def current_rate_limiter():
+    """
+    Return the rate limiter of the work the current thread is doing, or None
+    if its requests are not rate limited.
+    """
+    return getattr(_current, 'limiter', None)
+
+
+@contextlib.contextmanager
+def rate_limited(limiter):
+    """
+    Context manager that makes the specified rate limiter the rate limiter
+    of the current thread while the context is active. None means that the
+    requests are not rate limited.
+    """
+    saved_limiter = current_rate_limiter()
+    _current.limiter = limiter
+    try:
+        yield limiter
+    finally:
+        _current.limiter = saved_limiter
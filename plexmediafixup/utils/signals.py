@@ -0,0 +1,37 @@
+"""
+Support for stopping the long-running modes (daemon, scheduler) with signals.
+"""
+
+from __future__ import print_function, absolute_import
+import signal
+import threading
+import contextlib
+
+
+def _interrupt(signum, frame):
+    # pylint: disable=unused-argument
+    """
+    Signal handler that raises KeyboardInterrupt, like Ctrl-C does.
+    """
+    raise KeyboardInterrupt
+
+
+@contextlib.contextmanager
+def sigterm_interrupts():
+    """
+    Context manager that makes a SIGTERM signal (e.g. from a service manager
+    that stops the daemon) raise KeyboardInterrupt in the main thread while
+    the context is active, so that it stops the program the same way as
+    Ctrl-C does. The previous signal handler is restored afterwards.
+
+    Nothing is changed when the context is not entered in the main thread,
+    because signal handlers can only be set there.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    saved_handler = signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, saved_handler)
@@ -0,0 +1,136 @@
+"""
+Support for a state file that persists information between runs.
+"""
+
+from __future__ import print_function, absolute_import
+import errno
+import yaml  # PyYAML package
+import yamlloader
+
+
+class StateFileError(Exception):
+    """
+    An error with the state file.
+    """
+    pass
+
+
+class StateFile(object):
+    """
+    A state file in YAML format that persists the high-water marks of the
+    change timestamps (updatedAt/addedAt) of the items that have been
+    processed, per server, library section and fixup.
+
+    In addition, it persists the time of the last successful scheduled run
+    of each fixup, per server.
+
+    The structure of the state file is:
+
+        watermarks:
+          <server machine identifier>:
+            <library section uuid>:
+              <fixup key>: <timestamp>
+        last_runs:
+          <server machine identifier>:
+            <fixup key>: <timestamp>
+    """
+
+    def __init__(self, filepath):
+        """
+        Initialize the object. Does not yet load the state file.
+
+        Parameters:
+
+            filepath (string): Path name of the state file.
+        """
+        self._filepath = filepath
+        self._data = {}
+
+    @property
+    def filepath(self):
+        """
+        string: Path name of the state file.
+        """
+        return self._filepath
+
+    def load(self):
+        """
+        Load the state file. A state file that does not exist is treated as
+        empty.
+
+        Raises:
+            StateFileError: The state file could not be read or parsed.
+        """
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as fp:
+                data = yaml.safe_load(fp)
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                raise StateFileError(
+                    "State file {file} could not be opened: {msg}".
+                    format(file=self.filepath, msg=exc))
+            data = None
+        except yaml.YAMLError as exc:
+            raise StateFileError(
+                "Cannot parse state file {file} as YAML: {msg}".
+                format(file=self.filepath, msg=exc))
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise StateFileError(
+                "State file {file} has an invalid format".
+                format(file=self.filepath))
+        self._data = data
+
+    def save(self):
+        """
+        Save the state file.
+
+        Raises:
+            StateFileError: The state file could not be written.
+        """
+        data = yaml.dump(
+            self._data, encoding=None, allow_unicode=True,
+            default_flow_style=False, indent=4,
+            Dumper=yamlloader.ordereddict.CSafeDumper)
+        try:
+            with open(self.filepath, 'w', encoding='utf-8') as fp:
+                fp.write(data)
+        except IOError as exc:
+            raise StateFileError(
+                "State file {file} could not be written: {msg}".
+                format(file=self.filepath, msg=exc))
+
+    def get_watermark(self, server_id, section_id, fixup_key):
+        """
+        Return the high-water mark of the change timestamps of the items that
+        have been processed by a fixup in a library section, or None if
+        there is none.
+        """
+        watermarks = self._data.get('watermarks', {})
+        return watermarks.get(server_id, {}).get(section_id, {}). \
+            get(fixup_key, None)
+
+    def set_watermark(self, server_id, section_id, fixup_key, watermark):
+        """
+        Set the high-water mark of the change timestamps of the items that
+        have been processed by a fixup in a library section.
+        """
+        watermarks = self._data.setdefault('watermarks', {})
+        watermarks.setdefault(server_id, {}).setdefault(section_id, {})[
+            fixup_key] = watermark
+
+    def get_last_run(self, server_id, fixup_key):
+        """
+        Return the start time of the last successful scheduled run of a
+        fixup, or None if there is none.
+        """
+        last_runs = self._data.get('last_runs', {})
+        return last_runs.get(server_id, {}).get(fixup_key, None)
+
+    def set_last_run(self, server_id, fixup_key, timestamp):
+        """
+        Set the start time of the last successful scheduled run of a fixup.
+        """
+        last_runs = self._data.setdefault('last_runs', {})
+        last_runs.setdefault(server_id, {})[fixup_key] = timestamp
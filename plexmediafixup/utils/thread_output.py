@@ -0,0 +1,73 @@
+"""
+Support for capturing the printed output of worker threads.
+"""
+
+from __future__ import print_function, absolute_import
+import threading
+from contextlib import contextmanager
+
+
+class ThreadOutput(object):
+    """
+    File-like object that replaces sys.stdout while worker threads are
+    running, so that the output printed by each worker thread can be captured
+    and printed later in a defined order.
+
+    Output of threads that have a capture buffer set is written to that
+    buffer. Output of all other threads is passed on to the original stream.
+
+    Example:
+
+        output = ThreadOutput(sys.stdout)
+        sys.stdout = output
+        ...
+        # In a worker thread:
+        buffer = six.StringIO()
+        with output.capture(buffer):
+            print("captured")
+        ...
+        sys.stdout = output.stream
+    """
+
+    def __init__(self, stream):
+        """
+        Parameters:
+
+          stream (file): The original stream, e.g. sys.stdout.
+        """
+        self.stream = stream
+        self._local = threading.local()
+
+    @contextmanager
+    def capture(self, buffer):
+        """
+        Context manager that captures the output of the current thread into
+        the specified buffer (a file-like object) while its body runs.
+        """
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = None
+
+    def _target(self):
+        buffer = getattr(self._local, 'buffer', None)
+        return self.stream if buffer is None else buffer
+
+    def write(self, data):
+        """
+        Write the data to the capture buffer of the current thread, or to the
+        original stream.
+        """
+        return self._target().write(data)
+
+    def flush(self):
+        """
+        Flush the original stream, unless the output of the current thread is
+        captured.
+        """
+        if getattr(self._local, 'buffer', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
@@ -0,0 +1,234 @@
+"""
+Receiver for the webhooks of the Plex Media Server.
+
+The WebhookListener class is a lightweight HTTP server that accepts the
+webhook requests the PMS sends for events (e.g. when a new item is added to a
+library), and passes the rating keys of the affected items on to the daemon
+(see the daemon module). This is an alternative to listening on the websocket
+notification stream of the PMS.
+"""
+
+from __future__ import print_function, absolute_import
+import json
+import threading
+import socketserver
+import http.server
+import email.parser
+
+from .daemon import ListenerError
+
+# Default address the webhook receiver listens on
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 32499
+
+# Default webhook events whose items are processed. The PMS sends
+# 'library.new' when a new item has been added and matched. The other events
+# (e.g. 'library.on.deck' and the 'media.*' events) are about playback, and
+# the PMS does not send webhooks for metadata changes.
+DEFAULT_EVENTS = ['library.new']
+
+# Item types whose items are processed
+WEBHOOK_ITEM_TYPES = ('movie', 'show', 'episode')
+
+# Maximum size in bytes of a webhook request that is accepted. The PMS sends
+# the poster of the item along with some events.
+MAX_REQUEST_SIZE = 10 * 1024 * 1024
+
+
+def webhook_payload(content_type, body):
+    """
+    Return the payload of a webhook request.
+
+    The PMS sends the payload as the 'payload' field of a multipart/form-data
+    request. For testing, a request with the payload as an application/json
+    body is also accepted.
+
+    Parameters:
+
+      content_type (string): Value of the Content-Type header.
+
+      body (bytes): Body of the request.
+
+    Returns:
+
+      dict: The payload, or None if the request does not have a valid
+        payload.
+    """
+    if content_type.startswith('multipart/form-data'):
+        msg = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode('latin-1') +
+            b'\r\n\r\n' + body)
+        if not msg.is_multipart():
+            return None
+        for part in msg.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'payload':
+                body = part.get_payload(decode=True)
+                break
+        else:
+            return None
+    elif not content_type.startswith('application/json'):
+        return None
+    try:
+        payload = json.loads(body.decode('utf-8'))
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def webhook_rating_keys(payload, events, server_uuid=None):
+    """
+    Return the rating keys of the library items affected by a webhook of the
+    PMS.
+
+    Parameters:
+
+      payload (dict): The payload of the webhook.
+
+      events (list of string): The webhook events whose items are processed.
+
+      server_uuid (string): Machine identifier of the PMS. Webhooks of other
+        servers are ignored. None means to accept webhooks of any server.
+
+    Returns:
+
+      list of string: The rating keys.
+    """
+    if payload.get('event') not in events:
+        return []
+    server = payload.get('Server', {})
+    if server_uuid and server.get('uuid') and \
+            server['uuid'] != server_uuid:
+        return []
+    metadata = payload.get('Metadata', {})
+    if metadata.get('type') not in WEBHOOK_ITEM_TYPES or \
+            not metadata.get('ratingKey'):
+        return []
+    return [str(metadata['ratingKey'])]
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    daemon_threads = True
+
+
+class WebhookListener(threading.Thread):
+    """
+    Listener that receives the webhooks of the PMS on a local HTTP server.
+
+    The webhook URL to be configured in the PMS is http://HOST:PORT/ (any
+    path is accepted).
+    """
+
+    def __init__(self, plex, callback, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                 events=None):
+        """
+        Create the listener and bind its HTTP server to the address.
+
+        Parameters:
+
+          plex (plexapi.PlexServer): PMS whose webhooks are accepted.
+
+          callback (callable): Callback function, called with a list of rating
+            keys.
+
+          host (string): Host name or IP address to listen on.
+
+          port (int): Port to listen on.
+
+          events (list of string): The webhook events whose items are
+            processed. None means DEFAULT_EVENTS.
+
+        Raises:
+          ListenerError: The HTTP server could not be bound to the address.
+        """
+        super(WebhookListener, self).__init__()
+        self.daemon = True
+        self.description = "webhooks of the Plex Media Server on " \
+            "http://{host}:{port}/".format(host=host, port=port)
+        self._callback = callback
+        self._events = events if events is not None else DEFAULT_EVENTS
+        self._server_uuid = plex.machineIdentifier
+        try:
+            self._httpd = _ThreadingHTTPServer((host, port),
+                                               _make_handler(self))
+        except (IOError, OSError) as exc:
+            raise ListenerError(
+                "Cannot listen for webhooks on {host}:{port}: {msg}".
+                format(host=host, port=port, msg=exc))
+
+    @property
+    def server_address(self):
+        """
+        tuple(host, port): Address the HTTP server is bound to.
+        """
+        return self._httpd.server_address
+
+    def run(self):
+        """
+        Serve the webhook requests, until stopped.
+        """
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stop(self):
+        """
+        Stop serving the webhook requests.
+        """
+        self._httpd.shutdown()
+
+    def receive(self, content_type, body):
+        """
+        Process a webhook request, called in the thread of the request.
+        """
+        payload = webhook_payload(content_type, body)
+        if payload is None:
+            return False
+        rating_keys = webhook_rating_keys(payload, self._events,
+                                          self._server_uuid)
+        if rating_keys:
+            self._callback(rating_keys)
+        return True
+
+
+def _make_handler(listener):
+    """
+    Return a request handler class bound to the specified listener.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """
+        Request handler for the webhooks.
+        """
+
+        def log_message(self, format, *args):
+            # pylint: disable=redefined-builtin
+            pass
+
+        def do_POST(self):
+            # pylint: disable=invalid-name
+            """
+            Handle a webhook request.
+            """
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0 or length > MAX_REQUEST_SIZE:
+                self._send(413)
+                return
+            body = self.rfile.read(length)
+            content_type = self.headers.get('Content-Type', '')
+            if listener.receive(content_type, body):
+                self._send(200)
+            else:
+                self._send(400)
+
+        def _send(self, status):
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    return Handler
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+Throughput benchmark of the fixups against a fake PMS.
+
+For each fixup, a library of the specified size is generated, and the fixup
+is run against it once for measuring the throughput, and once more on a new
+library for measuring the peak memory (tracemalloc slows down the run). The
+report shows per fixup:
+
+* items/s: Processed items per second.
+* req/item: Requests to the PMS per processed item.
+* peak MB: Peak memory allocated by Python during the run.
+
+Usage:
+
+    python -m tests.end2endtest.benchmark --help
+"""
+
+from __future__ import print_function, absolute_import
+import sys
+import shutil
+import argparse
+import tempfile
+
+from plexmediafixup.fixup import FixupManager
+from .fake_pms import FakePMS, FakeLibrary
+from .runner import write_config, run_plexmediafixup, FIXUP_ENTRIES, \
+    MEDIA_ROOT
+
+
+class BenchmarkResult(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Result of the benchmark of one fixup.
+    """
+
+    def __init__(self, fixup, items, elapsed, requests, peak_memory):
+        self.fixup = fixup  # Name of the fixup
+        self.items = items  # Number of items processed by the fixup
+        self.elapsed = elapsed  # Elapsed time in seconds
+        self.requests = requests  # Number of requests to the PMS
+        self.peak_memory = peak_memory  # Peak memory in bytes, or None
+
+    @property
+    def items_per_sec(self):
+        """
+        float: Processed items per second.
+        """
+        return self.items / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def requests_per_item(self):
+        """
+        float: Requests to the PMS per processed item.
+        """
+        return float(self.requests) / self.items if self.items else 0.0
+
+    def __str__(self):
+        return "{r.fixup:<22} {r.items:>7} {r.elapsed:>8.2f} " \
+            "{r.items_per_sec:>9.1f} {r.requests:>8} " \
+            "{r.requests_per_item:>8.3f} {mem:>8}". \
+            format(r=self, mem='{:.1f}'.format(self.peak_memory / 1e6)
+                   if self.peak_memory is not None else '-')
+
+
+HEADER = "{:<22} {:>7} {:>8} {:>9} {:>8} {:>8} {:>8}".format(
+    'fixup', 'items', 'time s', 'items/s', 'requests', 'req/item', 'peak MB')
+
+
+def processed_items(fixup_name, library):
+    """
+    Return the number of items of a library that are processed by a fixup.
+    """
+    fixup = FixupManager().get_fixup(fixup_name)
+    return len([item for item in library.items.values()
+                if item.type in fixup.item_types])
+
+
+def _run_once(fixup_name, library_kwargs, latency, args, measure_memory):
+    """
+    Run a fixup against a new library and return the library and the run
+    result.
+    """
+    library = FakeLibrary(media_root=MEDIA_ROOT, **library_kwargs)
+    workdir = tempfile.mkdtemp(prefix='plexmediafixup_benchmark_')
+    try:
+        library.write_media_files(workdir + '/media', MEDIA_ROOT)
+        with FakePMS(library, latency=latency) as pms:
+            config_file = write_config(workdir, pms, [fixup_name])
+            result = run_plexmediafixup(pms, config_file, args,
+                                        measure_memory)
+    finally:
+        shutil.rmtree(workdir)
+    if result.rc:
+        raise AssertionError(
+            "Fixup {f} failed with rc={rc}; output:\n{out}".
+            format(f=fixup_name, rc=result.rc, out=result.output))
+    return library, result
+
+
+def run_benchmark(fixup_name, library_kwargs, latency=0.0, args=(),
+                  measure_memory=True):
+    """
+    Benchmark one fixup.
+
+    Parameters:
+
+      fixup_name (string): Name of the fixup.
+
+      library_kwargs (dict): Keyword arguments for FakeLibrary defining the
+        size of the library.
+
+      latency (float): Latency in seconds injected into each response.
+
+      args (iterable of string): Command line options for plexmediafixup
+        (e.g. ['--jobs', '4']).
+
+      measure_memory (bool): Measure the peak memory in a separate run.
+
+    Returns:
+
+      BenchmarkResult: The result.
+
+    Raises:
+
+      AssertionError: The fixup failed.
+    """
+    library, result = _run_once(fixup_name, library_kwargs, latency, args,
+                                False)
+    peak_memory = None
+    if measure_memory:
+        _, mem_result = _run_once(fixup_name, library_kwargs, 0.0, args, True)
+        peak_memory = mem_result.peak_memory
+    return BenchmarkResult(fixup_name, processed_items(fixup_name, library),
+                           result.elapsed, len(result.requests), peak_memory)
+
+
+def parse_args():
+    """
+    Parse the command line arguments of the benchmark.
+    """
+    argparser = argparse.ArgumentParser(
+        description="Benchmark the fixups against a fake PMS.")
+    argparser.add_argument(
+        '--movies', type=int, default=1000,
+        help="Number of movies in the library. Default: %(default)s")
+    argparser.add_argument(
+        '--shows', type=int, default=50,
+        help="Number of shows in the library. Default: %(default)s")
+    argparser.add_argument(
+        '--episodes', type=int, default=20,
+        help="Number of episodes per show. Default: %(default)s")
+    argparser.add_argument(
+        '--genres', type=int, default=10,
+        help="Number of distinct genres. Default: %(default)s")
+    argparser.add_argument(
+        '--collections', type=int, default=5,
+        help="Number of distinct collections. Default: %(default)s")
+    argparser.add_argument(
+        '--latency', type=float, default=0.0,
+        help="Latency in seconds injected into each response of the fake "
+        "PMS. Default: %(default)s")
+    argparser.add_argument(
+        '--fixup', dest='fixups', action='append', default=None,
+        help="Fixup to be benchmarked (can be specified multiple times). "
+        "Default: all fixups")
+    argparser.add_argument(
+        '--no-memory', dest='measure_memory', action='store_false',
+        default=True, help="Do not measure the peak memory")
+    argparser.add_argument(
+        'plexmediafixup_args', nargs='*', metavar='OPTION',
+        help="Options for plexmediafixup, after '--' (e.g. -- --jobs 4)")
+    return argparser.parse_args()
+
+
+def main():
+    """
+    Main function of the benchmark.
+    """
+    args = parse_args()
+    library_kwargs = dict(
+        movies=args.movies, shows=args.shows,
+        episodes_per_show=args.episodes, genres=args.genres,
+        collections=args.collections)
+    fixups = args.fixups or sorted(FIXUP_ENTRIES)
+    print(HEADER)
+    for fixup_name in fixups:
+        result = run_benchmark(fixup_name, library_kwargs, args.latency,
+                               args.plexmediafixup_args, args.measure_memory)
+        print(result)
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
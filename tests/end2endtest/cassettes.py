@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+Recording and replaying of cassettes of the fixups against a fake PMS.
+
+A cassette file records the HTTP exchanges of a plexmediafixup run (see
+plexmediafixup.utils.cassette). The cassettes in the 'cassettes' directory
+have been recorded by running each fixup against a fake PMS serving a small
+generated library. Replaying them runs the fixups offline, and fails on any
+request that the recorded run did not send, which catches regressions in the
+number of requests.
+
+The cassettes need to be recorded again after intended changes in the
+requests of a fixup, or in the fake PMS or the generated library.
+
+Usage:
+
+    python -m tests.end2endtest.cassettes [--fixup NAME ...]
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+from .fake_pms import FakePMS, FakeLibrary
+from .runner import write_config, run_plexmediafixup, FIXUP_ENTRIES, \
+    MEDIA_ROOT
+
+# Directory of the recorded cassettes
+CASSETTE_DIR = os.path.join(os.path.dirname(__file__), 'cassettes')
+
+# Size of the generated library for the recorded cassettes
+CASSETTE_LIBRARY_KWARGS = dict(movies=12, shows=2, episodes_per_show=3)
+
+
+def cassette_file(fixup_name):
+    """
+    Return the path name of the recorded cassette of a fixup.
+    """
+    return os.path.join(CASSETTE_DIR, fixup_name + '.jsonl')
+
+
+def record(fixup_name, filepath, library_kwargs=None, latency=0.0, args=(),
+           config_items=None):
+    """
+    Run a fixup against a fake PMS serving a new library, recording the run
+    in a cassette file, and return the run result.
+
+    Parameters:
+
+      fixup_name (string): Name of the fixup.
+
+      filepath (string): Path name of the cassette file.
+
+      library_kwargs (dict): Keyword arguments for FakeLibrary defining the
+        size of the library. None means CASSETTE_LIBRARY_KWARGS.
+
+      latency (float): Latency in seconds injected into each response.
+
+      args (iterable of string): Further command line options for
+        plexmediafixup.
+
+      config_items (dict): Further items for the config file (e.g.
+        page_size).
+
+    Returns:
+
+      RunResult: The result of the run.
+    """
+    if library_kwargs is None:
+        library_kwargs = CASSETTE_LIBRARY_KWARGS
+    library = FakeLibrary(media_root=MEDIA_ROOT, **library_kwargs)
+    workdir = tempfile.mkdtemp(prefix='plexmediafixup_record_')
+    try:
+        library.write_media_files(os.path.join(workdir, 'media'), MEDIA_ROOT)
+        with FakePMS(library, latency=latency) as pms:
+            config_file = write_config(workdir, pms, [fixup_name],
+                                       **(config_items or {}))
+            result = run_plexmediafixup(
+                pms, config_file,
+                ['--record-cassette', filepath] + list(args))
+    finally:
+        shutil.rmtree(workdir)
+    return result
+
+
+def replay(fixup_name, filepath, library_kwargs=None, args=(),
+           config_items=None):
+    """
+    Run a fixup without a PMS, replaying a cassette file, and return the run
+    result.
+
+    The media files of the library are generated as for the recorded run.
+
+    Parameters:
+
+      fixup_name (string): Name of the fixup.
+
+      filepath (string): Path name of the cassette file.
+
+      library_kwargs (dict): Keyword arguments for FakeLibrary defining the
+        size of the library of the recorded run. None means
+        CASSETTE_LIBRARY_KWARGS.
+
+      args (iterable of string): Further command line options for
+        plexmediafixup (e.g. ['--replay-latency']).
+
+      config_items (dict): Further items for the config file, as for the
+        recorded run.
+
+    Returns:
+
+      RunResult: The result of the run.
+    """
+    if library_kwargs is None:
+        library_kwargs = CASSETTE_LIBRARY_KWARGS
+    library = FakeLibrary(media_root=MEDIA_ROOT, **library_kwargs)
+    workdir = tempfile.mkdtemp(prefix='plexmediafixup_replay_')
+    try:
+        library.write_media_files(os.path.join(workdir, 'media'), MEDIA_ROOT)
+        config_file = write_config(workdir, None, [fixup_name],
+                                   **(config_items or {}))
+        result = run_plexmediafixup(
+            None, config_file, ['--replay-cassette', filepath] + list(args))
+    finally:
+        shutil.rmtree(workdir)
+    return result
+
+
+def parse_args():
+    """
+    Parse the command line arguments for recording the cassettes.
+    """
+    argparser = argparse.ArgumentParser(
+        description="Record the cassettes of the fixups against a fake PMS "
+        "in directory {dir}.".format(dir=CASSETTE_DIR))
+    argparser.add_argument(
+        '--fixup', dest='fixups', action='append', default=None,
+        help="Fixup whose cassette is recorded (can be specified multiple "
+        "times). Default: all fixups")
+    return argparser.parse_args()
+
+
+def main():
+    """
+    Main function for recording the cassettes.
+    """
+    args = parse_args()
+    fixups = args.fixups or sorted(FIXUP_ENTRIES)
+    for fixup_name in fixups:
+        filepath = cassette_file(fixup_name)
+        result = record(fixup_name, filepath)
+        if result.rc:
+            print("Error: Fixup {f} failed with rc={rc}; output:\n{out}".
+                  format(f=fixup_name, rc=result.rc, out=result.output))
+            return 1
+        print("Recorded {n} requests of fixup {f} in cassette file {file}".
+              format(n=len(result.requests), f=fixup_name, file=filepath))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,682 @@
+"""
+Fake Plex Media Server for end2end tests and benchmarks.
+
+The fake PMS is a local HTTP server that serves a generated library with
+movie and show sections, records every request it receives, and can inject
+a configurable latency into each response. It implements just enough of the
+PMS HTTP API for the plexapi package and the fixups of this project.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import re
+import sys
+import socket
+import time
+import json
+import base64
+import hashlib
+import threading
+from six.moves import queue
+from xml.sax.saxutils import quoteattr
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qsl, unquote
+
+MACHINE_IDENTIFIER = 'fake-pms-machine-identifier'
+
+# Plex search type numbers of the item types
+TYPE_NUMBERS = {'movie': 1, 'show': 2, 'episode': 4}
+
+# Path of the websocket notification stream
+NOTIFICATIONS_PATH = '/:/websockets/notifications'
+
+# GUID for computing the Sec-WebSocket-Accept header (RFC 6455)
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+GENRES = ['Action', 'Adventure', 'Comedy', 'Drama', 'Documentary', 'Crime',
+          'Romance', 'Sci-Fi', 'Thriller', 'Western']
+
+# EBML IDs for generating Matroska media files
+_EBML = 0x1A45DFA3
+_EBML_DOCTYPE = 0x4282
+_SEGMENT = 0x18538067
+_INFO = 0x1549A966
+_TITLE = 0x7BA9
+
+
+class FakeItem(object):
+    # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    A movie, show or episode item in the fake library.
+    """
+
+    def __init__(self, rating_key, type_, title, section, timestamp,
+                 year=None, file=None, genres=None, collections=None,
+                 show=None, season_index=None, index=None):
+        self.rating_key = rating_key
+        self.type = type_
+        self.title = title
+        # Like the PMS, the sort title omits a leading article
+        self.title_sort = re.sub(r'^(The|A|An) ', '', title)
+        self.section = section
+        self.year = year
+        self.file = file
+        self.file_title = u'{} (tagged)'.format(title) if file else None
+        self.genres = genres or []
+        self.collections = collections or []
+        self.show = show
+        self.season_index = season_index
+        self.index = index
+        self.added_at = timestamp
+        self.updated_at = timestamp
+
+
+class FakeSection(object):
+    # pylint: disable=too-few-public-methods
+    """
+    A library section in the fake library.
+    """
+
+    def __init__(self, key, type_, title):
+        self.key = key
+        self.type = type_
+        self.title = title
+        self.items = []  # Top level items (movies or shows)
+        self.episodes = []  # Episode items of the shows
+
+
+class FakeLibrary(object):
+    """
+    A generated library for the fake PMS.
+    """
+
+    def __init__(self, movies=100, shows=10, episodes_per_show=10,
+                 genres=len(GENRES), collections=5, media_root='/media',
+                 timestamp=1500000000):
+        """
+        Parameters:
+
+          movies (int): Number of movies in the movie section.
+
+          shows (int): Number of shows in the show section.
+
+          episodes_per_show (int): Number of episodes per show.
+
+          genres (int): Number of distinct genres. Each movie has two genres
+            and each show has one.
+
+          collections (int): Number of distinct collections. Every other
+            movie is in a collection.
+
+          media_root (string): Root directory of the media file paths as
+            seen by the fake PMS.
+
+          timestamp (int): Value for the addedAt and updatedAt attributes
+            of the generated items.
+        """
+        genre_names = (GENRES + ['Genre {}'.format(i) for i in
+                                 range(len(GENRES), genres)])[:genres]
+        self.sections = []
+        self.items = {}  # FakeItem by rating key
+        self._next_key = 1000
+        movie_section = FakeSection('1', 'movie', 'Movies')
+        show_section = FakeSection('2', 'show', 'TV Shows')
+        self.sections.append(movie_section)
+        self.sections.append(show_section)
+        for i in range(movies):
+            item = FakeItem(
+                self._new_key(), 'movie',
+                u'{}Movie {}'.format(u'The ' if i % 3 == 0 else u'', i),
+                movie_section, timestamp, year=1950 + i % 70,
+                file=u'{}/movies/movie{}.mkv'.format(media_root, i),
+                genres=[genre_names[i % genres],
+                        genre_names[(i + 3) % genres]] if genres else [],
+                collections=['Collection {}'.format(i % collections)]
+                if i % 2 and collections else [])
+            self._add(movie_section.items, item)
+        for i in range(shows):
+            show = FakeItem(
+                self._new_key(), 'show',
+                u'{}Show {}'.format(u'A ' if i % 3 == 0 else u'', i),
+                show_section,
+                timestamp, year=1990 + i % 30,
+                genres=[genre_names[i % genres]] if genres else [])
+            self._add(show_section.items, show)
+            for j in range(episodes_per_show):
+                episode = FakeItem(
+                    self._new_key(), 'episode', u'Episode {}'.format(j),
+                    show_section, timestamp, show=show,
+                    season_index=1 + j // 10, index=1 + j % 10,
+                    file=u'{}/shows/show{}/s{:02d}e{:02d}.mkv'.format(
+                        media_root, i, 1 + j // 10, 1 + j % 10))
+                self._add(show_section.episodes, episode)
+
+    def add_movie(self, title, media_root='/media'):
+        """
+        Add a movie to the movie section, as if it had just been added to the
+        PMS, and return its FakeItem.
+
+        Parameters:
+
+          title (string): Title of the movie.
+
+          media_root (string): Root directory of the media file paths as
+            seen by the fake PMS.
+        """
+        movie_section = self.sections[0]
+        rating_key = self._new_key()
+        item = FakeItem(
+            rating_key, 'movie', title, movie_section, int(time.time()),
+            year=2020, file=u'{}/movies/movie{}.mkv'.format(media_root,
+                                                            rating_key))
+        self._add(movie_section.items, item)
+        return item
+
+    def write_media_files(self, local_root, media_root='/media'):
+        """
+        Create the media files of the items as minimal Matroska files with
+        their title tag (the file_title attribute of the items).
+
+        Parameters:
+
+          local_root (string): Local directory that corresponds to the media
+            root directory of the fake PMS.
+
+          media_root (string): Root directory of the media file paths as
+            seen by the fake PMS.
+        """
+        for item in self.items.values():
+            self.write_media_file(item, local_root, media_root)
+
+    @staticmethod
+    def write_media_file(item, local_root, media_root='/media'):
+        """
+        Create the media file of an item as a minimal Matroska file with its
+        title tag (the file_title attribute of the item), if it has a media
+        file.
+
+        Parameters:
+
+          item (FakeItem): The item.
+
+          local_root (string): Local directory that corresponds to the media
+            root directory of the fake PMS.
+
+          media_root (string): Root directory of the media file paths as
+            seen by the fake PMS.
+        """
+        if not item.file:
+            return
+        path = os.path.join(local_root, os.path.relpath(item.file, media_root))
+        dirpath = os.path.dirname(path)
+        if not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        with open(path, 'wb') as fp:
+            fp.write(mkv_data(item.file_title))
+
+    def _new_key(self):
+        self._next_key += 1
+        return str(self._next_key)
+
+    def _add(self, item_list, item):
+        item_list.append(item)
+        self.items[item.rating_key] = item
+
+    def section(self, key):
+        """
+        Return the FakeSection with the specified key, or None.
+        """
+        for section in self.sections:
+            if section.key == key:
+                return section
+        return None
+
+
+def _ebml_element(elem_id, data):
+    """
+    Return an EBML element with the specified ID and data.
+    """
+    id_bytes = bytearray()
+    while elem_id:
+        id_bytes.insert(0, elem_id & 0xff)
+        elem_id >>= 8
+    size = bytearray(8)
+    n = len(data)
+    for i in range(7, 0, -1):
+        size[i] = n & 0xff
+        n >>= 8
+    size[0] = 0x01  # 8-byte size
+    return bytes(id_bytes) + bytes(size) + data
+
+
+def mkv_data(title):
+    """
+    Return the content of a minimal Matroska file with the specified title
+    tag in its Segment Info element.
+    """
+    header = _ebml_element(_EBML, _ebml_element(_EBML_DOCTYPE, b'matroska'))
+    info = _ebml_element(_INFO, _ebml_element(_TITLE, title.encode('utf-8')))
+    return header + _ebml_element(_SEGMENT, info)
+
+
+class FakePMS(object):
+    """
+    Fake Plex Media Server running in a thread on a local port.
+
+    Usage:
+
+        with FakePMS(FakeLibrary(movies=10)) as pms:
+            plex = plexapi.server.PlexServer(pms.baseurl, pms.token)
+            ...
+            print(len(pms.requests))
+    """
+
+    token = 'fake-token'
+
+    def __init__(self, library, latency=0.0, port=0):
+        """
+        Parameters:
+
+          library (FakeLibrary): The library to be served.
+
+          latency (float): Delay in seconds that is injected before sending
+            each response.
+
+          port (int): Local port to listen on. 0 means to use a free port.
+        """
+        self.library = library
+        self.latency = latency
+        self.requests = []  # Recorded requests as tuple(method, path, query)
+        self.library_lock = threading.Lock()  # Serializes library access
+        self._lock = threading.Lock()
+        self._ws_queues = []  # Queues of the connected notification clients
+        handler = _make_handler(self)
+        self._httpd = _ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self._thread = None
+
+    @property
+    def port(self):
+        """
+        int: Local port the fake PMS listens on.
+        """
+        return self._httpd.server_address[1]
+
+    @property
+    def baseurl(self):
+        """
+        string: Base URL of the fake PMS.
+        """
+        return 'http://127.0.0.1:{}'.format(self.port)
+
+    def start(self):
+        """
+        Start serving in a background thread.
+        """
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving and close the listening socket.
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def record(self, method, path, query):
+        """
+        Record a request.
+        """
+        with self._lock:
+            self.requests.append((method, path, query))
+
+    def notify(self, data):
+        """
+        Send a notification (the content of a NotificationContainer element)
+        to all connected notification clients.
+        """
+        message = json.dumps({'NotificationContainer': data})
+        with self._lock:
+            for q in self._ws_queues:
+                q.put(message)
+
+    def notify_timeline(self, items, state=5):
+        """
+        Send a timeline notification for the specified items.
+        """
+        self.notify({
+            'type': 'timeline',
+            'size': len(items),
+            'TimelineEntry': [
+                {'identifier': 'com.plexapp.plugins.library',
+                 'sectionID': item.section.key,
+                 'itemID': item.rating_key,
+                 'type': TYPE_NUMBERS[item.type],
+                 'title': item.title,
+                 'state': state}
+                for item in items],
+        })
+
+    def drop_notification_clients(self):
+        """
+        Close the connections of all connected notification clients.
+        """
+        with self._lock:
+            for q in self._ws_queues:
+                q.put(None)
+
+    @property
+    def notification_clients(self):
+        """
+        int: Number of connected notification clients.
+        """
+        with self._lock:
+            return len(self._ws_queues)
+
+    def _add_ws_queue(self, q):
+        with self._lock:
+            self._ws_queues.append(q)
+
+    def _remove_ws_queue(self, q):
+        with self._lock:
+            self._ws_queues.remove(q)
+
+    def reset_requests(self):
+        """
+        Clear the recorded requests.
+        """
+        with self._lock:
+            self.requests = []
+
+    def count_requests(self, method=None, path_prefix=None):
+        """
+        Return the number of recorded requests that match the specified
+        method and path prefix.
+        """
+        with self._lock:
+            return len([r for r in self.requests
+                        if (method is None or r[0] == method) and
+                        (path_prefix is None or r[1].startswith(path_prefix))])
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # A client that gave up on a delayed response (e.g. after its read
+        # timeout) has closed the connection, which is not an error.
+        exc = sys.exc_info()[1]
+        if isinstance(exc, socket.error):
+            return
+        BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+def _make_handler(pms):
+    """
+    Return a request handler class bound to the specified FakePMS object.
+    """
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        """
+        Request handler of the fake PMS.
+        """
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            # pylint: disable=redefined-builtin
+            pass
+
+        def do_GET(self):
+            # pylint: disable=invalid-name
+            self._handle('GET')
+
+        def do_PUT(self):
+            # pylint: disable=invalid-name
+            self._handle('PUT')
+
+        def _handle(self, method):
+            url = urlparse(self.path)
+            query = dict(parse_qsl(url.query, keep_blank_values=True))
+            pms.record(method, url.path, query)
+            if pms.latency:
+                time.sleep(pms.latency)
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+            token = query.get('X-Plex-Token') or \
+                self.headers.get('X-Plex-Token')
+            if token != pms.token:
+                self._send(401, '<html>Unauthorized</html>')
+                return
+            if url.path == NOTIFICATIONS_PATH and \
+                    self.headers.get('Upgrade', '').lower() == 'websocket':
+                self._websocket()
+                return
+            with pms.library_lock:
+                status, body = _route(pms.library, method, url.path, query,
+                                      self.headers)
+            self._send(status, body)
+
+        def _websocket(self):
+            key = self.headers.get('Sec-WebSocket-Key', '')
+            accept = base64.b64encode(hashlib.sha1(
+                (key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+            self.send_response(101)
+            self.send_header('Upgrade', 'websocket')
+            self.send_header('Connection', 'Upgrade')
+            self.send_header('Sec-WebSocket-Accept', accept)
+            self.end_headers()
+            self.wfile.flush()
+            self.close_connection = True
+            q = queue.Queue()
+            pms._add_ws_queue(q)  # pylint: disable=protected-access
+            try:
+                while True:
+                    message = q.get()
+                    if message is None:
+                        self.wfile.write(b'\x88\x00')  # close frame
+                        break
+                    self.wfile.write(_ws_frame(message.encode('utf-8')))
+                    self.wfile.flush()
+            except (IOError, OSError):
+                pass
+            finally:
+                pms._remove_ws_queue(q)  # pylint: disable=protected-access
+
+        def _send(self, status, body):
+            data = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/xml;charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def _ws_frame(payload):
+    """
+    Return an unmasked websocket text frame with the specified payload.
+    """
+    n = len(payload)
+    if n < 126:
+        header = bytes(bytearray([0x81, n]))
+    elif n < 65536:
+        header = bytes(bytearray([0x81, 126, n >> 8, n & 0xff]))
+    else:
+        header = bytes(bytearray([0x81, 127] +
+                                 [(n >> (8 * i)) & 0xff
+                                  for i in range(7, -1, -1)]))
+    return header + payload
+
+
+def _route(library, method, path, query, headers):
+    # pylint: disable=too-many-return-statements
+    """
+    Handle a request and return tuple(status, body).
+    """
+    parts = [p for p in path.split('/') if p]
+    if method == 'GET' and not parts:
+        return 200, _container(
+            [], friendlyName='Fake PMS', machineIdentifier=MACHINE_IDENTIFIER,
+            version='1.32.0.0', myPlex='0')
+    if method == 'GET' and parts == ['identity']:
+        return 200, _container(
+            [], machineIdentifier=MACHINE_IDENTIFIER, version='1.32.0.0')
+    if method == 'GET' and parts == ['library']:
+        return 200, _container(
+            ['<Directory key="sections" title="Library Sections" />'],
+            title1='Plex Library')
+    if method == 'GET' and parts == ['library', 'sections']:
+        return 200, _container([_section_xml(s) for s in library.sections])
+    if len(parts) == 4 and parts[:2] == ['library', 'sections'] and \
+            parts[3] == 'all':
+        section = library.section(parts[2])
+        if section is None:
+            return 404, '<html>Not Found</html>'
+        if method == 'PUT':
+            return _edit(library, section, query)
+        return _list(section, query, headers)
+    if method == 'GET' and len(parts) >= 3 and \
+            parts[:2] == ['library', 'metadata']:
+        keys = unquote(parts[2]).split(',')
+        items = [library.items[k] for k in keys if k in library.items]
+        if not items:
+            return 404, '<html>Not Found</html>'
+        if len(parts) == 3:
+            return 200, _container([_item_xml(i, full=True) for i in items])
+        if parts[3] in ('allLeaves', 'children') and len(items) == 1:
+            show = items[0]
+            episodes = [e for e in show.section.episodes if e.show is show]
+            return 200, _container([_item_xml(e) for e in episodes])
+    return 404, '<html>Not Found</html>'
+
+
+def _list(section, query, headers):
+    """
+    List the items of a section, honoring the type filter, updatedAt/addedAt
+    filters and container paging.
+    """
+    type_num = query.get('type')
+    if type_num == str(TYPE_NUMBERS['episode']):
+        items = section.episodes
+    else:
+        items = section.items
+    for attr in ('updatedAt', 'addedAt'):
+        value = query.get(attr + '>>')
+        if value is not None:
+            items = [i for i in items
+                     if getattr(i, attr.replace('At', '_at').lower()) >=
+                     int(value)]
+    total = len(items)
+    start = query.get('X-Plex-Container-Start',
+                      headers.get('X-Plex-Container-Start'))
+    size = query.get('X-Plex-Container-Size',
+                     headers.get('X-Plex-Container-Size'))
+    start = int(start) if start is not None else 0
+    size = int(size) if size is not None else total
+    page = items[start:start + size]
+    return 200, _container([_item_xml(i) for i in page], totalSize=total,
+                           offset=start)
+
+
+def _edit(library, section, query):
+    """
+    Apply an edit to one or more items (comma-separated id parameter).
+    """
+    ids = query.get('id', '').split(',')
+    items = [library.items.get(k) for k in ids]
+    if not ids or None in items:
+        return 404, '<html>Not Found</html>'
+    now = int(time.time())
+    for item in items:
+        if item.section is not section:
+            return 400, '<html>Bad Request</html>'
+        if 'title.value' in query:
+            item.title = query['title.value']
+        if 'titleSort.value' in query:
+            item.title_sort = query['titleSort.value']
+        for tag_type, attr in (('genre', 'genres'),
+                               ('collection', 'collections')):
+            removed = query.get('{}[].tag.tag-'.format(tag_type))
+            if removed is not None:
+                removed = removed.split(',')
+                setattr(item, attr, [t for t in getattr(item, attr)
+                                     if t not in removed])
+            i = 0
+            while '{}[{}].tag.tag'.format(tag_type, i) in query:
+                tag = query['{}[{}].tag.tag'.format(tag_type, i)]
+                if tag not in getattr(item, attr):
+                    getattr(item, attr).append(tag)
+                i += 1
+        item.updated_at = now
+    return 200, ''
+
+
+def _container(elements, **attrs):
+    attrs.setdefault('size', len(elements))
+    return u'<?xml version="1.0" encoding="UTF-8"?>\n' \
+        u'<MediaContainer {}>{}</MediaContainer>'.format(
+            _attrs(attrs), u''.join(elements))
+
+
+def _attrs(attrs):
+    return u' '.join([u'{}={}'.format(k, quoteattr(u'{}'.format(v)))
+                      for k, v in attrs.items() if v is not None])
+
+
+def _section_xml(section):
+    return u'<Directory {} />'.format(_attrs(dict(
+        key=section.key, type=section.type, title=section.title,
+        agent='tv.plex.agents.' + section.type, scanner='Plex Scanner',
+        language='en-US', uuid='fake-uuid-' + section.key,
+        updatedAt=1500000000, createdAt=1500000000, scannedAt=1500000000)))
+
+
+def _item_xml(item, full=False):
+    """
+    Return the XML of an item. Listings (full=False) return partial items
+    with at most one genre and no collections, like the real PMS does.
+    """
+    attrs = dict(
+        ratingKey=item.rating_key, key='/library/metadata/' + item.rating_key,
+        type=item.type, title=item.title, titleSort=item.title_sort,
+        year=item.year, addedAt=item.added_at, updatedAt=item.updated_at,
+        librarySectionID=item.section.key,
+        librarySectionTitle=item.section.title,
+        librarySectionKey='/library/sections/' + item.section.key)
+    if item.type == 'show':
+        attrs['key'] += '/children'
+        tag = 'Directory'
+    else:
+        tag = 'Video'
+    if item.type == 'episode':
+        attrs.update(
+            grandparentRatingKey=item.show.rating_key,
+            grandparentKey='/library/metadata/' + item.show.rating_key,
+            grandparentTitle=item.show.title, parentIndex=item.season_index,
+            index=item.index)
+    children = []
+    if item.file:
+        children.append(
+            u'<Media id="{k}"><Part id="{k}" key="/library/parts/{k}/file" '
+            u'file={f} /></Media>'.format(k=item.rating_key,
+                                          f=quoteattr(item.file)))
+    genres = item.genres if full else item.genres[:1]
+    for genre in genres:
+        children.append(u'<Genre tag={} />'.format(quoteattr(genre)))
+    if full:
+        for coll in item.collections:
+            children.append(u'<Collection tag={} />'.format(quoteattr(coll)))
+    return u'<{t} {a}>{c}</{t}>'.format(t=tag, a=_attrs(attrs),
+                                        c=u''.join(children))
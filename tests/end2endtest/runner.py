@@ -0,0 +1,148 @@
+"""
+Support for running the plexmediafixup command in-process against a fake
+PMS, for the end2end tests and benchmarks.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import sys
+import time
+import tracemalloc
+import contextlib
+import yaml  # PyYAML package
+import six
+
+from plexmediafixup import cli
+from .fake_pms import FakePMS
+
+# Root directory of the media file paths as seen by the fake PMS
+MEDIA_ROOT = '/media'
+
+# Server URL used for runs that replay a cassette instead of using a fake
+# PMS; nothing listens there, so any request that is actually sent fails
+REPLAY_BASEURL = 'http://127.0.0.1:9'
+
+# Genre cleanup definitions used for the video_genre_cleanup fixup
+GENRE_CLEANUP = [
+    {
+        'language': 'en',
+        'change': {
+            'Science Fiction': ['Sci-Fi'],
+            'Action & Adventure': ['Action', 'Adventure'],
+        },
+        'remove': ['Western'],
+        'if_empty': 'Unknown',
+    },
+]
+
+# Config file entries and kwargs of the fixups, such that each fixup has
+# work to do on a library generated by FakeLibrary
+FIXUP_ENTRIES = {
+    'sync_title': {},
+    'sync_sort_title': {},
+    'video_genre_cleanup': {'language': 'en'},
+    'preserve_collections': {'collections_file': 'collections.yml'},
+}
+
+
+class RunResult(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Result of a run of the plexmediafixup command.
+    """
+
+    def __init__(self, rc, output, elapsed, requests, peak_memory):
+        self.rc = rc  # Return code
+        self.output = output  # Printed output
+        self.elapsed = elapsed  # Elapsed time in seconds
+        self.requests = requests  # Requests received by the fake PMS
+        self.peak_memory = peak_memory  # Peak traced memory in bytes, or None
+
+
+def write_config(workdir, pms, fixups, **config_items):
+    """
+    Write a PlexAPI config file and a plexmediafixup config file for running
+    the specified fixups against a fake PMS, and return the path name of the
+    plexmediafixup config file.
+
+    Parameters:
+
+      workdir (string): Directory for the config files and for the files
+        created by the run (e.g. the state file). The media files of the
+        library are expected in its 'media' subdirectory.
+
+      pms (FakePMS): The fake PMS, or None for a run that replays a cassette.
+
+      fixups (list of string): Names of the fixups to be run, see
+        FIXUP_ENTRIES.
+
+      **config_items: Further items for the plexmediafixup config file.
+    """
+    plexapi_config_file = os.path.join(workdir, 'plexapi_config.ini')
+    with open(plexapi_config_file, 'w') as fp:
+        fp.write("[auth]\nserver_baseurl = {url}\nserver_token = {token}\n".
+                 format(url=pms.baseurl if pms else REPLAY_BASEURL,
+                        token=FakePMS.token))
+    config = {
+        'plexapi_config_path': plexapi_config_file,
+        'direct_connection': True,
+        'path_mappings': [
+            {'server': MEDIA_ROOT, 'local': os.path.join(workdir, 'media')},
+        ],
+        'probe_cache': {'file': None},
+        'connection_cache': {'file': None},
+        'video_genre_cleanup': GENRE_CLEANUP,
+        'fixups': [
+            {'name': name, 'enabled': True,
+             'kwargs': dict(FIXUP_ENTRIES[name])}
+            for name in fixups],
+    }
+    config.update(config_items)
+    config_file = os.path.join(workdir, 'plexmediafixup_config.yml')
+    with open(config_file, 'w') as fp:
+        yaml.safe_dump(config, fp, default_flow_style=False)
+    return config_file
+
+
+def run_plexmediafixup(pms, config_file, args=(), measure_memory=False):
+    """
+    Run the plexmediafixup command in-process with the specified config file
+    and command line options, and return its result.
+
+    Parameters:
+
+      pms (FakePMS): The fake PMS, whose recorded requests are reset before
+        the run, or None for a run that replays a cassette.
+
+      config_file (string): Path name of the plexmediafixup config file.
+
+      args (iterable of string): Command line options.
+
+      measure_memory (bool): Measure the peak memory allocated by Python
+        during the run, using tracemalloc. This slows down the run.
+
+    Returns:
+
+      RunResult: The result of the run.
+    """
+    if pms:
+        pms.reset_requests()
+    saved_argv = sys.argv
+    sys.argv = ['plexmediafixup'] + list(args) + [config_file]
+    output = six.StringIO()
+    peak_memory = None
+    if measure_memory:
+        tracemalloc.start()
+    try:
+        start = time.time()
+        with contextlib.redirect_stdout(output):
+            rc = cli.main()
+        elapsed = time.time() - start
+        if measure_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        if measure_memory:
+            tracemalloc.stop()
+        sys.argv = saved_argv
+    return RunResult(rc, output.getvalue(), elapsed,
+                     list(pms.requests) if pms else [], peak_memory)
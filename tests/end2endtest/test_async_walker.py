@@ -0,0 +1,110 @@
+"""
+End2end tests that run the asyncio execution engine against a fake PMS.
+"""
+
+from __future__ import print_function, absolute_import
+import threading
+import pytest
+import plexapi.server
+
+from plexmediafixup.fixup import Fixup
+from plexmediafixup.async_walker import AsyncLibraryWalker
+from .fake_pms import FakePMS, FakeLibrary
+
+
+class RecordingFixup(Fixup):
+    """
+    Fixup that records the items passed to it, and optionally raises an
+    exception for one of them.
+    """
+
+    item_types = ['movie', 'show', 'episode']
+
+    def __init__(self, fail_key=None):
+        super(RecordingFixup, self).__init__('recording')
+        self.fail_key = fail_key
+        self.keys = []
+        self._lock = threading.Lock()
+
+    def process_item(self, fixup_run, item):
+        if str(item.ratingKey) == self.fail_key:
+            raise ValueError("Failing item {}".format(item.ratingKey))
+        with self._lock:
+            self.keys.append(str(item.ratingKey))
+        return 0
+
+
+@pytest.fixture
+def pms():
+    """
+    Fixture that provides a fake PMS serving a generated library.
+    """
+    library = FakeLibrary(movies=25, shows=3, episodes_per_show=4)
+    with FakePMS(library) as _pms:
+        yield _pms
+
+
+def create_walker(pms, fixup, jobs):
+    """
+    Return an AsyncLibraryWalker for the fake PMS with the fixup added.
+    """
+    plex = plexapi.server.PlexServer(pms.baseurl, pms.token)
+    walker = AsyncLibraryWalker(plex, verbose=False, page_size=10, jobs=jobs)
+    assert walker.add_fixup(fixup, False, None, {}) is not None
+    return walker
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_walk(pms, jobs):
+    """
+    Test that the walk passes each item to the fixup exactly once.
+    """
+    fixup = RecordingFixup()
+    walker = create_walker(pms, fixup, jobs)
+
+    rc = walker.walk()
+
+    assert rc == 0
+    assert sorted(fixup.keys) == sorted(pms.library.items)
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_walk_items(pms, jobs):
+    """
+    Test that processing specific items passes just these items to the
+    fixup.
+    """
+    fixup = RecordingFixup()
+    walker = create_walker(pms, fixup, jobs)
+    keys = sorted(pms.library.items)[3:9]
+
+    rc = walker.walk_items(keys)
+
+    assert rc == 0
+    assert sorted(fixup.keys) == keys
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_walk_exception(pms, jobs):
+    """
+    Test that an exception raised by a fixup surfaces from the walk, and is
+    not hidden by the cancellation of the outstanding units of work.
+    """
+    fail_key = sorted(pms.library.items)[2]
+    walker = create_walker(pms, RecordingFixup(fail_key), jobs)
+
+    with pytest.raises(ValueError, match='Failing item'):
+        walker.walk()
+
+
+@pytest.mark.parametrize("jobs", [1, 4])
+def test_walk_items_exception(pms, jobs):
+    """
+    Test that an exception raised by a fixup surfaces from processing
+    specific items.
+    """
+    keys = sorted(pms.library.items)[:10]
+    walker = create_walker(pms, RecordingFixup(keys[1]), jobs)
+
+    with pytest.raises(ValueError, match='Failing item'):
+        walker.walk_items(keys)
@@ -0,0 +1,40 @@
+"""
+End2end tests that run the benchmark of the fixups on a small library.
+
+The full benchmark is run with 'make benchmark'.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import pytest
+
+import plexmediafixup.fixups
+from .benchmark import run_benchmark, HEADER
+from .runner import FIXUP_ENTRIES
+
+# Size of the generated library
+LIBRARY_KWARGS = dict(movies=40, shows=4, episodes_per_show=5)
+
+
+def test_benchmark_covers_all_fixups():
+    """
+    Test that the benchmark covers all fixups of the package.
+    """
+    fixups_dir = os.path.dirname(plexmediafixup.fixups.__file__)
+    names = [os.path.splitext(f)[0] for f in os.listdir(fixups_dir)
+             if f.endswith('.py') and f != '__init__.py']
+    assert sorted(names) == sorted(FIXUP_ENTRIES)
+
+
+@pytest.mark.parametrize("fixup_name", sorted(FIXUP_ENTRIES))
+def test_benchmark(fixup_name):
+    """
+    Test that the benchmark of a fixup runs and reports sensible numbers.
+    """
+    result = run_benchmark(fixup_name, LIBRARY_KWARGS)
+    print("\n" + HEADER + "\n" + str(result))
+
+    assert result.items > 0
+    assert result.items_per_sec > 0
+    assert result.requests > 0
+    assert result.peak_memory > 0
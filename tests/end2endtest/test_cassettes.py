@@ -0,0 +1,145 @@
+"""
+End2end tests that record and replay cassettes of the fixups.
+"""
+
+from __future__ import print_function, absolute_import
+import re
+import json
+import pytest
+
+from .cassettes import record, replay, cassette_file
+from .runner import FIXUP_ENTRIES
+
+# Pattern for the message about the replayed requests
+REPLAYED_PATTERN = re.compile(
+    r"^Replayed (\d+) requests .* \((\d+) recorded\)$", re.MULTILINE)
+
+
+def replayed(result):
+    """
+    Return tuple(replayed, recorded) with the number of replayed requests and
+    recorded requests of a run that replayed a cassette.
+    """
+    m = REPLAYED_PATTERN.search(result.output)
+    assert m, result.output
+    return int(m.group(1)), int(m.group(2))
+
+
+def changes(result):
+    """
+    Return the messages about changed items of a run.
+    """
+    return [line for line in result.output.splitlines()
+            if 'Changing' in line or 'Restoring' in line]
+
+
+@pytest.mark.parametrize("fixup_name", sorted(FIXUP_ENTRIES))
+def test_record_replay(tmpdir, fixup_name):
+    """
+    Test that replaying a recorded run of a fixup sends the same requests
+    and makes the same changes as the recorded run.
+    """
+    filepath = str(tmpdir.join('cassette.jsonl'))
+
+    rec_result = record(fixup_name, filepath)
+
+    assert rec_result.rc == 0, rec_result.output
+    with open(filepath) as fp:
+        lines = fp.readlines()
+    assert len(lines) == len(rec_result.requests) + 1
+    assert 'fake-token' not in ''.join(lines)
+
+    result = replay(fixup_name, filepath)
+
+    assert result.rc == 0, result.output
+    assert replayed(result) == (len(rec_result.requests),
+                                len(rec_result.requests))
+    assert changes(result) == changes(rec_result)
+
+
+def test_record_replay_pages(tmpdir):
+    """
+    Test that the pages of a library section listed with a small page size
+    are recorded under separate requests, and that replaying them returns
+    each page for its own request.
+    """
+    filepath = str(tmpdir.join('cassette.jsonl'))
+    config_items = dict(page_size=5)
+
+    rec_result = record('sync_title', filepath, config_items=config_items)
+
+    assert rec_result.rc == 0, rec_result.output
+    with open(filepath) as fp:
+        requests = [json.loads(line)['request']
+                    for line in fp.readlines()[1:]]
+    # 12 movies in pages of 5 items
+    pages = [r for r in requests
+             if r.startswith('GET /library/sections/1/all ')]
+    assert sorted(pages) == [
+        'GET /library/sections/1/all '
+        '[X-Plex-Container-Start: {}, X-Plex-Container-Size: 5]'.format(s)
+        for s in (0, 10, 5)]
+
+    result = replay('sync_title', filepath, config_items=config_items)
+
+    assert result.rc == 0, result.output
+    assert replayed(result) == (len(rec_result.requests),
+                                len(rec_result.requests))
+    assert changes(result) == changes(rec_result)
+    assert len([c for c in changes(result) if 'of movie' in c]) == 12
+
+
+def test_replay_latency(tmpdir):
+    """
+    Test that replaying a cassette with --replay-latency takes at least the
+    recorded elapsed time of the responses.
+    """
+    filepath = str(tmpdir.join('cassette.jsonl'))
+    rec_result = record('sync_sort_title', filepath, latency=0.02)
+    assert rec_result.rc == 0, rec_result.output
+    with open(filepath) as fp:
+        latency = sum(json.loads(line)['elapsed']
+                      for line in fp.readlines()[1:])
+
+    result = replay('sync_sort_title', filepath, args=['--replay-latency'])
+
+    assert result.rc == 0, result.output
+    assert result.elapsed >= latency
+
+
+def test_replay_latency_without_replay(tmpdir):
+    """
+    Test that --replay-latency is rejected without --replay-cassette.
+    """
+    filepath = str(tmpdir.join('cassette.jsonl'))
+
+    result = record('sync_sort_title', filepath, args=['--replay-latency'])
+
+    assert result.rc == 1
+    assert "Error: Option --replay-latency can only be used with option " \
+        "--replay-cassette" in result.output
+
+
+def test_replay_unrecorded_request():
+    """
+    Test that a request that has not been recorded fails the replay.
+    """
+    result = replay('sync_title', cassette_file('sync_sort_title'))
+
+    assert result.rc == 1
+    assert "No recorded response in cassette" in result.output
+
+
+@pytest.mark.parametrize("fixup_name", sorted(FIXUP_ENTRIES))
+def test_request_count(fixup_name):
+    """
+    Test that a fixup does not send more or other requests than in its
+    recorded cassette. If the requests of a fixup have been changed on
+    purpose, the cassettes are recorded again with
+    'python -m tests.end2endtest.cassettes'.
+    """
+    result = replay(fixup_name, cassette_file(fixup_name))
+
+    assert result.rc == 0, result.output
+    count, recorded = replayed(result)
+    assert count <= recorded, result.output
@@ -0,0 +1,68 @@
+"""
+End2end tests for connecting to a fake PMS at a cached connection URI.
+"""
+
+from __future__ import print_function, absolute_import
+import pytest
+
+from plexmediafixup.cli import connect_cached
+from plexmediafixup.utils.http_session import create_session
+from .fake_pms import FakePMS, FakeLibrary
+
+
+@pytest.fixture
+def pms():
+    """
+    Fixture that provides a fake PMS serving an empty library.
+    """
+    library = FakeLibrary(movies=0, shows=0, episodes_per_show=0)
+    with FakePMS(library) as _pms:
+        yield _pms
+
+
+def test_connect_cached(pms):
+    """
+    Test that connecting at a cached connection URI requests the server
+    just once, with the session of the connection.
+    """
+    session = create_session(2)
+    cached = {'server_uri': pms.baseurl, 'server_token': pms.token}
+
+    plex = connect_cached(cached, 'Fake PMS', session, (5, 5))
+
+    assert plex is not None
+    assert plex._session is session  # pylint: disable=protected-access
+    assert pms.count_requests() == 1
+
+
+def test_connect_cached_not_retried(capsys):
+    """
+    Test that a cached connection URI whose request times out is not
+    retried, and that the session retries its requests again afterwards.
+    """
+    library = FakeLibrary(movies=0, shows=0, episodes_per_show=0)
+    with FakePMS(library, latency=0.5) as pms:
+        session = create_session(2, retries=3, backoff_factor=0)
+        cached = {'server_uri': pms.baseurl, 'server_token': pms.token}
+
+        plex = connect_cached(cached, 'Fake PMS', session, (5, 0.1))
+
+        assert plex is None
+        assert pms.count_requests() == 1
+    assert "Cannot connect to server Fake PMS" in capsys.readouterr().out
+    assert session.get_adapter(pms.baseurl).max_retries.total == 3
+
+
+def test_connect_cached_other_server(pms, capsys):
+    """
+    Test that a cached connection URI that leads to another server is not
+    used.
+    """
+    session = create_session(2)
+    cached = {'server_uri': pms.baseurl, 'server_token': pms.token}
+
+    plex = connect_cached(cached, 'Other PMS', session, (5, 5))
+
+    assert plex is None
+    assert "leads to server Fake PMS instead of server Other PMS" in \
+        capsys.readouterr().out
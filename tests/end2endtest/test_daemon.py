@@ -0,0 +1,169 @@
+"""
+End2end tests for the daemon mode against a fake PMS.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import time
+import signal
+import threading
+import pytest
+from six.moves import _thread
+import yaml  # PyYAML package
+
+from .fake_pms import FakePMS, FakeLibrary
+from .runner import write_config, run_plexmediafixup, MEDIA_ROOT
+
+# Maximum number of seconds to wait for the daemon
+TIMEOUT = 30
+
+
+@pytest.fixture
+def pms_env(tmpdir):
+    """
+    Fixture that provides a fake PMS serving a generated library, with the
+    media files of the library in the 'media' subdirectory of a temporary
+    work directory.
+
+    Yields tuple(pms, workdir).
+    """
+    workdir = str(tmpdir)
+    library = FakeLibrary(movies=10, shows=0, episodes_per_show=0,
+                          media_root=MEDIA_ROOT)
+    library.write_media_files(os.path.join(workdir, 'media'), MEDIA_ROOT)
+    with FakePMS(library) as pms:
+        yield pms, workdir
+
+
+def wait_for(condition):
+    """
+    Wait until the condition function returns True, for up to TIMEOUT
+    seconds, and return whether it did.
+    """
+    deadline = time.time() + TIMEOUT
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def collected(workdir, item):
+    """
+    Return whether the item is in the collections file written by the
+    preserve_collections fixup.
+    """
+    try:
+        with open(os.path.join(workdir, 'collections.yml')) as fp:
+            return item.rating_key in (yaml.safe_load(fp) or {})
+    except (IOError, yaml.YAMLError):
+        return False
+
+
+def test_daemon_new_item(pms_env):
+    """
+    Test that the daemon fixes up an item that is added after the initial
+    walk, with its media file in a directory that has already been listed,
+    that the fixups are finished after processing the item, and that the
+    daemon stops on SIGTERM.
+    """
+    pms, workdir = pms_env
+    config_file = write_config(workdir, pms,
+                               ['sync_title', 'preserve_collections'],
+                               daemon={'debounce': 0})
+    added = []
+    unhandled = []  # SIGTERM signals not handled by the daemon
+    stopped = threading.Event()
+
+    def add_item():
+        # Runs while the daemon runs in the main thread
+        try:
+            # The collections file is first written at the end of the
+            # initial walk
+            first = list(pms.library.items.values())[0]
+            if not wait_for(lambda: pms.notification_clients > 0 and
+                            collected(workdir, first)):
+                return
+            item = pms.library.add_movie(u'New Movie')
+            pms.library.write_media_file(
+                item, os.path.join(workdir, 'media'), MEDIA_ROOT)
+            added.append(item)
+            pms.notify_timeline([item])
+            # The collections file is written when the fixups are finished
+            wait_for(lambda: collected(workdir, item))
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+            if not stopped.wait(TIMEOUT):
+                _thread.interrupt_main()
+
+    saved_handler = signal.signal(
+        signal.SIGTERM, lambda signum, frame: unhandled.append(signum))
+    try:
+        thread = threading.Thread(target=add_item)
+        thread.start()
+        result = run_plexmediafixup(pms, config_file, ['--daemon'])
+        stopped.set()
+        thread.join()
+    finally:
+        signal.signal(signal.SIGTERM, saved_handler)
+
+    assert unhandled == []
+    assert result.rc == 0, result.output
+    assert added, result.output
+    assert added[0].title == u'New Movie (tagged)', result.output
+    assert "Stopping daemon" in result.output
+    assert "Error" not in result.output
+    assert collected(workdir, added[0])
+    # The initial walk and the processing of the new item are separate runs
+    assert result.output.count("Probe statistics") == 2
+    for item in pms.library.items.values():
+        assert item.title == item.file_title
+
+
+def test_daemon_item_during_initial_walk(pms_env):
+    """
+    Test that the daemon fixes up an item that is added during the initial
+    walk, after the items have been listed.
+    """
+    pms, workdir = pms_env
+    config_file = write_config(workdir, pms,
+                               ['sync_title', 'preserve_collections'],
+                               daemon={'debounce': 0})
+    added = []
+    unhandled = []  # SIGTERM signals not handled by the daemon
+    stopped = threading.Event()
+
+    def add_item():
+        # Runs while the daemon runs in the main thread
+        try:
+            # The items are edited after they have been listed
+            if not wait_for(lambda: pms.count_requests('PUT') > 0):
+                return
+            item = pms.library.add_movie(u'New Movie')
+            pms.library.write_media_file(
+                item, os.path.join(workdir, 'media'), MEDIA_ROOT)
+            added.append(item)
+            pms.notify_timeline([item])
+            wait_for(lambda: collected(workdir, item))
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+            if not stopped.wait(TIMEOUT):
+                _thread.interrupt_main()
+
+    saved_handler = signal.signal(
+        signal.SIGTERM, lambda signum, frame: unhandled.append(signum))
+    try:
+        thread = threading.Thread(target=add_item)
+        thread.start()
+        result = run_plexmediafixup(pms, config_file, ['--daemon'])
+        stopped.set()
+        thread.join()
+    finally:
+        signal.signal(signal.SIGTERM, saved_handler)
+
+    assert unhandled == []
+    assert result.rc == 0, result.output
+    assert added, result.output
+    assert added[0].title == u'New Movie (tagged)', result.output
+    assert "Error" not in result.output
+    assert result.output.count("Probe statistics") == 2
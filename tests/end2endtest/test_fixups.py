@@ -0,0 +1,137 @@
+"""
+End2end tests that run the fixups against a fake PMS.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import pytest
+import yaml  # PyYAML package
+
+from .fake_pms import FakePMS, FakeLibrary
+from .runner import write_config, run_plexmediafixup, MEDIA_ROOT
+
+# Size of the generated library
+LIBRARY_KWARGS = dict(movies=30, shows=3, episodes_per_show=4)
+
+
+@pytest.fixture
+def pms_env(tmpdir):
+    """
+    Fixture that provides a fake PMS serving a generated library, with the
+    media files of the library in the 'media' subdirectory of a temporary
+    work directory.
+
+    Yields tuple(pms, workdir).
+    """
+    workdir = str(tmpdir)
+    library = FakeLibrary(media_root=MEDIA_ROOT, **LIBRARY_KWARGS)
+    library.write_media_files(os.path.join(workdir, 'media'), MEDIA_ROOT)
+    with FakePMS(library) as pms:
+        yield pms, workdir
+
+
+def edits(result):
+    """
+    Return the edit requests of a run.
+    """
+    return [r for r in result.requests if r[0] == 'PUT']
+
+
+@pytest.mark.parametrize("args", [[], ['--jobs', '4'],
+                                  ['--jobs', '4', '--engine', 'asyncio']])
+def test_sync_sort_title(pms_env, args):
+    """
+    Test that sync_sort_title sets the sort titles to the titles, and that an
+    incremental run after that does not change anything.
+    """
+    pms, workdir = pms_env
+    config_file = write_config(workdir, pms, ['sync_sort_title'])
+
+    result = run_plexmediafixup(pms, config_file, ['--incremental'] + args)
+
+    assert result.rc == 0, result.output
+    assert edits(result)
+    for item in pms.library.items.values():
+        assert item.title_sort == item.title
+
+    result = run_plexmediafixup(pms, config_file, ['--incremental'] + args)
+
+    assert result.rc == 0, result.output
+    assert edits(result) == []
+
+
+def test_sync_sort_title_dryrun(pms_env):
+    """
+    Test that sync_sort_title in dryrun mode does not change anything.
+    """
+    pms, workdir = pms_env
+    config_file = write_config(workdir, pms, ['sync_sort_title'])
+
+    result = run_plexmediafixup(pms, config_file, ['--dryrun'])
+
+    assert result.rc == 0, result.output
+    assert edits(result) == []
+    assert "Dryrun: Changing sort title" in result.output
+
+
+def test_sync_title(pms_env):
+    """
+    Test that sync_title sets the titles of movies and episodes to the title
+    tags of their media files.
+    """
+    pms, workdir = pms_env
+    config_file = write_config(workdir, pms, ['sync_title'])
+
+    result = run_plexmediafixup(pms, config_file)
+
+    assert result.rc == 0, result.output
+    for item in pms.library.items.values():
+        if item.type in ('movie', 'episode'):
+            assert item.title == item.file_title
+
+
+def test_video_genre_cleanup(pms_env):
+    """
+    Test that video_genre_cleanup changes and removes the configured genres.
+    """
+    pms, workdir = pms_env
+    config_file = write_config(workdir, pms, ['video_genre_cleanup'])
+
+    result = run_plexmediafixup(pms, config_file)
+
+    assert result.rc == 0, result.output
+    for item in pms.library.items.values():
+        if item.type in ('movie', 'show'):
+            assert 'Sci-Fi' not in item.genres
+            assert 'Western' not in item.genres
+            assert item.genres
+    assert any('Science Fiction' in item.genres
+               for item in pms.library.items.values())
+
+
+def test_preserve_collections(pms_env):
+    """
+    Test that preserve_collections saves the collections of the items in the
+    collections file, and restores collections that the PMS has lost.
+    """
+    pms, workdir = pms_env
+    config_file = write_config(workdir, pms, ['preserve_collections'])
+
+    result = run_plexmediafixup(pms, config_file)
+
+    assert result.rc == 0, result.output
+    with open(os.path.join(workdir, 'collections.yml')) as fp:
+        coll_dict = yaml.safe_load(fp)
+    assert coll_dict
+
+    items = [item for item in pms.library.items.values() if item.collections]
+    expected = dict([(item.rating_key, list(item.collections))
+                     for item in items])
+    for item in items:
+        item.collections = []
+
+    result = run_plexmediafixup(pms, config_file)
+
+    assert result.rc == 0, result.output
+    for item in items:
+        assert item.collections == expected[item.rating_key]
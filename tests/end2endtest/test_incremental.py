@@ -0,0 +1,106 @@
+"""
+End2end tests for the watermarks of incremental runs against a fake PMS.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import pytest
+import plexapi.server
+
+from plexmediafixup.fixup import Fixup, LibraryWalker
+from plexmediafixup.utils.state_file import StateFile
+from .fake_pms import FakePMS, FakeLibrary
+
+
+class ChangingFixup(Fixup):
+    """
+    Fixup for movies that records the items passed to it, and optionally
+    changes items of the fake library while the first item is processed.
+    """
+
+    valid_section_types = ['movie']
+    item_types = ['movie']
+
+    def __init__(self, changes=None):
+        super(ChangingFixup, self).__init__('changing')
+        self.changes = changes or {}  # updated_at by FakeItem
+        self.keys = []
+
+    def process_item(self, fixup_run, item):
+        self.keys.append(str(item.ratingKey))
+        for fake_item, updated_at in self.changes.items():
+            fake_item.updated_at = updated_at
+        self.changes = {}
+        return 0
+
+
+@pytest.fixture
+def pms():
+    """
+    Fixture that provides a fake PMS serving a generated library.
+    """
+    library = FakeLibrary(movies=25, shows=0, episodes_per_show=0)
+    with FakePMS(library) as _pms:
+        yield _pms
+
+
+def run_walker(pms, state, fixup):
+    """
+    Run an incremental walk with the fixup, in pages of 10 items.
+    """
+    plex = plexapi.server.PlexServer(pms.baseurl, pms.token)
+    walker = LibraryWalker(plex, verbose=False, page_size=10, state=state,
+                           incremental=True)
+    assert walker.add_fixup(fixup, False, None, {}) is not None
+    return walker.walk()
+
+
+def test_watermark_capped_at_listing_start(tmpdir, pms):
+    """
+    Test that an item of an earlier page that changes during the walk is
+    processed by the next incremental run, even though a later page showed
+    an item with a later change.
+    """
+    state = StateFile(str(tmpdir.join('state.yml')))
+    movies = pms.library.sections[0].items
+    now = int(time.time())
+    first_movie, last_movie = movies[0], movies[-1]
+    fixup = ChangingFixup({first_movie: now + 50, last_movie: now + 100})
+
+    rc = run_walker(pms, state, fixup)
+
+    assert rc == 0
+    assert len(fixup.keys) == len(movies)
+
+    fixup = ChangingFixup()
+
+    rc = run_walker(pms, state, fixup)
+
+    assert rc == 0
+    assert first_movie.rating_key in fixup.keys
+    assert last_movie.rating_key in fixup.keys
+
+
+def test_watermark_skips_unchanged_items(tmpdir, pms):
+    """
+    Test that the next incremental run does not process items that have not
+    changed since the watermark.
+    """
+    state = StateFile(str(tmpdir.join('state.yml')))
+    movies = pms.library.sections[0].items
+    for i, movie in enumerate(movies):
+        movie.updated_at += i
+
+    rc = run_walker(pms, state, ChangingFixup())
+
+    assert rc == 0
+
+    movies[3].updated_at = int(time.time()) + 10
+    fixup = ChangingFixup()
+
+    rc = run_walker(pms, state, fixup)
+
+    assert rc == 0
+    # Items changed in the same second as the watermark are processed again
+    assert sorted(fixup.keys) == sorted([movies[3].rating_key,
+                                         movies[-1].rating_key])
@@ -0,0 +1,113 @@
+"""
+End2end tests for the rate limiting of the requests of a library walk
+against a fake PMS.
+"""
+
+from __future__ import print_function, absolute_import
+import threading
+import pytest
+import plexapi.server
+
+from plexmediafixup.fixup import Fixup, LibraryWalker
+from plexmediafixup.async_walker import AsyncLibraryWalker
+from plexmediafixup.utils.http_session import create_session
+from plexmediafixup.utils.rate_limiter import RateLimiter
+from plexmediafixup.utils.state_file import StateFile
+from .fake_pms import FakePMS, FakeLibrary
+
+
+class CountingRateLimiter(RateLimiter):
+    """
+    Rate limiter that counts the requests it has limited.
+    """
+
+    def __init__(self, rate):
+        super(CountingRateLimiter, self).__init__(rate)
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    def acquire(self):
+        with self._count_lock:
+            self.requests += 1
+        super(CountingRateLimiter, self).acquire()
+
+
+class FullItemsFixup(Fixup):
+    """
+    Fixup that needs the full metadata of all item types, and does not make
+    any requests of its own.
+    """
+
+    item_types = ['movie', 'show', 'episode']
+    full_items = True
+
+    def __init__(self):
+        super(FullItemsFixup, self).__init__('full_items')
+
+    def process_item(self, fixup_run, item):
+        return 0
+
+
+@pytest.fixture
+def pms():
+    """
+    Fixture that provides a fake PMS serving a generated library.
+    """
+    library = FakeLibrary(movies=25, shows=3, episodes_per_show=4)
+    with FakePMS(library) as _pms:
+        yield _pms
+
+
+def create_walker(pms, walker_class, state=None):
+    """
+    Return a walker for the fake PMS with two fixups that are rate limited
+    with different rates, and the rate limiters of the fixups.
+    """
+    plex = plexapi.server.PlexServer(pms.baseurl, pms.token,
+                                     session=create_session(6))
+    walker = walker_class(plex, verbose=False, page_size=10, jobs=4,
+                          state=state)
+    limiters = []
+    for rate in (1000, 2000):
+        fixup_run = walker.add_fixup(FullItemsFixup(), False, None, {},
+                                     requests_per_second=rate)
+        assert fixup_run is not None
+        fixup_run.rate_limiter = CountingRateLimiter(rate)
+        limiters.append(fixup_run.rate_limiter)
+    pms.reset_requests()
+    return walker, limiters
+
+
+@pytest.mark.parametrize("walker_class", [LibraryWalker, AsyncLibraryWalker])
+def test_walk_rate_limited(tmpdir, pms, walker_class):
+    """
+    Test that the requests for listing and fetching the items of a walk,
+    and for the time of the PMS, are limited by the strictest rate limiter
+    of the fixups.
+    """
+    state = StateFile(str(tmpdir.join('state.yml')))
+    walker, (strict, lax) = create_walker(pms, walker_class, state)
+
+    rc = walker.walk()
+
+    assert rc == 0
+    assert pms.count_requests(path_prefix='/identity') > 0
+    assert pms.count_requests(path_prefix='/library/metadata/') > 0
+    assert strict.requests == len(pms.requests)
+    assert lax.requests == 0
+
+
+@pytest.mark.parametrize("walker_class", [LibraryWalker, AsyncLibraryWalker])
+def test_walk_items_rate_limited(pms, walker_class):
+    """
+    Test that the requests for fetching specific items are limited by the
+    strictest rate limiter of the fixups.
+    """
+    walker, (strict, lax) = create_walker(pms, walker_class)
+
+    rc = walker.walk(rating_keys=sorted(pms.library.items)[3:9])
+
+    assert rc == 0
+    assert len(pms.requests) > 0
+    assert strict.requests == len(pms.requests)
+    assert lax.requests == 0
@@ -0,0 +1,58 @@
+"""
+Unit tests for the cassette module.
+"""
+
+from __future__ import print_function, absolute_import
+import io
+import json
+import pytest
+
+from plexmediafixup.utils.cassette import request_key, CassettePlayer, \
+    CASSETTE_VERSION
+
+
+@pytest.mark.parametrize("method, url, headers, exp_key", [
+    ('GET', 'http://pms:32400/', None, 'GET /'),
+    ('GET', 'https://other:1234/library?X-Plex-Token=secret', None,
+     'GET /library'),
+    ('PUT', 'http://pms:32400/library/sections/1/all?type=1&id=1001', None,
+     'PUT /library/sections/1/all?id=1001&type=1'),
+    ('GET', 'http://pms:32400/library/sections/1/all',
+     {'x-plex-container-size': '50', 'X-Plex-Container-Start': '100',
+      'Accept': 'application/xml', 'X-Plex-Token': 'secret'},
+     'GET /library/sections/1/all '
+     '[X-Plex-Container-Start: 100, X-Plex-Container-Size: 50]'),
+])
+def test_request_key(method, url, headers, exp_key):
+    """
+    Test that the request key contains the method, the path, the sorted
+    query parameters and the paging headers, without the credentials.
+    """
+    assert request_key(method, url, headers) == exp_key
+
+
+def test_play_pages(tmpdir):
+    """
+    Test that the recorded pages of a listing are replayed by their paging
+    headers, regardless of the order in which they are requested.
+    """
+    url = 'http://pms:32400/library/sections/1/all'
+    filepath = str(tmpdir.join('cassette.jsonl'))
+    with io.open(filepath, 'w', encoding='utf-8') as fp:
+        fp.write(json.dumps({'version': CASSETTE_VERSION}) + u'\n')
+        for start in (0, 5, 10):
+            headers = {'X-Plex-Container-Start': str(start),
+                       'X-Plex-Container-Size': '5'}
+            exchange = {'request': request_key('GET', url, headers),
+                        'body': u'page {}'.format(start)}
+            fp.write(json.dumps(exchange) + u'\n')
+    player = CassettePlayer(filepath)
+
+    for start in (10, 0, 5):
+        headers = {'X-Plex-Container-Start': str(start),
+                   'X-Plex-Container-Size': '5'}
+        exchange = player.play('GET', url, headers)
+        assert exchange['body'] == u'page {}'.format(start)
+
+    assert player.play('GET', url) is None
+    assert player.count == 3
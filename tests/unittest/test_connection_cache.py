@@ -0,0 +1,123 @@
+"""
+Unit tests for the connection_cache module.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import stat
+import time
+import pytest
+
+from plexmediafixup.utils.connection_cache import ConnectionCache, \
+    ConnectionCacheError
+
+
+def test_load_missing(tmpdir):
+    """
+    Test that a cache file that does not exist is loaded as empty.
+    """
+    cache = ConnectionCache(str(tmpdir.join('connections.yml')))
+
+    cache.load()
+
+    assert cache.get('user', 'server') is None
+
+
+def test_save_load(tmpdir):
+    """
+    Test that the connections are persisted per account and server.
+    """
+    filepath = str(tmpdir.join('connections.yml'))
+    cache = ConnectionCache(filepath)
+    cache.set('user', 'server1', 'acct-token', 'https://1.2.3.4:32400',
+              'srv-token')
+    cache.set('user', 'server2', 'acct-token', 'https://5.6.7.8:32400',
+              'srv-token2')
+    cache.save()
+
+    cache = ConnectionCache(filepath)
+    cache.load()
+
+    assert cache.filepath == filepath
+    connection = cache.get('user', 'server1')
+    assert connection['account_token'] == 'acct-token'
+    assert connection['server_uri'] == 'https://1.2.3.4:32400'
+    assert connection['server_token'] == 'srv-token'
+    assert cache.get('user', 'server2')['server_token'] == 'srv-token2'
+    assert cache.get('other', 'server1') is None
+
+
+def test_remove(tmpdir):
+    """
+    Test that a removed connection is no longer returned.
+    """
+    cache = ConnectionCache(str(tmpdir.join('connections.yml')))
+    cache.set('user', 'server', 'acct-token', 'https://1.2.3.4:32400',
+              'srv-token')
+
+    cache.remove('user', 'server')
+    cache.remove('user', 'missing')
+
+    assert cache.get('user', 'server') is None
+
+
+def test_expired(tmpdir):
+    """
+    Test that a connection that was resolved longer ago than the TTL is not
+    returned.
+    """
+    cache = ConnectionCache(str(tmpdir.join('connections.yml')), ttl=1)
+    cache.set('user', 'server', 'acct-token', 'https://1.2.3.4:32400',
+              'srv-token')
+    assert cache.get('user', 'server') is not None
+
+    cache.get('user', 'server')['resolved_at'] = int(time.time()) - 3601
+
+    assert cache.get('user', 'server') is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'fchmod'),
+                    reason="File permissions are not supported")
+@pytest.mark.parametrize("initial_mode", [None, 0o644])
+def test_save_permissions(tmpdir, initial_mode):
+    """
+    Test that the cache file is saved with permissions for the owner only,
+    also when it already existed with broader permissions.
+    """
+    filepath = str(tmpdir.join('connections.yml'))
+    if initial_mode is not None:
+        tmpdir.join('connections.yml').write('')
+        os.chmod(filepath, initial_mode)
+    cache = ConnectionCache(filepath)
+    cache.set('user', 'server', 'acct-token', 'https://1.2.3.4:32400',
+              'srv-token')
+
+    cache.save()
+
+    assert stat.S_IMODE(os.stat(filepath).st_mode) == 0o600
+
+
+@pytest.mark.parametrize("content", [
+    "connections: [",
+    "- a list",
+])
+def test_load_invalid(tmpdir, content):
+    """
+    Test that a cache file that is not valid YAML or not a mapping fails to
+    load.
+    """
+    tmpdir.join('connections.yml').write(content)
+    cache = ConnectionCache(str(tmpdir.join('connections.yml')))
+
+    with pytest.raises(ConnectionCacheError):
+        cache.load()
+
+
+def test_save_error(tmpdir):
+    """
+    Test that a cache file that cannot be written fails to save.
+    """
+    cache = ConnectionCache(str(tmpdir.join('missing', 'connections.yml')))
+
+    with pytest.raises(ConnectionCacheError):
+        cache.save()
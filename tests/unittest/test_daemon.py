@@ -0,0 +1,213 @@
+"""
+Unit tests for the daemon module.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import pytest
+
+from plexmediafixup.daemon import DebounceQueue, FixupDaemon, \
+    alert_rating_keys
+
+
+class StubListener(object):
+    """
+    Listener that just records whether it is running.
+    """
+
+    description = "stub notifications"
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.alive = False
+
+    def start(self):
+        """
+        Start listening.
+        """
+        self.alive = True
+
+    def stop(self):
+        """
+        Stop listening.
+        """
+        self.alive = False
+
+    def is_alive(self):
+        """
+        Return whether the listener is running.
+        """
+        return self.alive
+
+
+class StubWalker(object):
+    """
+    Library walker that records its walks and, during the initial walk,
+    notifies about a changed item and an item it has just edited.
+    """
+
+    plex = None
+    prefetch_batch_size = 10
+
+    def __init__(self):
+        self.listeners = []
+        self.walks = []  # rating_keys of each walk, None for the library
+        self.edited = set()
+
+    def walk(self, incremental=None, rating_keys=None):
+        """
+        Record the walk, and interrupt the daemon after the first batch of
+        items.
+        """
+        # pylint: disable=unused-argument
+        self.walks.append(rating_keys)
+        if rating_keys is None:
+            self.edited.add('1002')
+            self.listeners[-1].callback(['1001', '1002'])
+        else:
+            raise KeyboardInterrupt
+        return 0
+
+    def recently_edited(self, rating_key):
+        """
+        Return whether the item has been edited by the walk.
+        """
+        return rating_key in self.edited
+
+    def cleanup_fixups(self):
+        """
+        Clean up the fixups.
+        """
+
+    def listener(self, plex, callback):
+        """
+        Listener factory for the daemon.
+        """
+        # pylint: disable=unused-argument
+        listener = StubListener(callback)
+        self.listeners.append(listener)
+        return listener
+
+
+def timeline_entry(item_id, type_=1, state=5,
+                   identifier='com.plexapp.plugins.library'):
+    """
+    Return a timeline entry of a notification.
+    """
+    return {'identifier': identifier, 'itemID': item_id, 'type': type_,
+            'state': state}
+
+
+def activity_entry(key, event='ended'):
+    """
+    Return an activity entry of a notification.
+    """
+    return {'event': event, 'Activity': {'Context': {'key': key}}}
+
+
+@pytest.mark.parametrize("data, exp_keys", [
+    ({'type': 'timeline',
+      'TimelineEntry': [timeline_entry(1001), timeline_entry('1002', 4)]},
+     ['1001', '1002']),
+    ({'type': 'timeline',
+      'TimelineEntry': [timeline_entry(1001, state=0),
+                        timeline_entry(1002, type_=8),
+                        timeline_entry(1003, identifier='other'),
+                        timeline_entry(None)]},
+     []),
+    ({'type': 'activity',
+      'ActivityNotification': [activity_entry('/library/metadata/1001'),
+                               activity_entry('/library/metadata/1002',
+                                              event='started'),
+                               activity_entry('/library/sections/1')]},
+     ['1001']),
+    ({'type': 'playing', 'PlaySessionStateNotification': []}, []),
+    ({}, []),
+])
+def test_alert_rating_keys(data, exp_keys):
+    """
+    Test that the rating keys of added or changed items are extracted from
+    the notifications.
+    """
+    assert alert_rating_keys(data) == exp_keys
+
+
+def test_queue_debounce():
+    """
+    Test that a key becomes due only after it has not been put for the
+    debounce time, and that putting it again postpones it.
+    """
+    queue = DebounceQueue(debounce=0.2)
+    queue.put('a')
+    queue.put('b')
+    time.sleep(0.1)
+    queue.put('a')
+
+    assert queue.get(10, 0) == []
+    assert queue.get(10, 1) == ['b']
+    assert len(queue) == 1
+    assert queue.get(10, 1) == ['a']
+    assert len(queue) == 0
+
+
+def test_queue_max_keys():
+    """
+    Test that at most the specified number of due keys is returned, in the
+    order they became due.
+    """
+    queue = DebounceQueue(debounce=0)
+    for key in ('a', 'b', 'c'):
+        queue.put(key)
+
+    assert queue.get(2, 1) == ['a', 'b']
+    assert queue.get(2, 1) == ['c']
+
+
+def test_queue_timeout():
+    """
+    Test that getting from an empty queue returns no keys after the timeout.
+    """
+    queue = DebounceQueue(debounce=0)
+    start = time.time()
+
+    assert queue.get(10, 0.1) == []
+    assert time.time() - start >= 0.1
+
+
+def test_queue_overflow():
+    """
+    Test that a key put into a full queue is dropped and marks the queue as
+    overflowed, and that clearing the queue resets the mark.
+    """
+    queue = DebounceQueue(debounce=0, max_size=2)
+    queue.put('a')
+    queue.put('b')
+    queue.put('a')
+    assert not queue.overflowed
+
+    queue.put('c')
+
+    assert queue.overflowed
+    assert queue.get(10, 0.1) == []
+    queue.clear()
+    assert not queue.overflowed
+    assert len(queue) == 0
+
+
+def test_daemon_initial_walk(capsys):
+    """
+    Test that the items changed during the initial walk are processed after
+    it, except for the items edited by the walk itself.
+    """
+    walker = StubWalker()
+    daemon = FixupDaemon(walker, debounce=0,
+                         listener_factory=walker.listener)
+
+    assert daemon.run() == 0
+
+    assert walker.walks == [None, ['1001']]
+    assert len(walker.listeners) == 1
+    assert not walker.listeners[0].alive
+    out = capsys.readouterr().out
+    assert "Listening for stub notifications" in out
+    assert "Stopping daemon" in out
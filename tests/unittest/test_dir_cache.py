@@ -0,0 +1,135 @@
+"""
+Unit tests for the dir_cache module.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+
+from plexmediafixup.utils.dir_cache import DirCache
+
+
+class CountingScandir(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Replacement for os.scandir() that counts the listed directories.
+    """
+
+    def __init__(self):
+        self.listed = []
+        self._scandir = os.scandir
+
+    def __call__(self, path):
+        self.listed.append(path)
+        return self._scandir(path)
+
+
+def make_dir(tmpdir, names):
+    """
+    Create a directory with files of the specified names, each containing
+    its name, and return the directory path.
+    """
+    media_dir = tmpdir.mkdir('media')
+    for name in names:
+        media_dir.join(name).write(name)
+    return str(media_dir)
+
+
+def test_exists(tmpdir, monkeypatch):
+    """
+    Test that existence queries are answered from a single listing of the
+    directory.
+    """
+    dirpath = make_dir(tmpdir, ['a.mkv', 'b.mkv'])
+    scandir = CountingScandir()
+    monkeypatch.setattr(os, 'scandir', scandir)
+    cache = DirCache()
+
+    assert cache.exists(os.path.join(dirpath, 'a.mkv')) is True
+    assert cache.exists(os.path.join(dirpath, 'b.mkv')) is True
+    assert cache.exists(os.path.join(dirpath, 'c.mkv')) is False
+    assert cache.exists(os.path.join(dirpath, 'missing', 'd.mkv')) is False
+    assert scandir.listed == [dirpath, os.path.join(dirpath, 'missing')]
+
+
+def test_stat(tmpdir):
+    """
+    Test that the stat results of the files are those of os.stat().
+    """
+    dirpath = make_dir(tmpdir, ['a.mkv'])
+    path = os.path.join(dirpath, 'a.mkv')
+    cache = DirCache()
+
+    stat = cache.stat(path)
+
+    assert (stat.st_size, stat.st_mtime) == \
+        (os.stat(path).st_size, os.stat(path).st_mtime)
+    assert cache.stat(os.path.join(dirpath, 'c.mkv')) is None
+
+
+def test_file_added(tmpdir):
+    """
+    Test that a file added after its directory was listed is found.
+    """
+    dirpath = make_dir(tmpdir, ['a.mkv'])
+    cache = DirCache()
+    assert cache.exists(os.path.join(dirpath, 'a.mkv')) is True
+
+    tmpdir.join('media', 'new.mkv').write('new')
+
+    assert cache.exists(os.path.join(dirpath, 'new.mkv')) is True
+    assert cache.stat(os.path.join(dirpath, 'new.mkv')).st_size == 3
+
+
+def test_case_mismatch(tmpdir, monkeypatch):
+    """
+    Test that a file whose name is not in the listing is checked directly,
+    as on a case-insensitive file system.
+    """
+    dirpath = make_dir(tmpdir, ['a.mkv'])
+    checked = []
+    monkeypatch.setattr(os.path, 'exists',
+                        lambda path: checked.append(path) or True)
+    cache = DirCache()
+
+    assert cache.exists(os.path.join(dirpath, 'a.mkv')) is True
+    assert cache.exists(os.path.join(dirpath, 'A.MKV')) is True
+    assert checked == [os.path.join(dirpath, 'A.MKV')]
+
+
+def test_clear(tmpdir, monkeypatch):
+    """
+    Test that clearing the cache causes the directories to be listed again,
+    so that changed files are reported with their new stat results.
+    """
+    dirpath = make_dir(tmpdir, ['a.mkv'])
+    path = os.path.join(dirpath, 'a.mkv')
+    scandir = CountingScandir()
+    monkeypatch.setattr(os, 'scandir', scandir)
+    cache = DirCache()
+    assert cache.stat(path).st_size == 5
+
+    tmpdir.join('media', 'a.mkv').write('changed')
+    cache.clear()
+
+    assert cache.stat(path).st_size == 7
+    assert scandir.listed == [dirpath, dirpath]
+
+
+def test_max_dirs(tmpdir, monkeypatch):
+    """
+    Test that the least recently used listings are discarded when the
+    maximum number of directories is exceeded.
+    """
+    dirs = [str(tmpdir.mkdir(name)) for name in ('d1', 'd2', 'd3')]
+    scandir = CountingScandir()
+    monkeypatch.setattr(os, 'scandir', scandir)
+    cache = DirCache(max_dirs=2)
+
+    cache.exists(os.path.join(dirs[0], 'a.mkv'))
+    cache.exists(os.path.join(dirs[1], 'a.mkv'))
+    cache.exists(os.path.join(dirs[0], 'a.mkv'))
+    cache.exists(os.path.join(dirs[2], 'a.mkv'))
+    cache.exists(os.path.join(dirs[0], 'a.mkv'))
+    cache.exists(os.path.join(dirs[1], 'a.mkv'))
+
+    assert scandir.listed == [dirs[0], dirs[1], dirs[2], dirs[1]]
@@ -0,0 +1,247 @@
+"""
+Unit tests for the edit_batcher module.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import requests.exceptions
+from six.moves.urllib.parse import urlsplit, parse_qs
+
+from plexmediafixup.utils import edit_batcher
+from plexmediafixup.utils.edit_batcher import EditBatcher
+
+
+class StubSession(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Session whose put method is passed to StubPlex.query().
+    """
+
+    def put(self):
+        """
+        Never called, just identifies the HTTP method.
+        """
+        raise NotImplementedError
+
+
+class StubPlex(object):
+    # pylint: disable=too-few-public-methods
+    """
+    PMS that records the edit requests, and optionally fails them.
+    """
+
+    def __init__(self, fail=False):
+        self._session = StubSession()
+        self.fail = fail
+        self.edits = []  # tuple(section_id, query dict)
+
+    def query(self, path, method):
+        """
+        Record an edit request.
+        """
+        assert method == self._session.put
+        parts = urlsplit(path)
+        self.edits.append((parts.path.split('/')[3],
+                           dict([(k, v[0]) for k, v in
+                                 parse_qs(parts.query).items()])))
+        if self.fail:
+            raise requests.exceptions.ConnectionError("Connection refused")
+
+
+class StubItem(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Movie item that counts its reloads.
+    """
+
+    type = 'movie'
+
+    def __init__(self, rating_key, section_id=1):
+        self.ratingKey = rating_key
+        self.librarySectionID = section_id
+        self.reloads = 0
+
+    def reload(self):
+        """
+        Reload the item.
+        """
+        self.reloads += 1
+
+
+class StubVerifier(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Verifier that records the expected edits.
+    """
+
+    def __init__(self):
+        self.expected = []
+
+    def expect(self, item, check):
+        """
+        Record an expected edit.
+        """
+        self.expected.append((item, check))
+
+
+def check_ok(item):
+    # pylint: disable=unused-argument
+    """
+    Check function for an edit that did stick.
+    """
+    return 0
+
+
+def edit(batcher, rating_key, value, section_id=1):
+    """
+    Add an edit of the sort title of a movie item to the batcher, and return
+    the return code.
+    """
+    item = StubItem(rating_key, section_id)
+    return batcher.edit(item, {'titleSort.value': value,
+                               'titleSort.locked': 1},
+                        "edit {}".format(rating_key), check_ok)
+
+
+def test_flush_size_1():
+    """
+    Test that with a flush size of 1, each edit is sent immediately.
+    """
+    plex = StubPlex()
+    batcher = EditBatcher(plex, flush_size=1, verifier=StubVerifier())
+
+    assert edit(batcher, 1001, 'a') == 0
+    assert edit(batcher, 1002, 'a') == 0
+
+    assert [e[1]['id'] for e in plex.edits] == ['1001', '1002']
+    assert plex.edits[0][1] == {'titleSort.value': 'a',
+                                'titleSort.locked': '1',
+                                'type': '1', 'id': '1001'}
+
+
+def test_identical_edits_batched():
+    """
+    Test that identical edits are sent as a multi-item edit when the flush
+    size is reached, and that different edits are sent separately.
+    """
+    plex = StubPlex()
+    batcher = EditBatcher(plex, flush_size=3, flush_interval=1000,
+                          verifier=StubVerifier())
+
+    edit(batcher, 1001, 'a')
+    edit(batcher, 1002, 'b')
+    edit(batcher, 1003, 'a')
+    assert plex.edits == []
+
+    edit(batcher, 1004, 'a')
+    assert [e[1]['id'] for e in plex.edits] == ['1001,1003,1004']
+
+    assert batcher.flush() == 0
+    assert [e[1]['id'] for e in plex.edits] == ['1001,1003,1004', '1002']
+    assert plex.edits[1][1]['titleSort.value'] == 'b'
+
+    assert batcher.flush() == 0
+    assert len(plex.edits) == 2
+
+
+def test_edits_per_section():
+    """
+    Test that identical edits in different library sections are sent
+    separately.
+    """
+    plex = StubPlex()
+    batcher = EditBatcher(plex, flush_size=10, flush_interval=1000,
+                          verifier=StubVerifier())
+
+    edit(batcher, 1001, 'a', section_id=1)
+    edit(batcher, 2001, 'a', section_id=2)
+    batcher.flush()
+
+    assert sorted([(e[0], e[1]['id']) for e in plex.edits]) == \
+        [('1', '1001'), ('2', '2001')]
+
+
+def test_flush_interval():
+    """
+    Test that pending edits that have been held back for the flush interval
+    are sent with the next added edit.
+    """
+    plex = StubPlex()
+    batcher = EditBatcher(plex, flush_size=10, flush_interval=0.001,
+                          verifier=StubVerifier())
+
+    edit(batcher, 1001, 'a')
+    assert plex.edits == []
+
+    time.sleep(0.01)
+    edit(batcher, 1002, 'b')
+
+    assert [e[1]['id'] for e in plex.edits] == ['1001']
+
+
+def test_verifier():
+    """
+    Test that the sent edits are passed to the verifier.
+    """
+    verifier = StubVerifier()
+    batcher = EditBatcher(StubPlex(), flush_size=2, verifier=verifier)
+
+    edit(batcher, 1001, 'a')
+    edit(batcher, 1002, 'a')
+
+    assert [item.ratingKey for item, _ in verifier.expected] == [1001, 1002]
+    assert [item.reloads for item, _ in verifier.expected] == [0, 0]
+
+
+def test_no_verifier():
+    """
+    Test that without a verifier, each sent edit is verified immediately by
+    reloading the item and calling the check function.
+    """
+    batcher = EditBatcher(StubPlex(), flush_size=1)
+    item = StubItem(1001)
+    checked = []
+
+    rc = batcher.edit(item, {'titleSort.value': 'a'}, "edit",
+                      lambda i: checked.append(i) or 1)
+
+    assert rc == 1
+    assert item.reloads == 1
+    assert checked == [item]
+
+
+def test_edit_error(capsys):
+    """
+    Test that a failed edit request is reported for each of its edits.
+    """
+    batcher = EditBatcher(StubPlex(fail=True), flush_size=2,
+                          verifier=StubVerifier())
+
+    assert edit(batcher, 1001, 'a') == 0
+    assert edit(batcher, 1002, 'a') == 1
+
+    out = capsys.readouterr().out
+    assert "Error: Cannot edit 1001: Connection refused" in out
+    assert "Error: Cannot edit 1002: Connection refused" in out
+
+
+def test_recently_edited(monkeypatch):
+    """
+    Test that the rating keys of the sent edits are remembered for the
+    recent edit time, and that pending edits are not yet remembered.
+    """
+    monkeypatch.setattr(edit_batcher, 'RECENT_EDIT_TIME', 0.2)
+    batcher = EditBatcher(StubPlex(), flush_size=2, flush_interval=1000,
+                          verifier=StubVerifier())
+
+    edit(batcher, 1001, 'a')
+    assert not batcher.recently_edited(1001)
+
+    edit(batcher, 1002, 'a')
+    assert batcher.recently_edited(1001)
+    assert batcher.recently_edited('1002')
+    assert not batcher.recently_edited(1003)
+
+    time.sleep(0.3)
+    assert not batcher.recently_edited(1001)
+    assert not batcher.recently_edited('1002')
@@ -0,0 +1,164 @@
+"""
+Unit tests for the edit_verifier module.
+"""
+
+from __future__ import print_function, absolute_import
+import pytest
+import requests.exceptions
+
+from plexmediafixup.utils.edit_verifier import EditVerifier, VERIFY_FULL, \
+    VERIFY_SAMPLED, VERIFY_OFF, VERIFY_BATCH_SIZE
+
+
+class StubItem(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Movie item with a title.
+    """
+
+    type = 'movie'
+
+    def __init__(self, rating_key, title):
+        self.ratingKey = rating_key
+        self.title = title
+
+
+class StubPlex(object):
+    """
+    PMS that answers multi-item metadata requests from a dict of items, and
+    records the requested rating keys.
+    """
+
+    def __init__(self, items, fail=False):
+        self.items = items  # StubItem by rating key
+        self.fail = fail
+        self.requests = []  # list of requested rating keys
+
+    def query(self, key):
+        """
+        Return the rating keys of a metadata request.
+        """
+        if self.fail:
+            raise requests.exceptions.ConnectionError("Connection refused")
+        keys = [int(k) for k in key.split('/')[-1].split(',')]
+        self.requests.append(keys)
+        return keys
+
+    def findItems(self, data, initpath):
+        # pylint: disable=invalid-name,unused-argument
+        """
+        Return the existing items for the rating keys.
+        """
+        return [self.items[k] for k in data if k in self.items]
+
+
+def title_check(title):
+    """
+    Return a check function that verifies the title of an item.
+    """
+    def check(item):
+        if item.title != title:
+            print("Error: title {!r} did not stick".format(title))
+            return 1
+        return 0
+    return check
+
+
+def test_verify_full():
+    """
+    Test that in full mode, all edits are verified with a single request,
+    and that a failed verification is reported.
+    """
+    plex = StubPlex({1: StubItem(1, 'a'), 2: StubItem(2, 'x')})
+    verifier = EditVerifier(plex, VERIFY_FULL)
+    verifier.expect(StubItem(1, 'old'), title_check('a'))
+    verifier.expect(StubItem(2, 'old'), title_check('b'))
+
+    rc = verifier.verify()
+
+    assert rc == 1
+    assert plex.requests == [[1, 2]]
+
+    assert verifier.verify() == 0
+    assert len(plex.requests) == 1
+
+
+def test_verify_batches():
+    """
+    Test that the edited items are fetched in batches, and that an item
+    edited more than once is fetched once.
+    """
+    num = VERIFY_BATCH_SIZE + 10
+    plex = StubPlex(dict([(k, StubItem(k, 'a')) for k in range(num)]))
+    verifier = EditVerifier(plex, VERIFY_FULL)
+    for k in range(num):
+        verifier.expect(StubItem(k, 'old'), title_check('a'))
+    verifier.expect(StubItem(num - 1, 'old'), title_check('a'))
+
+    rc = verifier.verify()
+
+    assert rc == 0
+    assert [len(r) for r in plex.requests] == [VERIFY_BATCH_SIZE, 10]
+
+
+@pytest.mark.parametrize("percent, num, exp_verified", [
+    (10, 100, 10),
+    (50, 10, 5),
+    (100, 7, 7),
+    (0, 10, 0),
+])
+def test_verify_sampled(percent, num, exp_verified):
+    """
+    Test that in sampled mode, the specified percentage of the edits is
+    verified.
+    """
+    plex = StubPlex(dict([(k, StubItem(k, 'a')) for k in range(num)]))
+    verifier = EditVerifier(plex, VERIFY_SAMPLED, percent)
+    for k in range(num):
+        verifier.expect(StubItem(k, 'old'), title_check('a'))
+
+    rc = verifier.verify()
+
+    assert rc == 0
+    assert len(sum(plex.requests, [])) == exp_verified
+
+
+def test_verify_off():
+    """
+    Test that in off mode, no edits are verified.
+    """
+    plex = StubPlex({1: StubItem(1, 'x')})
+    verifier = EditVerifier(plex, VERIFY_OFF)
+    verifier.expect(StubItem(1, 'old'), title_check('a'))
+
+    rc = verifier.verify()
+
+    assert rc == 0
+    assert plex.requests == []
+
+
+def test_verify_missing_item(capsys):
+    """
+    Test that an edited item that no longer exists fails the verification.
+    """
+    verifier = EditVerifier(StubPlex({}), VERIFY_FULL)
+    verifier.expect(StubItem(1, 'old'), title_check('a'))
+
+    rc = verifier.verify()
+
+    assert rc == 1
+    assert "the item was not found anymore" in capsys.readouterr().out
+
+
+def test_verify_error(capsys):
+    """
+    Test that a failed metadata request fails the verification.
+    """
+    verifier = EditVerifier(StubPlex({}, fail=True), VERIFY_FULL)
+    verifier.expect(StubItem(1, 'old'), title_check('a'))
+
+    rc = verifier.verify()
+
+    assert rc == 1
+    assert "Error: Cannot fetch 1 edited items for verification" in \
+        capsys.readouterr().out
@@ -0,0 +1,176 @@
+"""
+Unit tests for the http_session module.
+"""
+
+from __future__ import print_function, absolute_import
+import threading
+import pytest
+from six.moves import BaseHTTPServer
+
+from plexmediafixup.utils.http_session import create_session, \
+    session_timeout, retries_disabled
+from plexmediafixup.utils.rate_limiter import rate_limited
+
+
+class CountingLimiter(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Rate limiter that counts the tokens taken.
+    """
+
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self):
+        """
+        Take a token.
+        """
+        self.acquired += 1
+
+
+class StatusHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Request handler that answers GET requests with the next status code of
+    the server, and records the headers of the requests.
+    """
+
+    def do_GET(self):
+        # pylint: disable=invalid-name
+        """
+        Answer a GET request.
+        """
+        self.server.requests.append(dict(self.headers))
+        status = self.server.statuses.pop(0) \
+            if self.server.statuses else 200
+        body = b'ok'
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        """
+        Do not log the requests.
+        """
+        pass
+
+
+@pytest.fixture
+def server():
+    """
+    Fixture that provides an HTTP server on a free port, that answers with
+    the status codes in its 'statuses' list and then with 200.
+    """
+    httpd = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StatusHandler)
+    httpd.statuses = []
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever,
+                              kwargs={'poll_interval': 0.01})
+    thread.daemon = True
+    thread.start()
+    httpd.url = 'http://127.0.0.1:{}/'.format(httpd.server_address[1])
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("connect, read, exp_timeout", [
+    (None, None, (30, 30)),
+    (5, None, (5, 30)),
+    (None, 60, (30, 60)),
+    (5, 60, (5, 60)),
+])
+def test_session_timeout(connect, read, exp_timeout):
+    """
+    Test that the default timeout is used for the unspecified timeouts.
+    """
+    assert session_timeout(connect, read, 30) == exp_timeout
+
+
+def test_create_session(server):
+    """
+    Test that the session keeps up to pool_size connections per host, and
+    requests compressed responses.
+    """
+    session = create_session(8)
+
+    response = session.get(server.url)
+
+    assert response.status_code == 200
+    assert session.get_adapter(server.url)._pool_maxsize == 8
+    assert server.requests[0]['Accept-Encoding'] == 'gzip, deflate'
+    assert server.requests[0]['Connection'] == 'keep-alive'
+
+
+def test_create_session_no_compression(server):
+    """
+    Test that without compression, uncompressed responses are requested.
+    """
+    session = create_session(2, compression=False)
+
+    session.get(server.url)
+
+    assert server.requests[0]['Accept-Encoding'] == 'identity'
+
+
+@pytest.mark.parametrize("retries, statuses, exp_status, exp_requests", [
+    (3, [503, 502], 200, 3),
+    (1, [503, 503], 503, 2),
+    (0, [500], 500, 1),
+    (3, [404], 404, 1),
+])
+def test_create_session_retries(server, retries, statuses, exp_status,
+                                exp_requests):
+    """
+    Test that requests that failed with a transient error are retried up to
+    the specified number of times, and that the last error is surfaced.
+    """
+    server.statuses = statuses
+    session = create_session(2, retries=retries, backoff_factor=0)
+
+    response = session.get(server.url)
+
+    assert response.status_code == exp_status
+    assert len(server.requests) == exp_requests
+
+
+@pytest.mark.parametrize("retries, statuses, exp_acquired", [
+    (3, [], 1),
+    (3, [503, 502], 3),
+    (1, [503, 503], 2),
+])
+def test_rate_limited_retries(server, retries, statuses, exp_acquired):
+    """
+    Test that each attempt of a request takes a token from the rate limiter
+    of the current thread, including the retries.
+    """
+    server.statuses = statuses
+    session = create_session(2, retries=retries, backoff_factor=0)
+    limiter = CountingLimiter()
+
+    with rate_limited(limiter):
+        session.get(server.url)
+
+    assert limiter.acquired == exp_acquired
+    assert len(server.requests) == exp_acquired
+
+
+def test_retries_disabled(server):
+    """
+    Test that the requests of a session are not retried while its retries
+    are disabled, and are retried again afterwards.
+    """
+    server.statuses = [503, 503]
+    session = create_session(2, retries=3, backoff_factor=0)
+
+    with retries_disabled(session):
+        response = session.get(server.url)
+
+    assert response.status_code == 503
+    assert len(server.requests) == 1
+
+    response = session.get(server.url)
+
+    assert response.status_code == 200
+    assert len(server.requests) == 3
@@ -0,0 +1,281 @@
+"""
+Unit tests for the library module.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import datetime
+import calendar
+import xml.etree.ElementTree as ET
+import pytest
+
+from plexmediafixup.utils.library import iter_section_pages, \
+    iter_section_items, fetch_section_page, item_changed_at, \
+    fetch_metadata_items, fetch_full_items, prefetch_full_items
+
+
+class StubServer(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Server that answers listing requests with a window of a list of items,
+    like the container start/size window of the PMS, and records the
+    requests.
+    """
+
+    def __init__(self, items, total_size=True):
+        self.items = items
+        self.total_size = total_size
+        self.requests = []  # tuple(key, start, size)
+
+    def query(self, key, headers):
+        """
+        Return the XML data of one page.
+        """
+        start = int(headers['X-Plex-Container-Start'])
+        size = int(headers['X-Plex-Container-Size'])
+        self.requests.append((key, start, size))
+        data = ET.Element('MediaContainer')
+        if self.total_size:
+            data.set('totalSize', str(len(self.items)))
+        for item in self.items[start:start + size]:
+            ET.SubElement(data, 'Video', ratingKey=str(item))
+        return data
+
+
+class StubSection(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Library section of a StubServer.
+    """
+
+    key = 1
+
+    def __init__(self, server):
+        self._server = server
+
+    @staticmethod
+    def findItems(data, initpath):
+        # pylint: disable=invalid-name,unused-argument
+        """
+        Return the rating keys of the items in the XML data.
+        """
+        return [int(elem.get('ratingKey')) for elem in data]
+
+
+@pytest.mark.parametrize("num_items, page_size, exp_pages", [
+    (0, 10, []),
+    (5, 10, [5]),
+    (10, 10, [10]),
+    (25, 10, [10, 10, 5]),
+    (30, 10, [10, 10, 10]),
+])
+@pytest.mark.parametrize("total_size", [True, False])
+def test_iter_section_pages(num_items, page_size, exp_pages, total_size):
+    """
+    Test that the items of a section are listed page by page, with as few
+    requests as possible.
+    """
+    server = StubServer(list(range(num_items)), total_size)
+
+    pages = list(iter_section_pages(StubSection(server), page_size))
+
+    assert [len(page) for page in pages] == exp_pages
+    assert sum(pages, []) == list(range(num_items))
+    exp_requests = len(exp_pages) or 1
+    if not total_size and num_items and num_items % page_size == 0:
+        # Without the total size, a full last page is followed by a request
+        # that returns an empty page
+        exp_requests += 1
+    assert len(server.requests) == exp_requests
+    assert [r[1] for r in server.requests] == \
+        [i * page_size for i in range(exp_requests)]
+
+
+def test_iter_section_items():
+    """
+    Test that the items of a section are listed one by one.
+    """
+    server = StubServer(list(range(7)))
+
+    items = list(iter_section_items(StubSection(server), 3))
+
+    assert items == list(range(7))
+
+
+def test_fetch_section_page_params():
+    """
+    Test that the additional query parameters are passed in the listing
+    request, and that the total size is returned.
+    """
+    server = StubServer(list(range(7)))
+
+    page, total_size = fetch_section_page(StubSection(server), 3, 2,
+                                          {'type': 4})
+
+    assert page == [3, 4]
+    assert total_size == 7
+    assert server.requests == [('/library/sections/1/all?type=4', 3, 2)]
+
+
+class StubMetadataPlex(object):
+    """
+    PMS that answers multi-item metadata requests for existing rating keys,
+    and records the requested rating keys.
+    """
+
+    def __init__(self, existing_keys):
+        self.existing_keys = existing_keys
+        self.requests = []  # list of requested rating keys
+
+    def query(self, key):
+        """
+        Return the XML data of a metadata request.
+        """
+        keys = key.split('/')[-1].split(',')
+        self.requests.append(keys)
+        data = ET.Element('MediaContainer')
+        for k in keys:
+            if int(k) in self.existing_keys:
+                ET.SubElement(data, 'Video', ratingKey=k, genres='full')
+        return data
+
+    @staticmethod
+    def findItems(data, initpath):
+        # pylint: disable=invalid-name,unused-argument
+        """
+        Return the items in the XML data.
+        """
+        items = []
+        for elem in data:
+            item = StubPartialItem(int(elem.get('ratingKey')))
+            item.genres = elem.get('genres')
+            items.append(item)
+        return items
+
+
+class StubPartialItem(object):
+    """
+    Item that is a partial object until its data is loaded from the XML data
+    of its details key.
+    """
+
+    def __init__(self, rating_key, full=False):
+        self.ratingKey = rating_key
+        self.key = '/library/metadata/{}'.format(rating_key)
+        self._details_key = self.key + '?includeExtras=1'
+        self._initpath = self._details_key if full else '/library/sections'
+        self.genres = 'partial'
+
+    def isFullObject(self):
+        # pylint: disable=invalid-name
+        """
+        Return whether the item has been loaded from its details key.
+        """
+        return self._initpath == self._details_key
+
+    def _loadData(self, elem):
+        # pylint: disable=invalid-name
+        """
+        Load the item from XML data.
+        """
+        self.genres = elem.get('genres')
+
+
+def test_fetch_metadata_items():
+    """
+    Test that the items are fetched with a single request, and that items
+    that do not exist are omitted.
+    """
+    plex = StubMetadataPlex(existing_keys=[1, 2, 3, 5])
+
+    items = fetch_metadata_items(plex, [1, 2, 4, 5])
+
+    assert [item.ratingKey for item in items] == [1, 2, 5]
+    assert plex.requests == [['1', '2', '4', '5']]
+
+
+def test_fetch_full_items():
+    """
+    Test that full items are fetched in batches, and that items that do not
+    exist are omitted.
+    """
+    plex = StubMetadataPlex(existing_keys=[1, 2, 3, 5])
+
+    items = fetch_full_items(plex, [1, 2, 3, 4, 5], batch_size=2)
+
+    assert [item.ratingKey for item in items] == [1, 2, 3, 5]
+    assert all(item.isFullObject() for item in items)
+    assert plex.requests == [['1', '2'], ['3', '4'], ['5']]
+
+
+def test_prefetch_full_items():
+    """
+    Test that the full metadata of partial items is prefetched in batches
+    and loaded into the items, and that full items are not fetched again.
+    """
+    plex = StubMetadataPlex(existing_keys=[1, 2, 3])
+    items = [StubPartialItem(1), StubPartialItem(2, full=True),
+             StubPartialItem(3), StubPartialItem(4)]
+
+    prefetch_full_items(plex, items, batch_size=2)
+
+    assert plex.requests == [['1', '3'], ['4']]
+    assert [item.genres for item in items] == \
+        ['full', 'partial', 'full', 'partial']
+    assert [item.isFullObject() for item in items] == \
+        [True, True, True, False]
+
+
+class StubItem(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Item with the change timestamps of a plexapi.video.Video object.
+    """
+
+    def __init__(self, updated_at, added_at):
+        self.updatedAt = updated_at
+        self.addedAt = added_at
+
+
+def local_dt(timestamp):
+    """
+    Return a naive datetime in local time, like plexapi creates them.
+    """
+    return datetime.datetime.fromtimestamp(timestamp)
+
+
+def utc_dt(timestamp):
+    """
+    Return an aware datetime in UTC.
+    """
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+@pytest.mark.parametrize("updated_at, added_at, exp_result", [
+    (None, None, None),
+    (local_dt(1500000000), None, 1500000000),
+    (None, local_dt(1500000000), 1500000000),
+    (local_dt(1500000100), local_dt(1500000000), 1500000100),
+    (local_dt(1500000000), local_dt(1500000100), 1500000100),
+    (utc_dt(1500000000), None, 1500000000),
+])
+def test_item_changed_at(updated_at, added_at, exp_result):
+    """
+    Test that the change time of an item is the later one of its updatedAt
+    and addedAt timestamps.
+    """
+    result = item_changed_at(StubItem(updated_at, added_at))
+
+    assert result == exp_result
+
+
+def test_item_changed_at_is_epoch():
+    """
+    Test that the change time of an item is in seconds since the epoch.
+    """
+    now = int(time.time())
+
+    result = item_changed_at(StubItem(local_dt(now), None))
+
+    assert result == now
+    assert result == calendar.timegm(utc_dt(now).utctimetuple())
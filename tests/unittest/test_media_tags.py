@@ -0,0 +1,187 @@
+"""
+Unit tests for the media_tags module.
+"""
+
+from __future__ import print_function, absolute_import
+import struct
+import pytest
+
+from plexmediafixup.utils.media_tags import read_title_tag, TitleDecodeError
+
+
+def ebml(elem_id, data):
+    """
+    Return an EBML element with the specified ID (as bytes) and data, using
+    an 8-byte size.
+    """
+    return elem_id + struct.pack('>Q', (1 << 56) | len(data)) + data
+
+
+def mkv_file(title=None, tags=None):
+    """
+    Return a minimal Matroska file with an optional Segment Info title and
+    an optional Tags element, given as a list of tuple(track_uid, title).
+    """
+    info = ebml(b'\x2a\xd7\xb1', b'\x0f\x42\x40')  # TimecodeScale
+    if title is not None:
+        info += ebml(b'\x7b\xa9', title.encode('utf-8'))
+    segment = ebml(b'\x15\x49\xa9\x66', info)
+    if tags is not None:
+        tags_data = b''
+        for track_uid, tag_title in tags:
+            targets = ebml(b'\x63\xc5', struct.pack('>B', track_uid))
+            simple_tag = ebml(b'\x45\xa3', b'TITLE') + \
+                ebml(b'\x44\x87', tag_title.encode('utf-8'))
+            tags_data += ebml(b'\x73\x73', ebml(b'\x63\xc0', targets) +
+                              ebml(b'\x67\xc8', simple_tag))
+        segment += ebml(b'\x12\x54\xc3\x67', tags_data)
+    segment += ebml(b'\x1f\x43\xb6\x75', b'\x00' * 32)  # Cluster
+    return ebml(b'\x1a\x45\xdf\xa3', ebml(b'\x42\x82', b'matroska')) + \
+        ebml(b'\x18\x53\x80\x67', segment)
+
+
+def atom(atom_type, data):
+    """
+    Return an MP4 atom with the specified type and data.
+    """
+    return struct.pack('>I', 8 + len(data)) + atom_type + data
+
+
+def mp4_file(title=None, qt_title=None):
+    """
+    Return a minimal MP4 file with an optional title in moov/udta/meta/ilst
+    and an optional QuickTime style title in moov/udta.
+    """
+    udta = b''
+    if qt_title is not None:
+        text = qt_title.encode('utf-8')
+        udta += atom(b'\xa9nam', struct.pack('>HH', len(text), 0) + text)
+    if title is not None:
+        data = atom(b'data', struct.pack('>II', 1, 0) + title.encode('utf-8'))
+        ilst = atom(b'ilst', atom(b'\xa9nam', data))
+        hdlr = atom(b'hdlr', b'\x00' * 8 + b'mdirappl' + b'\x00' * 9)
+        udta += atom(b'meta', b'\x00' * 4 + hdlr + ilst)
+    moov = atom(b'moov', atom(b'mvhd', b'\x00' * 100) + atom(b'udta', udta))
+    return atom(b'ftyp', b'isom\x00\x00\x02\x00isomiso2') + moov + \
+        atom(b'mdat', b'\x00' * 64)
+
+
+def chunk(chunk_id, data):
+    """
+    Return a RIFF chunk with the specified ID and data, padded to an even
+    size.
+    """
+    return struct.pack('<4sI', chunk_id, len(data)) + data + \
+        b'\x00' * (len(data) & 1)
+
+
+def avi_file(raw_title=None):
+    """
+    Return a minimal AVI file with an optional title tag, specified as bytes.
+    """
+    info = b'INFO' + chunk(b'ISFT', b'Lavf58.29.100\x00')
+    if raw_title is not None:
+        info += chunk(b'INAM', raw_title + b'\x00')
+    data = b'AVI ' + chunk(b'LIST', b'hdrl' + chunk(b'avih', b'\x00' * 56)) + \
+        chunk(b'LIST', info) + chunk(b'LIST', b'movi' + b'\x00' * 60)
+    return b'RIFF' + struct.pack('<I', len(data)) + data
+
+
+def write_file(tmpdir, name, data):
+    """
+    Write a media file and return its path name.
+    """
+    media_file = tmpdir.join(name)
+    media_file.write_binary(data)
+    return str(media_file)
+
+
+@pytest.mark.parametrize("data, exp_title", [
+    (mkv_file(), None),
+    (mkv_file(title=u'Info Title'), u'Info Title'),
+    (mkv_file(title=u'Info Title', tags=[(0, u'Tag Title')]), u'Tag Title'),
+    (mkv_file(title=u'Info Title', tags=[(1, u'Track Title')]),
+     u'Info Title'),
+    (mkv_file(title=u'T\xeftre \u2013 1'), u'T\xeftre \u2013 1'),
+    (mp4_file(), None),
+    (mp4_file(title=u'Ilst Title'), u'Ilst Title'),
+    (mp4_file(qt_title=u'QT Title'), u'QT Title'),
+    (mp4_file(title=u'T\xeftre \u2013 1'), u'T\xeftre \u2013 1'),
+    (avi_file(), None),
+    (avi_file(b'Odd Title'), u'Odd Title'),
+    (avi_file(b'T\xc3\xaftre'), u'T\xeftre'),
+    (avi_file(b'T\xeftre'), u'T\xeftre'),
+], ids=['mkv-none', 'mkv-info', 'mkv-tag', 'mkv-track-tag', 'mkv-unicode',
+        'mp4-none', 'mp4-ilst', 'mp4-quicktime', 'mp4-unicode',
+        'avi-none', 'avi-inam', 'avi-utf-8', 'avi-cp1252'])
+def test_read_title_tag(tmpdir, data, exp_title):
+    """
+    Test that the title tag of supported media files is read in-process.
+    """
+    media_file = write_file(tmpdir, 'movie', data)
+
+    supported, title = read_title_tag(media_file, ('utf-8', 'cp1252'))
+
+    assert supported is True
+    assert title == exp_title
+
+
+@pytest.mark.parametrize("data", [
+    b'',
+    b'not a media file at all',
+    ebml(b'\x1a\x45\xdf\xa3', ebml(b'\x42\x82', b'mpeg4')),
+    atom(b'ftyp', b'isom') + atom(b'mdat', b'\x00' * 64),
+    atom(b'ftyp', b'isom') + struct.pack('>I', 4) + b'moov',
+    b'RIFF\x04\x00\x00\x00WAVE',
+], ids=['empty', 'text', 'ebml-doctype', 'mp4-no-moov', 'mp4-atom-size',
+        'riff-wave'])
+def test_read_title_tag_unsupported(tmpdir, data):
+    """
+    Test that unsupported and corrupt media files are reported as not
+    supported, so that their title tag is retrieved using ffprobe.
+    """
+    media_file = write_file(tmpdir, 'movie', data)
+
+    assert read_title_tag(media_file) == (False, None)
+
+
+@pytest.mark.parametrize("data, media_size", [
+    (mkv_file(title=u'Info Title', tags=[(0, u'Tag Title')]), 44),
+    (mp4_file(title=u'Ilst Title'), 72),
+    (avi_file(b'AVI Title'), 72),
+], ids=['mkv', 'mp4', 'avi'])
+def test_read_title_tag_truncated(tmpdir, data, media_size):
+    """
+    Test that media files truncated before the end of their metadata are
+    reported as not supported, so that their title tag is retrieved using
+    ffprobe.
+    """
+    # The media data (the Cluster or mdat element) is at the end of the file
+    for length in range(len(data) - media_size):
+        media_file = write_file(tmpdir, 'movie', data[:length])
+
+        assert read_title_tag(media_file) == (False, None), \
+            "truncated at {} of {} bytes".format(length, len(data))
+
+
+def test_read_title_tag_decode_error(tmpdir):
+    """
+    Test that an AVI title tag that cannot be decoded using any of the
+    encodings raises TitleDecodeError.
+    """
+    media_file = write_file(tmpdir, 'movie.avi', avi_file(b'T\xeftre'))
+
+    with pytest.raises(TitleDecodeError) as exc_info:
+        read_title_tag(media_file, ('utf-8', 'ascii'))
+
+    assert exc_info.value.raw_title == b'T\xeftre'
+    assert exc_info.value.encodings == ('utf-8', 'ascii')
+
+
+def test_read_title_tag_missing(tmpdir):
+    """
+    Test that a media file that does not exist is reported as not supported.
+    """
+    media_file = str(tmpdir.join('missing.mkv'))
+
+    assert read_title_tag(media_file) == (False, None)
@@ -0,0 +1,64 @@
+"""
+Unit tests for the path_mapper module.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import pytest
+
+from plexmediafixup.utils.path_mapper import PathMapper
+
+PATH_MAPPINGS = [
+    {'server': '/media/movies', 'local': '/mnt/movies'},
+    {'server': '/media/', 'local': '/mnt/media'},
+    {'server': '/media/movies/4k', 'local': '/mnt/4k'},
+    {'server': 'D:\\TV Shows', 'local': '/mnt/tv'},
+    {'server': '/media/movies', 'local': '/mnt/other'},
+]
+
+
+def local(path):
+    """
+    Return a local path name with the path separator of the OS.
+    """
+    return path.replace('/', os.path.sep)
+
+
+@pytest.mark.parametrize("server_path, exp_local_path", [
+    ('/media/movies/a.mkv', local('/mnt/movies/a.mkv')),
+    ('/media/movies/4k/b.mkv', local('/mnt/movies/4k/b.mkv')),
+    ('/media/music/c.mp3', local('/mnt/media/music/c.mp3')),
+    ('/media/d.mkv', local('/mnt/media/d.mkv')),
+    ('D:\\TV Shows\\Show\\e.mkv', local('/mnt/tv/Show/e.mkv')),
+    ('D:/TV Shows/Show/e.mkv', local('/mnt/tv/Show/e.mkv')),
+    ('/media/movies2/f.mkv', local('/mnt/media/movies2/f.mkv')),
+    ('/other/g.mkv', None),
+    ('/media', None),
+    ('h.mkv', None),
+])
+def test_local_path(server_path, exp_local_path):
+    """
+    Test that the first path mapping whose server root is a prefix of the
+    path name is used, and that only complete path name components match.
+    """
+    mapper = PathMapper(PATH_MAPPINGS)
+
+    assert mapper.local_path(server_path) == exp_local_path
+
+
+def test_local_path_no_mappings():
+    """
+    Test that no path name is mapped without path mappings.
+    """
+    mapper = PathMapper([])
+
+    assert mapper.local_path('/media/movies/a.mkv') is None
+
+
+def test_path_mappings():
+    """
+    Test that the path mappings are returned as specified.
+    """
+    mapper = PathMapper(PATH_MAPPINGS)
+
+    assert mapper.path_mappings is PATH_MAPPINGS
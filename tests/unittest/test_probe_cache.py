@@ -0,0 +1,183 @@
+"""
+Unit tests for the probe_cache module.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import sqlite3
+import pytest
+
+from plexmediafixup.utils.probe_cache import ProbeCache, ProbeCacheError
+
+
+@pytest.fixture
+def cache_file(tmpdir):
+    """
+    Fixture that provides the path name of a probe cache file.
+    """
+    return str(tmpdir.join('probe_cache.sqlite'))
+
+
+def set_last_used(filepath, path, last_used):
+    """
+    Set the time of the last use of an entry directly in the cache file.
+    """
+    conn = sqlite3.connect(filepath)
+    conn.execute('UPDATE probe SET last_used = ? WHERE path = ?',
+                 (last_used, path))
+    conn.commit()
+    conn.close()
+
+
+def count_entries(filepath):
+    """
+    Return the number of entries that have been committed to the cache file.
+    """
+    conn = sqlite3.connect(filepath)
+    count = conn.execute('SELECT COUNT(*) FROM probe').fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_get_put(cache_file):
+    """
+    Test that a stored entry is found as long as the size and modification
+    time of the file are unchanged.
+    """
+    cache = ProbeCache(cache_file)
+    cache.open()
+
+    assert cache.get(u'/m/a.mkv', 100, 1.5) == (False, None)
+
+    cache.put(u'/m/a.mkv', 100, 1.5, u'Title A')
+    cache.put(u'/m/b.mkv', 200, 2.5, None)
+
+    assert cache.get(u'/m/a.mkv', 100, 1.5) == (True, u'Title A')
+    assert cache.get(u'/m/b.mkv', 200, 2.5) == (True, None)
+    assert cache.get(u'/m/a.mkv', 101, 1.5) == (False, None)
+    assert cache.get(u'/m/a.mkv', 100, 1.6) == (False, None)
+    assert (cache.hits, cache.misses) == (2, 3)
+    cache.close()
+
+
+def test_put_replaces(cache_file):
+    """
+    Test that storing an entry for a changed file replaces the old entry.
+    """
+    cache = ProbeCache(cache_file)
+    cache.open()
+    cache.put(u'/m/a.mkv', 100, 1.5, u'Old')
+
+    cache.put(u'/m/a.mkv', 120, 3.5, u'New')
+
+    assert cache.get(u'/m/a.mkv', 100, 1.5) == (False, None)
+    assert cache.get(u'/m/a.mkv', 120, 3.5) == (True, u'New')
+    cache.close()
+
+
+def test_commit_size(cache_file):
+    """
+    Test that stored entries are committed to the cache file once the commit
+    size is reached, and the remaining entries when the cache is closed.
+    """
+    cache = ProbeCache(cache_file, commit_size=2)
+    cache.open()
+
+    cache.put(u'/m/a.mkv', 100, 1.5, u'Title A')
+    assert cache.get(u'/m/a.mkv', 100, 1.5) == (True, u'Title A')
+    assert count_entries(cache_file) == 0
+
+    cache.put(u'/m/b.mkv', 200, 2.5, u'Title B')
+    assert count_entries(cache_file) == 2
+
+    cache.put(u'/m/c.mkv', 300, 3.5, u'Title C')
+    assert count_entries(cache_file) == 2
+
+    cache.close()
+    assert count_entries(cache_file) == 3
+
+
+def test_persistence(cache_file):
+    """
+    Test that the entries persist across closing and opening the cache.
+    """
+    cache = ProbeCache(cache_file)
+    cache.open()
+    cache.put(u'/m/ä.mkv', 100, 1.5, u'Title ä')
+    cache.close()
+
+    cache = ProbeCache(cache_file)
+    cache.open()
+
+    assert cache.filepath == cache_file
+    assert cache.get(u'/m/ä.mkv', 100, 1.5) == (True, u'Title ä')
+    cache.close()
+
+
+def test_clear(cache_file):
+    """
+    Test that clearing the cache removes all entries.
+    """
+    cache = ProbeCache(cache_file)
+    cache.open()
+    cache.put(u'/m/a.mkv', 100, 1.5, u'Title A')
+
+    cache.clear()
+
+    assert cache.get(u'/m/a.mkv', 100, 1.5) == (False, None)
+    cache.close()
+
+
+def test_eviction(cache_file):
+    """
+    Test that closing the cache evicts the entries that have not been used
+    for the maximum age, and keeps the entries that have been used.
+    """
+    cache = ProbeCache(cache_file, max_age=30)
+    cache.open()
+    cache.put(u'/m/used.mkv', 100, 1.5, u'Used')
+    cache.put(u'/m/unused.mkv', 100, 1.5, u'Unused')
+    cache.put(u'/m/recent.mkv', 100, 1.5, u'Recent')
+    cache.close()
+    old = int(time.time()) - 31 * 24 * 3600
+    set_last_used(cache_file, u'/m/used.mkv', old)
+    set_last_used(cache_file, u'/m/unused.mkv', old)
+
+    cache.open()
+    assert cache.get(u'/m/used.mkv', 100, 1.5) == (True, u'Used')
+    cache.close()
+
+    cache.open()
+    assert cache.get(u'/m/used.mkv', 100, 1.5) == (True, u'Used')
+    assert cache.get(u'/m/unused.mkv', 100, 1.5) == (False, None)
+    assert cache.get(u'/m/recent.mkv', 100, 1.5) == (True, u'Recent')
+    cache.close()
+
+
+def test_schema_version(cache_file):
+    """
+    Test that a cache file with a different schema version is discarded.
+    """
+    cache = ProbeCache(cache_file)
+    cache.open()
+    cache.put(u'/m/a.mkv', 100, 1.5, u'Title A')
+    cache.close()
+    conn = sqlite3.connect(cache_file)
+    conn.execute('PRAGMA user_version = 0')
+    conn.commit()
+    conn.close()
+
+    cache.open()
+
+    assert cache.get(u'/m/a.mkv', 100, 1.5) == (False, None)
+    cache.close()
+
+
+def test_open_error(tmpdir):
+    """
+    Test that a cache file that cannot be created fails to open.
+    """
+    cache = ProbeCache(str(tmpdir.join('missing', 'probe_cache.sqlite')))
+
+    with pytest.raises(ProbeCacheError):
+        cache.open()
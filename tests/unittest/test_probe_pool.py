@@ -0,0 +1,121 @@
+"""
+Unit tests for the probe_pool module.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import threading
+import pytest
+
+from plexmediafixup.utils.probe_pool import ProbePool
+
+
+class Prober(object):
+    """
+    Probe function that records its calls and the maximum number of
+    concurrent calls.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.max_running = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, path):
+        with self._lock:
+            self.calls.append(path)
+            self._running += 1
+            self.max_running = max(self.max_running, self._running)
+        try:
+            time.sleep(self.delay)
+            if path.endswith('.bad'):
+                raise ValueError("Cannot probe {}".format(path))
+            return path.upper()
+        finally:
+            with self._lock:
+                self._running -= 1
+
+
+def test_result():
+    """
+    Test that the results are picked up by path name, and that a media file
+    that has not been submitted is probed when its result is requested.
+    """
+    prober = Prober()
+    pool = ProbePool(prober, jobs=2)
+    pool.submit('/m/a.mkv')
+    pool.submit('/m/b.mkv')
+
+    assert pool.result('/m/b.mkv') == '/M/B.MKV'
+    assert pool.result('/m/a.mkv') == '/M/A.MKV'
+    assert pool.result('/m/c.mkv') == '/M/C.MKV'
+    pool.shutdown()
+    assert sorted(prober.calls) == ['/m/a.mkv', '/m/b.mkv', '/m/c.mkv']
+
+
+def test_submit_pending_once():
+    """
+    Test that a media file that is already pending is not probed again.
+    """
+    prober = Prober(delay=0.05)
+    pool = ProbePool(prober, jobs=2)
+
+    pool.submit('/m/a.mkv')
+    pool.submit('/m/a.mkv')
+
+    assert pool.result('/m/a.mkv') == '/M/A.MKV'
+    pool.shutdown()
+    assert prober.calls == ['/m/a.mkv']
+
+
+def test_exception():
+    """
+    Test that the exception of the probe function is raised when the result
+    is picked up.
+    """
+    pool = ProbePool(Prober(), jobs=2)
+    pool.submit('/m/a.bad')
+
+    with pytest.raises(ValueError, match='Cannot probe'):
+        pool.result('/m/a.bad')
+    pool.shutdown()
+
+
+@pytest.mark.parametrize("jobs, jobs_per_mount, exp_max", [
+    (4, 1, 1),
+    (4, 2, 2),
+    (2, 4, 2),
+])
+def test_concurrency_limits(tmpdir, jobs, jobs_per_mount, exp_max):
+    """
+    Test that the concurrent probes are limited in total and per mount
+    point.
+    """
+    prober = Prober(delay=0.05)
+    pool = ProbePool(prober, jobs=jobs, jobs_per_mount=jobs_per_mount)
+    paths = [str(tmpdir.join('f{}.mkv'.format(i))) for i in range(6)]
+
+    for path in paths:
+        pool.submit(path)
+    for path in paths:
+        pool.result(path)
+    pool.shutdown()
+
+    assert prober.max_running == exp_max
+
+
+def test_shutdown():
+    """
+    Test that shutting down cancels the media files that are not yet being
+    probed.
+    """
+    prober = Prober(delay=0.1)
+    pool = ProbePool(prober, jobs=1)
+    for i in range(5):
+        pool.submit('/m/f{}.mkv'.format(i))
+
+    pool.shutdown()
+
+    assert len(prober.calls) < 5
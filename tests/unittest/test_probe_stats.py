@@ -0,0 +1,83 @@
+"""
+Unit tests for the probe_stats module.
+"""
+
+from __future__ import print_function, absolute_import
+
+from plexmediafixup.utils.probe_stats import ProbeStats
+
+
+def test_add_pop():
+    """
+    Test that the byte counts of a media file are picked up once, and that
+    the totals and the maximum are kept.
+    """
+    stats = ProbeStats()
+
+    stats.add(u'/m/a.mkv', 1000, 2)
+    stats.add(u'/m/b.mkv', 3000, 1)
+    stats.add(u'/m/c.mkv', 2000, 0)
+
+    assert stats.pop(u'/m/b.mkv') == (3000, 1)
+    assert stats.pop(u'/m/b.mkv') is None
+    assert stats.pop(u'/m/d.mkv') is None
+    assert stats.files == 3
+    assert stats.bytes_read == 6000
+    assert stats.seeks == 3
+    assert (stats.max_bytes_read, stats.max_bytes_file) == \
+        (3000, u'/m/b.mkv')
+
+
+def test_summary_bytes():
+    """
+    Test that the summary includes the byte counts when they have been
+    recorded.
+    """
+    stats = ProbeStats()
+    stats.add_latency(u'/m/a.mkv', 0.5)
+    stats.add(u'/m/a.mkv', 1000, 2)
+    stats.add_latency(u'/m/b.mkv', 0.25)
+    stats.add(u'/m/b.mkv', 3000, 1)
+
+    summary = stats.summary()
+
+    assert summary.endswith(
+        ", 4000 bytes read by ffprobe (2000 per file, max 3000 for "
+        "{!r}), 3 seeks".format(u'/m/b.mkv'))
+
+
+def test_percentile():
+    """
+    Test the percentiles of the probe times and the maximum probe time.
+    """
+    stats = ProbeStats()
+    assert stats.percentile(50) is None
+
+    for i in range(1, 21):
+        stats.add_latency(u'/m/{}.mkv'.format(i), i / 10.0)
+
+    assert stats.percentile(0) == 0.1
+    assert stats.percentile(50) == 1.0
+    assert stats.percentile(95) == 1.9
+    assert stats.percentile(100) == 2.0
+    assert (stats.max_latency, stats.max_latency_file) == (2.0, u'/m/20.mkv')
+
+
+def test_summary():
+    """
+    Test the summary with probe times, timeouts and deferred items, and
+    without byte counts.
+    """
+    stats = ProbeStats()
+    assert stats.summary() == "no media files probed"
+
+    stats.add_latency(u'/m/a.mkv', 0.5)
+    stats.add_latency(u'/m/b.mkv', 0.0)
+    stats.add_timeout()
+    stats.add_timeout()
+    stats.add_deferred()
+
+    assert stats.summary() == \
+        "2 media files probed, probe time p50 0.000 s, p95 0.500 s, " \
+        "max 0.500 s for {!r}, 2 timeouts, 1 items deferred". \
+        format(u'/m/a.mkv')
@@ -0,0 +1,110 @@
+"""
+Unit tests for the rate_limiter module.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import threading
+import pytest
+
+from plexmediafixup.utils.rate_limiter import RateLimiter, rate_limited, \
+    current_rate_limiter
+
+
+@pytest.mark.parametrize("rate, burst, exp_burst", [
+    (10, None, 10.0),
+    (0.5, None, 1.0),
+    (10, 2, 2.0),
+])
+def test_burst(rate, burst, exp_burst):
+    """
+    Test the default burst size.
+    """
+    limiter = RateLimiter(rate, burst)
+
+    assert limiter.burst == exp_burst
+
+
+def test_acquire_burst():
+    """
+    Test that up to the burst size of requests do not wait.
+    """
+    limiter = RateLimiter(1, burst=5)
+
+    for _ in range(5):
+        limiter.acquire()
+
+    assert limiter.waits == 0
+    assert limiter.wait_time == 0.0
+
+
+def test_acquire_rate():
+    """
+    Test that requests beyond the burst size wait for their tokens, so that
+    they are spread out at the rate.
+    """
+    limiter = RateLimiter(50, burst=1)
+    start = time.time()
+
+    for _ in range(6):
+        limiter.acquire()
+
+    assert time.time() - start >= 0.09
+    assert limiter.waits == 5
+    assert limiter.wait_time == pytest.approx(0.1, abs=0.03)
+
+
+def test_acquire_threads():
+    """
+    Test that the requests of concurrent threads are spread out at the rate
+    as a whole.
+    """
+    limiter = RateLimiter(100, burst=1)
+    threads = [threading.Thread(target=lambda: [limiter.acquire()
+                                                for _ in range(5)])
+               for _ in range(4)]
+    start = time.time()
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.time() - start >= 0.18
+    assert limiter.waits == 19
+
+
+def test_rate_limited():
+    """
+    Test that the rate limiter of the current thread is set while the
+    context is active, and restored afterwards.
+    """
+    outer = RateLimiter(10)
+    inner = RateLimiter(20)
+    assert current_rate_limiter() is None
+
+    with rate_limited(outer):
+        assert current_rate_limiter() is outer
+        with rate_limited(inner):
+            assert current_rate_limiter() is inner
+        with rate_limited(None):
+            assert current_rate_limiter() is None
+        assert current_rate_limiter() is outer
+
+    assert current_rate_limiter() is None
+
+
+def test_rate_limited_per_thread():
+    """
+    Test that the rate limiter is not set for other threads.
+    """
+    limiter = RateLimiter(10)
+    seen = []
+
+    with rate_limited(limiter):
+        thread = threading.Thread(
+            target=lambda: seen.append(current_rate_limiter()))
+        thread.start()
+        thread.join()
+
+    assert seen == [None]
@@ -0,0 +1,216 @@
+"""
+Unit tests for the scheduler module.
+"""
+
+from __future__ import print_function, absolute_import
+import time
+import pytest
+
+from plexmediafixup import scheduler
+from plexmediafixup.scheduler import Scheduler, Schedule, parse_time_window, \
+    in_time_window, RETRY_DELAY
+
+
+class StubFixupRun(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Fixup with a state key.
+    """
+
+    def __init__(self, name, dryrun=False):
+        self.name = name
+        self.state_key = name
+        self.dryrun = dryrun
+
+
+class StubPlex(object):
+    # pylint: disable=too-few-public-methods
+    """
+    PMS with a machine identifier.
+    """
+
+    machineIdentifier = 'abc123'
+
+
+class StubState(object):
+    """
+    State file that keeps the times of the last runs in memory.
+    """
+
+    def __init__(self, last_runs=None):
+        self.last_runs = dict(last_runs or {})
+        self.saves = 0
+
+    def get_last_run(self, server_id, fixup_key):
+        # pylint: disable=unused-argument
+        """
+        Return the time of the last run of a fixup.
+        """
+        return self.last_runs.get(fixup_key)
+
+    def set_last_run(self, server_id, fixup_key, timestamp):
+        # pylint: disable=unused-argument
+        """
+        Set the time of the last run of a fixup.
+        """
+        self.last_runs[fixup_key] = timestamp
+
+    def save(self):
+        """
+        Save the state file.
+        """
+        self.saves += 1
+
+
+class StubWalker(object):
+    """
+    Library walker that records its runs.
+    """
+
+    def __init__(self, state=None, rcs=()):
+        self.plex = StubPlex()
+        self.state = state
+        self.rcs = list(rcs)  # Return codes of the runs, then 0
+        self.runs = []  # Names of the fixups of each run
+        self.cleanups = 0
+
+    def walk(self, fixup_runs):
+        """
+        Run the specified fixups once.
+        """
+        self.runs.append([fr.name for fr in fixup_runs])
+        return self.rcs.pop(0) if self.rcs else 0
+
+    def cleanup_fixups(self):
+        """
+        Clean up the fixups.
+        """
+        self.cleanups += 1
+
+
+@pytest.mark.parametrize("time_window, exp_window", [
+    ('02:00-06:30', (120, 390)),
+    ('22:00-06:00', (1320, 360)),
+    ('7:05-8:00', (425, 480)),
+    ('23:59-00:00', (1439, 0)),
+])
+def test_parse_time_window(time_window, exp_window):
+    """
+    Test that time windows are parsed into minutes after midnight.
+    """
+    assert parse_time_window(time_window) == exp_window
+
+
+@pytest.mark.parametrize("time_window", ['', '02:00', '2:00-6:0',
+                                         '00:00-24:00', '02:60-06:00'])
+def test_parse_time_window_invalid(time_window):
+    """
+    Test that time windows with an invalid format are rejected.
+    """
+    with pytest.raises(ValueError):
+        parse_time_window(time_window)
+
+
+def local_timestamp(hour, minute):
+    """
+    Return a timestamp at the specified local time of a day.
+    """
+    return time.mktime((2024, 3, 5, hour, minute, 0, 0, 0, -1))
+
+
+@pytest.mark.parametrize("window, hour, minute, exp_result", [
+    (None, 12, 0, True),
+    ((120, 390), 2, 0, True),
+    ((120, 390), 6, 29, True),
+    ((120, 390), 6, 30, False),
+    ((120, 390), 1, 59, False),
+    ((1320, 360), 23, 0, True),
+    ((1320, 360), 0, 30, True),
+    ((1320, 360), 6, 0, False),
+    ((1320, 360), 12, 0, False),
+])
+def test_in_time_window(window, hour, minute, exp_result):
+    """
+    Test the check for a time window, including windows that span midnight.
+    """
+    assert in_time_window(window, local_timestamp(hour, minute)) is \
+        exp_result
+
+
+def test_schedule_next_due():
+    """
+    Test that a fixup is due immediately without a last run, an interval
+    after its last run, and at its retry time after a failed run.
+    """
+    schedule = Schedule(StubFixupRun('a'), interval=2)
+    assert schedule.next_due() == 0
+
+    schedule.last_run = 1000
+    assert schedule.next_due() == 1000 + 2 * 3600
+
+    schedule.retry_at = 2000
+    assert schedule.next_due() == 2000
+
+
+def test_schedule_is_due():
+    """
+    Test that a fixup is due only after its interval and within its time
+    window.
+    """
+    schedule = Schedule(StubFixupRun('a'), interval=1,
+                        time_window='02:00-04:00')
+    schedule.last_run = local_timestamp(1, 0)
+
+    assert not schedule.is_due(local_timestamp(1, 30))
+    assert schedule.is_due(local_timestamp(2, 30))
+    assert not schedule.is_due(local_timestamp(4, 30))
+
+
+def interrupt(seconds):
+    # pylint: disable=unused-argument
+    """
+    Replacement for time.sleep() that interrupts the scheduler.
+    """
+    raise KeyboardInterrupt
+
+
+def test_scheduler_runs_due_fixups(capsys, monkeypatch):
+    """
+    Test that a scheduled run runs just the due fixups, that their last runs
+    are recorded in the state file, and that the scheduler stops when it is
+    interrupted.
+    """
+    monkeypatch.setattr(scheduler.time, 'sleep', interrupt)
+    now = time.time()
+    state = StubState({'b': int(now) - 3600})
+    walker = StubWalker(state)
+    schedules = [Schedule(StubFixupRun('a'), interval=1),
+                 Schedule(StubFixupRun('b'), interval=24),
+                 Schedule(StubFixupRun('c', dryrun=True), interval=1)]
+
+    rc = Scheduler(walker, schedules).run()
+
+    assert rc == 0
+    assert walker.runs == [['a', 'c']]
+    assert walker.cleanups == 1
+    assert state.saves == 1
+    assert state.last_runs['a'] >= int(now)
+    assert 'c' not in state.last_runs
+    assert "Stopping scheduler" in capsys.readouterr().out
+
+
+def test_scheduler_retry(capsys):
+    """
+    Test that the fixups of a failed run are retried after the retry delay.
+    """
+    walker = StubWalker(rcs=[1])
+    schedule = Schedule(StubFixupRun('a'))
+    start = time.time()
+
+    rc = Scheduler(walker, [schedule])._run_due(None, 'abc123')
+
+    assert rc == 0
+    assert walker.runs == [['a']]
+    assert schedule.last_run is None
+    assert schedule.retry_at >= start + RETRY_DELAY
+    assert "retrying in {} s".format(RETRY_DELAY) in capsys.readouterr().out
@@ -0,0 +1,80 @@
+"""
+Unit tests for the state_file module.
+"""
+
+from __future__ import print_function, absolute_import
+import pytest
+
+from plexmediafixup.utils.state_file import StateFile, StateFileError
+
+
+def test_load_missing(tmpdir):
+    """
+    Test that a state file that does not exist is loaded as empty.
+    """
+    state = StateFile(str(tmpdir.join('state.yml')))
+
+    state.load()
+
+    assert state.get_watermark('srv', 'sec', 'fixup') is None
+
+
+def test_save_load(tmpdir):
+    """
+    Test that watermarks are persisted per server, section and fixup.
+    """
+    filepath = str(tmpdir.join('state.yml'))
+    state = StateFile(filepath)
+    state.set_watermark('srv1', 'sec1', 'fixup', 1000)
+    state.set_watermark('srv1', 'sec2', 'fixup', 2000)
+    state.set_watermark('srv2', 'sec1', 'fixup#2', 3000)
+    state.save()
+
+    state = StateFile(filepath)
+    state.load()
+
+    assert state.filepath == filepath
+    assert state.get_watermark('srv1', 'sec1', 'fixup') == 1000
+    assert state.get_watermark('srv1', 'sec2', 'fixup') == 2000
+    assert state.get_watermark('srv2', 'sec1', 'fixup#2') == 3000
+    assert state.get_watermark('srv2', 'sec1', 'fixup') is None
+    assert state.get_watermark('srv3', 'sec1', 'fixup') is None
+
+
+def test_set_watermark_replaces(tmpdir):
+    """
+    Test that setting a watermark replaces the previous one.
+    """
+    state = StateFile(str(tmpdir.join('state.yml')))
+    state.set_watermark('srv', 'sec', 'fixup', 1000)
+
+    state.set_watermark('srv', 'sec', 'fixup', 1500)
+
+    assert state.get_watermark('srv', 'sec', 'fixup') == 1500
+
+
+@pytest.mark.parametrize("content", [
+    "watermarks: [\n",
+    "- a list\n",
+])
+def test_load_invalid(tmpdir, content):
+    """
+    Test that a state file that is not valid YAML or not a mapping fails to
+    load.
+    """
+    filepath = tmpdir.join('state.yml')
+    filepath.write(content)
+    state = StateFile(str(filepath))
+
+    with pytest.raises(StateFileError):
+        state.load()
+
+
+def test_save_error(tmpdir):
+    """
+    Test that a state file that cannot be written fails to save.
+    """
+    state = StateFile(str(tmpdir.join('missing', 'state.yml')))
+
+    with pytest.raises(StateFileError):
+        state.save()
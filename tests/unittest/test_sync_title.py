@@ -0,0 +1,137 @@
+"""
+Unit tests for the sync_title module.
+"""
+
+from __future__ import print_function, absolute_import
+import os
+import sys
+import time
+import ffmpy
+import pytest
+
+from plexmediafixup.fixups.sync_title import SyncTitle, run_ffprobe, \
+    ProbeTimeout
+
+
+class StubFFprobe(object):
+    # pylint: disable=too-few-public-methods
+    """
+    FFprobe object with a command line that runs a Python script instead of
+    ffprobe.
+    """
+
+    def __init__(self, script, executable=sys.executable):
+        self.executable = executable
+        self._cmd = [executable, '-c', script]
+        self.cmd = ' '.join(self._cmd)
+
+
+class StubConfig(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Config file with a probe cache file in a directory.
+    """
+
+    def __init__(self, dirpath):
+        self.data = {'probe_cache': {'file': 'probe.db', 'max_age': 30}}
+        self.dirpath = dirpath
+
+    def abspath(self, path):
+        """
+        Return the path name relative to the directory.
+        """
+        return os.path.join(self.dirpath, path)
+
+
+class StubFixupRun(object):
+    # pylint: disable=too-few-public-methods
+    """
+    Fixup run with the parameters of the sync_title fixup.
+    """
+
+    def __init__(self, config, fixup_kwargs):
+        self.config = config
+        self.fixup_kwargs = fixup_kwargs
+        self.verbose = False
+        self.params = dict()
+
+
+def test_run_ffprobe():
+    """
+    Test that the output of the command is returned.
+    """
+    ffprobe = StubFFprobe(
+        "import sys; sys.stdout.write('out'); sys.stderr.write('err')")
+
+    assert run_ffprobe(ffprobe, timeout=30) == (b'out', b'err')
+
+
+def test_run_ffprobe_timeout():
+    """
+    Test that a command that does not complete within the timeout is killed.
+    """
+    ffprobe = StubFFprobe("import time; time.sleep(30)")
+    start = time.time()
+
+    with pytest.raises(ProbeTimeout, match='did not complete within 0.5 s'):
+        run_ffprobe(ffprobe, timeout=0.5)
+
+    assert time.time() - start < 10
+
+
+def test_run_ffprobe_failed():
+    """
+    Test that a command that fails raises FFRuntimeError.
+    """
+    ffprobe = StubFFprobe("import sys; sys.exit(3)")
+
+    with pytest.raises(ffmpy.FFRuntimeError) as exc_info:
+        run_ffprobe(ffprobe)
+
+    assert exc_info.value.exit_code == 3
+
+
+def test_run_ffprobe_not_found(tmpdir):
+    """
+    Test that a command that does not exist raises
+    FFExecutableNotFoundError.
+    """
+    ffprobe = StubFFprobe("", executable=str(tmpdir.join('ffprobe')))
+
+    with pytest.raises(ffmpy.FFExecutableNotFoundError):
+        run_ffprobe(ffprobe)
+
+
+def test_cleanup(tmpdir):
+    """
+    Test that cleaning up the fixup after a run that did not get to finish it
+    closes the probe cache and discards the directory listings.
+    """
+    dirpath = str(tmpdir)
+    fixup = SyncTitle()
+    fixup_run = StubFixupRun(StubConfig(dirpath), {})
+    assert fixup.prepare(fixup_run) == 0
+    probe_cache = fixup_run.params['probe_cache']
+    dir_cache = fixup_run.params['dir_cache']
+    media_file = os.path.join(dirpath, 'movie.mkv')
+    assert probe_cache.is_open
+    assert not dir_cache.exists(media_file)
+    open(media_file, 'w').close()
+
+    fixup.cleanup(fixup_run)
+
+    assert not probe_cache.is_open
+    assert dir_cache.exists(media_file)
+
+
+def test_prepare_error_no_probe_cache(tmpdir, capsys):
+    """
+    Test that the probe cache is not opened when the parameters of the fixup
+    are invalid, since the fixup is then not cleaned up.
+    """
+    fixup_run = StubFixupRun(StubConfig(str(tmpdir)), {'probe_jobs': 0})
+
+    assert SyncTitle().prepare(fixup_run) == 1
+
+    assert 'probe_cache' not in fixup_run.params
+    assert "Error: Invalid 'probe_jobs'" in capsys.readouterr().out
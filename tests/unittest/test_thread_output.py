@@ -0,0 +1,84 @@
+"""
+Unit tests for the thread_output module.
+"""
+
+from __future__ import print_function, absolute_import
+import threading
+import six
+
+from plexmediafixup.utils.thread_output import ThreadOutput
+
+
+def test_passthrough():
+    """
+    Test that output of a thread without capture buffer is passed on to the
+    original stream.
+    """
+    stream = six.StringIO()
+    output = ThreadOutput(stream)
+
+    print("hello", file=output)
+    output.flush()
+
+    assert stream.getvalue() == "hello\n"
+
+
+def test_capture():
+    """
+    Test that output of the current thread is captured while its capture
+    buffer is set, and passed on again afterwards.
+    """
+    stream = six.StringIO()
+    output = ThreadOutput(stream)
+    buffer = six.StringIO()
+
+    with output.capture(buffer):
+        print("captured", file=output)
+        output.flush()
+    print("passed", file=output)
+
+    assert buffer.getvalue() == "captured\n"
+    assert stream.getvalue() == "passed\n"
+
+
+def test_capture_per_thread():
+    """
+    Test that the output of concurrent threads is captured into their own
+    buffers, and that the output of other threads is not captured.
+    """
+    stream = six.StringIO()
+    output = ThreadOutput(stream)
+    buffers = [six.StringIO() for _ in range(4)]
+    barrier = threading.Barrier(len(buffers) + 1)
+
+    def worker(i):
+        with output.capture(buffers[i]):
+            barrier.wait()
+            for j in range(3):
+                print("thread {} line {}".format(i, j), file=output)
+            barrier.wait()
+
+    threads = [threading.Thread(target=worker, args=(i,))
+               for i in range(len(buffers))]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    print("main", file=output)
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+
+    assert stream.getvalue() == "main\n"
+    for i, buffer in enumerate(buffers):
+        assert buffer.getvalue() == "".join(
+            ["thread {} line {}\n".format(i, j) for j in range(3)])
+
+
+def test_attribute_delegation():
+    """
+    Test that other attributes are delegated to the original stream.
+    """
+    stream = six.StringIO()
+    output = ThreadOutput(stream)
+
+    assert output.getvalue == stream.getvalue
@@ -0,0 +1,185 @@
+"""
+Unit tests for the webhook module.
+"""
+
+from __future__ import print_function, absolute_import
+import json
+import http.client
+import pytest
+
+from plexmediafixup.webhook import WebhookListener, webhook_payload, \
+    webhook_rating_keys, MAX_REQUEST_SIZE
+
+SERVER_UUID = 'abc123'
+
+BOUNDARY = 'ZXhhbXBsZQ'
+
+MULTIPART_TYPE = 'multipart/form-data; boundary={}'.format(BOUNDARY)
+
+
+class StubPlex(object):
+    # pylint: disable=too-few-public-methods
+    """
+    PMS with a machine identifier.
+    """
+
+    machineIdentifier = SERVER_UUID
+
+
+def new_payload(rating_key='1001', type_='movie', event='library.new',
+                server_uuid=SERVER_UUID):
+    """
+    Return the payload of a webhook for an item.
+    """
+    return {
+        'event': event,
+        'Server': {'title': 'server', 'uuid': server_uuid},
+        'Metadata': {'ratingKey': rating_key, 'type': type_,
+                     'title': 'Title'},
+    }
+
+
+def multipart_body(payload=None, thumb=True):
+    """
+    Return a multipart/form-data body like the PMS sends it, with the
+    payload field and the poster of the item.
+    """
+    parts = []
+    if payload is not None:
+        parts.append(
+            b'Content-Disposition: form-data; name="payload"\r\n'
+            b'Content-Type: application/json\r\n\r\n' +
+            json.dumps(payload).encode('utf-8'))
+    if thumb:
+        parts.append(
+            b'Content-Disposition: form-data; name="thumb"; '
+            b'filename="poster.jpg"\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n\xff\xd8\xff\xe0\x00\x10JFIF')
+    delimiter = b'--' + BOUNDARY.encode('ascii')
+    return b''.join([delimiter + b'\r\n' + part + b'\r\n' for part in parts]) \
+        + delimiter + b'--\r\n'
+
+
+@pytest.mark.parametrize("content_type, body, exp_payload", [
+    (MULTIPART_TYPE, multipart_body(new_payload()), new_payload()),
+    (MULTIPART_TYPE, multipart_body(new_payload(), thumb=False),
+     new_payload()),
+    (MULTIPART_TYPE, multipart_body(None), None),
+    (MULTIPART_TYPE, b'not multipart', None),
+    ('application/json', json.dumps(new_payload()).encode('utf-8'),
+     new_payload()),
+    ('application/json; charset=utf-8', b'{"event": "library.new"}',
+     {'event': 'library.new'}),
+    ('application/json', b'{invalid', None),
+    ('application/json', b'["library.new"]', None),
+    ('text/plain', b'{"event": "library.new"}', None),
+    ('', b'', None),
+])
+def test_webhook_payload(content_type, body, exp_payload):
+    """
+    Test that the payload is taken from the payload field of a multipart
+    request or from a JSON body.
+    """
+    assert webhook_payload(content_type, body) == exp_payload
+
+
+@pytest.mark.parametrize("payload, server_uuid, exp_keys", [
+    (new_payload(), SERVER_UUID, ['1001']),
+    (new_payload(rating_key=1002, type_='episode'), SERVER_UUID, ['1002']),
+    (new_payload(type_='show'), None, ['1001']),
+    (new_payload(event='media.play'), SERVER_UUID, []),
+    (new_payload(server_uuid='other'), SERVER_UUID, []),
+    (new_payload(type_='track'), SERVER_UUID, []),
+    (new_payload(rating_key=None), SERVER_UUID, []),
+    ({'event': 'library.new'}, SERVER_UUID, []),
+])
+def test_webhook_rating_keys(payload, server_uuid, exp_keys):
+    """
+    Test that the rating key of the item of a webhook is returned for the
+    specified events and server, and for the processed item types.
+    """
+    assert webhook_rating_keys(payload, ['library.new'], server_uuid) == \
+        exp_keys
+
+
+@pytest.fixture
+def listener():
+    """
+    Fixture that provides a running webhook listener on a free port, with
+    the rating keys it received in its 'received' list.
+    """
+    received = []
+    _listener = WebhookListener(StubPlex(), received.extend, port=0)
+    _listener.received = received
+    _listener.start()
+    yield _listener
+    _listener.stop()
+    _listener.join()
+
+
+def post(listener, body, headers):
+    """
+    POST a request to the listener and return the response status.
+    """
+    conn = http.client.HTTPConnection(*listener.server_address, timeout=10)
+    try:
+        conn.request('POST', '/', body=body, headers=headers)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def test_listener_multipart(listener):
+    """
+    Test that a multipart webhook request like the PMS sends it passes the
+    rating key of its item to the callback.
+    """
+    status = post(listener, multipart_body(new_payload()),
+                  {'Content-Type': MULTIPART_TYPE})
+
+    assert status == 200
+    assert listener.received == ['1001']
+
+
+def test_listener_json(listener):
+    """
+    Test that a JSON webhook request passes the rating key of its item to
+    the callback, and that other events are accepted but ignored.
+    """
+    status1 = post(listener, json.dumps(new_payload(rating_key='1002')),
+                   {'Content-Type': 'application/json'})
+    status2 = post(listener, json.dumps(new_payload(event='media.play')),
+                   {'Content-Type': 'application/json'})
+
+    assert (status1, status2) == (200, 200)
+    assert listener.received == ['1002']
+
+
+def test_listener_invalid(listener):
+    """
+    Test that a request without a valid payload is rejected with 400.
+    """
+    status = post(listener, b'{"event": "library.new"}',
+                  {'Content-Type': 'text/plain'})
+
+    assert status == 400
+    assert listener.received == []
+
+
+def test_listener_too_large(listener):
+    """
+    Test that a request that is larger than the maximum size is rejected
+    with 413, without reading its body.
+    """
+    conn = http.client.HTTPConnection(*listener.server_address, timeout=10)
+    try:
+        conn.putrequest('POST', '/')
+        conn.putheader('Content-Type', 'application/json')
+        conn.putheader('Content-Length', str(MAX_REQUEST_SIZE + 1))
+        conn.endheaders()
+        status = conn.getresponse().status
+    finally:
+        conn.close()
+
+    assert status == 413
+    assert listener.received == []